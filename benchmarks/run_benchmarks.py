@@ -0,0 +1,534 @@
+# Copyright (c) 2022 RWTH Aachen - Werkzeugmaschinenlabor (WZL)
+# Contact: Simon Cramer, s.cramer@wzl-mq.rwth-aachen.de
+
+"""Benchmarks the public functions of s3_smart_open.filehandler against the local filesystem and a local s3 emulator (moto server).
+
+Examples:
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --sizes 1KB,1MB,100MB,1GB,5GB --repeat 3 --output results.json
+    python benchmarks/run_benchmarks.py --baseline results.json --tolerance 0.2
+    python benchmarks/run_benchmarks.py --backend s3 --bucket my-bucket --cases "read_*"
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import shutil
+import fnmatch
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import urllib.request
+import numpy as np
+import pandas as pd
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_UNITS = {'B': 1, 'KB': 1024, 'MB': 1024**2, 'GB': 1024**3}
+_JSON_MAX_SIZE = 256*1024**2
+_TXT_MAX_SIZE = 1024**3
+_SMALL_FILE_SIZE = 16*1024
+
+
+def _parse_size(value):
+    """Parses a size like 1KB, 64MB or 5GB
+    Args:
+        value (str): Size with unit
+    Returns:
+        [int]: Size in bytes
+    """
+    value = value.strip().upper()
+    for unit in ('KB', 'MB', 'GB', 'B'):
+        if value.endswith(unit):
+            return int(float(value[:-len(unit)])*_UNITS[unit])
+    return int(value)
+
+def _format_size(size):
+    for unit in ('GB', 'MB', 'KB'):
+        if size >= _UNITS[unit] and size % _UNITS[unit] == 0:
+            return '{}{}'.format(size//_UNITS[unit], unit)
+    return '{}B'.format(size)
+
+def _rss():
+    """Returns the resident set size of this process in bytes
+    """
+    if psutil is not None:
+        return psutil.Process().memory_info().rss
+    try:
+        with open('/proc/self/statm') as infile:
+            return int(infile.read().split()[1])*os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss*1024
+
+
+class _PeakRSS:
+    """Samples the resident set size in a background thread while the with block runs
+    """
+
+    def __init__(self,interval=0.005):
+        self.interval = interval
+        self.start = 0
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, _rss())
+
+    def __enter__(self):
+        self.start = self.peak = _rss()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self,*args):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss())
+
+
+def _quantile(values,quantile):
+    values = sorted(values)
+    return values[min(int(quantile*len(values)), len(values)-1)]
+
+
+class _MotoServer:
+    """Runs moto server in a separate process, so its memory does not count for the peak RSS of the benchmarks
+    """
+
+    def __enter__(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            self.port = sock.getsockname()[1]
+        self.process = subprocess.Popen([sys.executable, '-m', 'moto.server', '-p', str(self.port)],
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.endpoint = 'http://127.0.0.1:{}'.format(self.port)
+        for attempt in range(200):
+            try:
+                urllib.request.urlopen(self.endpoint+'/moto-api/', timeout=1)
+                return self
+            except OSError:
+                if self.process.poll() is not None:
+                    raise RuntimeError('moto server could not be started. Install it with pip install "moto[server]"')
+                time.sleep(0.05)
+        raise RuntimeError('moto server did not start')
+
+    def __exit__(self,*args):
+        self.process.terminate()
+        self.process.wait()
+
+
+def _payload(name,size):
+    """Builds an object written by the benchmarks for a given serialized size
+    Args:
+        name (str): array (incompressible numpy array), compressible (numpy array of rounded measurements), dataframe, json or txt
+        size (int): Approximate serialized size in bytes
+    Returns:
+        The object
+    """
+    rng = np.random.default_rng(0)
+    if name == 'array':
+        return rng.random(max(size//8, 1))
+    if name == 'compressible':
+        return np.round(np.cumsum(rng.normal(size=max(size//8, 1))), 2)
+    if name == 'dataframe':
+        rows = max(size//32, 1)
+        return pd.DataFrame({column: rng.random(rows) for column in ('a', 'b', 'c', 'd')})
+    if name == 'json':
+        return {'values': np.round(rng.random(max(size//20, 1)), 12).tolist()}
+    if name == 'txt':
+        return 'x'*size
+    raise ValueError('Unknown payload {}!'.format(name))
+
+
+class _Payloads:
+    """Objects written by the benchmarks for one size. They are built on first use and released after every case,
+    so only the payload of the running case is kept in memory and counted for its peak RSS.
+    """
+
+    def __init__(self,size):
+        self.size = size
+        self._built = {}
+
+    def __contains__(self,name):
+        if name == 'json':
+            return self.size <= _JSON_MAX_SIZE
+        if name == 'txt':
+            return self.size <= _TXT_MAX_SIZE
+        return True
+
+    def __getitem__(self,name):
+        if name not in self._built:
+            self._built[name] = _payload(name, self.size)
+        return self._built[name]
+
+    def keep(self,name=None):
+        """Releases all payloads except one
+        Args:
+            name (str): Payload to keep, e.g. the one written by the measured function
+        """
+        for built in list(self._built):
+            if built != name:
+                del self._built[built]
+
+
+def _object_cases(fh,root,is_s3,sizes):
+    """Write and read cases of the single object functions for every size
+    """
+    cases = []
+    for size in sizes:
+        payloads = _Payloads(size)
+        path = root+'/objects_'+_format_size(size)
+        label = _format_size(size)
+
+        def _case(name, function, params=None, setup=None, prepare=None, size=size, stored=None, payload=None, payloads=payloads):
+            cases.append({'name': '{}[{}]'.format(name, label) if params is None else '{}[{},{}]'.format(name, label, params),
+                          'group': name, 'size': size, 'function': function, 'setup': setup, 'prepare': prepare, 'stored': stored,
+                          'payloads': payloads, 'payload': payload})
+
+        def _write_read(name, payload, write, read, params=None, stored=None):
+            _case('to_'+name, write, params, stored=stored, payload=payload)
+            _case('read_'+name, read, params, prepare=write)
+
+        _write_read('pckl', 'array', lambda: fh.to_pckl(path, 'a.pckl', payloads['array']), lambda: fh.read_pckl(path, 'a.pckl'))
+        _write_read('pckl', 'array', lambda: fh.to_pckl(path, 'a5.pckl', payloads['array'], protocol=5), lambda: fh.read_pckl(path, 'a5.pckl'), 'protocol=5')
+        for compression in ('zstd', 'lz4', 'gzip', None):
+            filename = 'c_{}.pckl'.format(compression)
+            _write_read('pckl', 'compressible', lambda filename=filename, compression=compression: fh.to_pckl(path, filename, payloads['compressible'], compression=compression, protocol=5),
+                        lambda filename=filename: fh.read_pckl(path, filename), compression or 'uncompressed',
+                        stored=lambda filename=filename: _stored_size(fh, path, filename))
+        _write_read('dill', 'array', lambda: fh.to_dill(path, 'a.dill', payloads['array']), lambda: fh.read_dill(path, 'a.dill'))
+        write_joblib = lambda: fh.to_joblib(path, 'a.joblib', payloads['array'])
+        _write_read('joblib', 'array', write_joblib, lambda: fh.read_joblib(path, 'a.joblib'))
+        write_fth = lambda: fh.to_pd_fth(path, 'a.fth', payloads['dataframe'])
+        _write_read('pd_fth', 'dataframe', write_fth, lambda: fh.read_pd_fth(path, 'a.fth'))
+        _case('read_pd_fth', lambda: fh.read_pd_fth(path, 'a.fth', columns=['b']), 'columns=1/4', prepare=write_fth, size=size//4)
+        _case('read_arrow_fth', lambda: fh.read_arrow_fth(path, 'a.fth'), prepare=write_fth)
+
+        def _chunks():
+            dataframe = payloads['dataframe']
+            chunk_rows = max(len(dataframe)//8, 1)
+            return (dataframe.iloc[start:start+chunk_rows] for start in range(0, len(dataframe), chunk_rows))
+
+        _case('to_pd_fth_chunks', lambda: fh.to_pd_fth_chunks(path, 'chunks.fth', _chunks()), 'chunks=8', payload='dataframe')
+        if 'json' in payloads:
+            _write_read('json', 'json', lambda: fh.to_json(path, 'a.json', payloads['json']), lambda: fh.read_json(path, 'a.json'))
+        if 'txt' in payloads:
+            _write_read('txt', 'txt', lambda: fh.to_txt(path, 'a.txt', payloads['txt']), lambda: fh.read_txt(path, 'a.txt'))
+        if is_s3:
+            # The same reads streamed with one request, to compare with the parallel ranged download
+            _case('read_joblib', _sequential(fh, lambda: fh.read_joblib(path, 'a.joblib')), 'sequential', prepare=write_joblib)
+            _case('read_pd_fth', _sequential(fh, lambda: fh.read_pd_fth(path, 'a.fth')), 'sequential', prepare=write_fth)
+            # Repeated writes of the same content only write the pointer
+            _write_read('joblib', 'array', lambda: fh.to_joblib(path, 'dedup.joblib', payloads['array'], dedup=True), lambda: fh.read_joblib(path, 'dedup.joblib'), 'dedup')
+            local = tempfile.mkdtemp(prefix='s3so_bench_')
+            local_file = os.path.join(local, 'upload.bin')
+            upload = lambda: fh.to_s3(path, 'upload.bin', local_file)
+            _case('to_s3', upload, prepare=lambda: _write_file(local_file, size))
+            _case('from_s3', lambda: fh.from_s3(path, 'upload.bin', local), prepare=lambda: (_write_file(local_file, size), upload()))
+    return cases
+
+def _sequential(fh,function):
+    """Wraps a read, so it runs with the parallel ranged download disabled
+    """
+    def _run():
+        fh.configure_parallel_reads(enabled=False)
+        try:
+            return function()
+        finally:
+            fh.configure_parallel_reads(enabled=True)
+    return _run
+
+def _stored_size(fh,path,filename):
+    """Returns the size of a written file or object
+    """
+    if path[:5] == 's3://':
+        bucket_name, prefix, s3_path = fh.generate_s3_strings(path)
+        return fh._get_s3_client().head_object(Bucket=bucket_name, Key=prefix+filename)['ContentLength']
+    return os.path.getsize(os.path.join(path, filename))
+
+def _write_file(path,size):
+    with open(path, 'wb') as outfile:
+        remaining = size
+        while remaining > 0:
+            block = os.urandom(min(remaining, 64*1024**2))
+            outfile.write(block)
+            remaining -= len(block)
+
+def _bulk_cases(fh,root,is_s3,file_counts,concurrency):
+    """Cases for many small files: bulk read/write, listings, existence checks, directory transfers and deletes
+    """
+    cases = []
+    data = np.random.default_rng(0).random(_SMALL_FILE_SIZE//8)
+
+    def _case(name, params, function, size, setup=None, prepare=None):
+        cases.append({'name': '{}[{}]'.format(name, params), 'group': name, 'size': size, 'function': function, 'setup': setup, 'prepare': prepare})
+
+    for count in file_counts:
+        path = root+'/bulk_{}'.format(count)
+        filenames = ['f{:06d}.pckl'.format(index) for index in range(count)]
+        items = {filename: data for filename in filenames}
+        total = count*_SMALL_FILE_SIZE
+        write = lambda path=path, items=items: fh.to_many(path, items)
+        for workers in concurrency:
+            params = 'files={},workers={}'.format(count, workers)
+            _case('to_many', params, lambda items=items, path=path, workers=workers: fh.to_many(path, items, max_workers=workers), total)
+            _case('read_many', params, lambda filenames=filenames, path=path, workers=workers: fh.read_many(path, filenames, max_workers=workers), total, prepare=write)
+        _case('get_filenames', 'files={}'.format(count), lambda path=path: fh.get_filenames(path), 0, prepare=write)
+        _case('get_filenames', 'files={},filenames'.format(count), lambda path=path, filenames=filenames: fh.get_filenames(path, filenames), 0, prepare=write)
+        if is_s3:
+            for method in ('head', 'list'):
+                _case('check_filenames', 'files={},method={}'.format(count, method),
+                      lambda path=path, filenames=filenames, method=method: fh.check_filenames(*_check_arguments(fh, path, filenames), method), 0, prepare=write)
+            _case('get_filenames', 'files={},use_index'.format(count), lambda path=path: fh.get_filenames(path, use_index=True), 0, prepare=write)
+            local = tempfile.mkdtemp(prefix='s3so_bench_')
+            source = os.path.join(local, 'source')
+
+            def _prepare(source=source, filenames=filenames):
+                if not os.path.isdir(source):
+                    os.makedirs(source)
+                    for filename in filenames:
+                        _write_file(os.path.join(source, filename), _SMALL_FILE_SIZE)
+
+            upload = lambda local=local, path=path: (_prepare(), fh.local_directory_to_s3(local, path, 'source', skip_unchanged=False))
+            for workers in concurrency:
+                params = 'files={},workers={}'.format(count, workers)
+                _case('local_directory_to_s3', params,
+                      lambda local=local, path=path, workers=workers: fh.local_directory_to_s3(local, path, 'source', max_workers=workers, skip_unchanged=False),
+                      total, prepare=_prepare)
+                _case('s3_directory_to_local', params,
+                      lambda local=local, path=path, workers=workers: fh.s3_directory_to_local(path, os.path.join(local, 'target'), 'source', max_workers=workers, skip_unchanged=False),
+                      total, prepare=upload)
+            _case('delete_s3_objects', 'files={}'.format(count), lambda path=path: fh.delete_s3_objects(path), 0, setup=write)
+    return cases
+
+def _check_arguments(fh,path,filenames):
+    bucket_name, prefix, s3_path = fh.generate_s3_strings(path)
+    return s3_path, filenames, prefix, bucket_name
+
+def _import_cases(root):
+    """Cold start cases: a new interpreter that imports the package and optionally reads a json file.
+    The startup of the interpreter alone is measured as reference.
+    """
+    package_directory = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    prefix = 'import sys; sys.path.insert(0, {!r}); '.format(package_directory)
+    json_path = os.path.join(root, 'import')
+
+    def _python(code):
+        return lambda: subprocess.run([sys.executable, '-c', prefix+code], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def _prepare():
+        from s3_smart_open import filehandler
+        filehandler.to_json(json_path, 'config.json', {'threshold': 0.5})
+
+    return [
+        {'name': 'import[python]', 'group': 'import', 'size': 0, 'setup': None, 'prepare': None, 'function': _python('pass')},
+        {'name': 'import[s3_smart_open]', 'group': 'import', 'size': 0, 'setup': None, 'prepare': None, 'function': _python('import s3_smart_open')},
+        {'name': 'import[s3_smart_open,read_json]', 'group': 'import', 'size': 0, 'setup': None, 'prepare': _prepare,
+         'function': _python('import s3_smart_open; s3_smart_open.read_json({!r}, "config.json")'.format(json_path))},
+    ]
+
+def _client_cases(fh,root,is_s3):
+    """Cases for the shared client and path helpers
+    """
+    cases = [{'name': 'generate_s3_strings', 'group': 'generate_s3_strings', 'size': 0, 'setup': None, 'prepare': None,
+              'function': lambda: [fh.generate_s3_strings('s3://bucket/some/prefix') for index in range(1000)]}]
+    if is_s3:
+        cases.append({'name': 'generate_s3_session', 'group': 'generate_s3_session', 'size': 0, 'setup': None, 'prepare': None,
+                      'function': lambda: [fh.generate_s3_session() for index in range(1000)]})
+        # Baseline without the shared pool: a new session and client per call, like before the pool.
+        # Fewer calls than the pooled case, a new client takes a few hundred milliseconds.
+        cases.append({'name': 'generate_s3_session[fresh_client,calls=20]', 'group': 'generate_s3_session', 'size': 0, 'setup': None, 'prepare': None,
+                      'function': lambda: [_fresh_client(fh) for index in range(20)]})
+        bucket_name = fh.generate_s3_strings(root)[0]
+        cases.append({'name': 'head_bucket[shared_client]', 'group': 'head_bucket', 'size': 0, 'setup': None, 'prepare': None,
+                      'function': lambda: [fh._get_s3_client().head_bucket(Bucket=bucket_name) for index in range(20)]})
+        cases.append({'name': 'head_bucket[fresh_client]', 'group': 'head_bucket', 'size': 0, 'setup': None, 'prepare': None,
+                      'function': lambda: [_fresh_client(fh).head_bucket(Bucket=bucket_name) for index in range(20)]})
+    return cases
+
+def _fresh_client(fh):
+    """Creates a new boto3 session and client for the configured endpoint without the shared pool
+    """
+    key = fh._s3_pool_key()
+    session, config = fh._new_s3_session(key)
+    return session.client('s3', endpoint_url=fh._endpoint_url(key[1]), config=config)
+
+def _run_case(case,repeat,warmup):
+    """Runs a case and measures its latencies and peak RSS
+    Args:
+        case (dict): Case with function, setup and size
+        repeat (int): Number of measured runs
+        warmup (int): Number of runs before the measurement
+    Returns:
+        [dict]: Result of the case
+    """
+    times = []
+    payloads = case.get('payloads')
+    try:
+        if case['prepare'] is not None:
+            case['prepare']()
+        if payloads is not None:
+            # Payloads only needed by prepare are released, the payload of the function is built before the measurement
+            payloads.keep(case['payload'])
+            if case['payload'] is not None:
+                payloads[case['payload']]
+        with _PeakRSS() as rss:
+            for index in range(warmup+repeat):
+                if case['setup'] is not None:
+                    case['setup']()
+                started = time.perf_counter()
+                case['function']()
+                elapsed = time.perf_counter() - started
+                if index >= warmup:
+                    times.append(elapsed)
+    finally:
+        if payloads is not None:
+            payloads.keep()
+    p50 = _quantile(times, 0.5)
+    return {
+        'name': case['name'],
+        'group': case['group'],
+        'bytes': case['size'],
+        'repeat': repeat,
+        'p50': p50,
+        'p99': _quantile(times, 0.99),
+        'mean': sum(times)/len(times),
+        'min': min(times),
+        'throughput': case['size']/p50 if case['size'] and p50 else None,
+        'peak_rss': rss.peak,
+        'rss_increase': rss.peak - rss.start,
+        'stored_bytes': case['stored']() if case.get('stored') else None,
+    }
+
+def compare(results,baseline,tolerance=0.2):
+    """Compares results with a baseline by the p50 latency
+    Args:
+        results (dict): Results of run_benchmarks
+        baseline (dict): Results of an earlier run
+        tolerance (float): Allowed relative slowdown
+    Returns:
+        [list[dict]]: Comparison per case with the ratio of the p50 latencies and if it is a regression
+    """
+    previous = {(result['backend'], result['name']): result for result in baseline['results']}
+    comparison = []
+    for result in results['results']:
+        base = previous.get((result['backend'], result['name']))
+        if base is None or not base['p50']:
+            continue
+        ratio = result['p50']/base['p50']
+        comparison.append({'backend': result['backend'], 'name': result['name'], 'p50': result['p50'], 'baseline_p50': base['p50'],
+                           'ratio': ratio, 'regression': ratio > 1+tolerance})
+    return comparison
+
+def run_benchmarks(backends=('local','moto'),sizes=(1024,1024**2,32*1024**2),file_counts=(10,100),concurrency=(1,8,32),
+                   repeat=5,warmup=1,cases=None,bucket='s3-smart-open-benchmark',verbose=True):
+    """Runs the benchmarks
+    Args:
+        backends (list[str]): "local", "moto" (moto server in a separate process) and/or "s3" (the configured s3 connection)
+        sizes (list[int]): Object sizes in bytes
+        file_counts (list[int]): Numbers of small files for the bulk functions
+        concurrency (list[int]): Numbers of worker threads for the bulk functions
+        repeat (int): Number of measured runs per case. Cases with objects of 1GB or more run once.
+        warmup (int): Number of runs before the measurement
+        cases (list[str]): Glob patterns of the case names to run. If not provided, all cases run.
+        bucket (str): Bucket for the s3 backends. It is created for moto.
+        verbose (bool): Print every result
+    Returns:
+        [dict]: meta data and results
+    """
+    from s3_smart_open import filehandler as fh
+    from s3_smart_open import settings
+    results = {'meta': {'python': sys.version.split()[0], 'platform': platform.platform(), 'cpus': os.cpu_count(),
+                        'time': time.strftime('%Y-%m-%dT%H:%M:%S'), 'sizes': list(sizes), 'file_counts': list(file_counts),
+                        'concurrency': list(concurrency), 'repeat': repeat},
+               'results': []}
+    for backend in backends:
+        server = None
+        local_root = None
+        explicit = settings._settings['explicit']
+        try:
+            if backend == 'local':
+                local_root = tempfile.mkdtemp(prefix='s3so_bench_')
+                root = local_root
+            elif backend in ('moto', 's3'):
+                if backend == 'moto':
+                    server = _MotoServer().__enter__()
+                    # Explicit settings take precedence over a s3config/config.yaml in the working directory
+                    settings.configure_s3(server.endpoint, 'benchmark', 'benchmark')
+                    fh._get_s3_client().create_bucket(Bucket=bucket)
+                root = 's3://{}/benchmark'.format(bucket)
+            else:
+                raise ValueError('Unknown backend {}! Use "local", "moto" or "s3".'.format(backend))
+            is_s3 = backend != 'local'
+            backend_cases = (_import_cases(root) if not is_s3 else []) + _client_cases(fh, root, is_s3) + _bulk_cases(fh, root, is_s3, file_counts, concurrency) + _object_cases(fh, root, is_s3, sizes)
+            for case in backend_cases:
+                if cases and not any(fnmatch.fnmatch(case['name'], pattern) for pattern in cases):
+                    continue
+                case_repeat = 1 if case['size'] >= 1024**3 else repeat
+                case_warmup = 0 if case['size'] >= 1024**3 else warmup
+                result = _run_case(case, case_repeat, case_warmup)
+                result['backend'] = backend
+                results['results'].append(result)
+                if verbose:
+                    throughput = '{:10.1f} MB/s'.format(result['throughput']/1024**2) if result['throughput'] else ' '*15
+                    print('{:6} {:60} p50 {:10.2f} ms  p99 {:10.2f} ms {}  peak RSS {:8.1f} MB'.format(
+                        backend, result['name'], result['p50']*1000, result['p99']*1000, throughput, result['peak_rss']/1024**2), flush=True)
+            if is_s3:
+                fh.delete_s3_objects(root)
+        finally:
+            if server is not None:
+                server.__exit__(None, None, None)
+            if local_root is not None:
+                shutil.rmtree(local_root, ignore_errors=True)
+            with settings._settings_lock:
+                settings._settings.update(explicit=explicit, resolved=None)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--backend', nargs='+', default=['local', 'moto'], choices=['local', 'moto', 's3'])
+    parser.add_argument('--sizes', default='1KB,1MB,32MB', help='Comma separated object sizes, e.g. 1KB,1MB,100MB,1GB,5GB')
+    parser.add_argument('--files', default='10,100', help='Comma separated numbers of small files for the bulk functions')
+    parser.add_argument('--concurrency', default='1,8,32', help='Comma separated numbers of worker threads for the bulk functions')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--warmup', type=int, default=1)
+    parser.add_argument('--cases', nargs='*', help='Glob patterns of the case names to run, e.g. "read_*" "*[1MB*"')
+    parser.add_argument('--bucket', default='s3-smart-open-benchmark')
+    parser.add_argument('--output', help='Write the results as json to this file')
+    parser.add_argument('--baseline', help='Compare the results with a json file of an earlier run')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed relative p50 slowdown compared to the baseline')
+    args = parser.parse_args(argv)
+    results = run_benchmarks(backends=args.backend,
+                             sizes=[_parse_size(size) for size in args.sizes.split(',')],
+                             file_counts=[int(count) for count in args.files.split(',')],
+                             concurrency=[int(workers) for workers in args.concurrency.split(',')],
+                             repeat=args.repeat, warmup=args.warmup, cases=args.cases, bucket=args.bucket)
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as infile:
+            comparison = compare(results, json.load(infile), args.tolerance)
+        results['comparison'] = comparison
+        for entry in comparison:
+            marker = 'REGRESSION' if entry['regression'] else ''
+            print('{:6} {:60} {:6.2f}x {}'.format(entry['backend'], entry['name'], entry['ratio'], marker))
+        regressions = [entry for entry in comparison if entry['regression']]
+        print('{} of {} cases slower than the baseline by more than {:.0%}'.format(len(regressions), len(comparison), args.tolerance))
+        exit_code = 1 if regressions else 0
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump(results, outfile, indent=1)
+    return exit_code
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,27 +1,19 @@
 # Copyright (c) 2022 RWTH Aachen - Werkzeugmaschinenlabor (WZL)
 # Contact: Simon Cramer, s.cramer@wzl-mq.rwth-aachen.de
 
-import yaml
-import os
 import logging
 
 
 logger = logging.getLogger(__name__)
 
+# The s3 connection is configured on first s3 access by settings.get_s3_settings from configure_s3,
+# s3config/config.yaml or the environment variables AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY and S3_ENDPOINT.
+# Heavy dependencies (boto3, smart_open, pandas, pyarrow, dill, joblib) are imported by the functions that use them.
 
-config_path=os.path.join('s3config','config.yaml')
-
-if os.path.exists(config_path):
-    with open(config_path,'r') as stream:
-        config = yaml.safe_load(stream)
-    os.environ['AWS_ACCESS_KEY_ID'] = config['AWS_ACCESS_KEY_ID']
-    os.environ['AWS_SECRET_ACCESS_KEY'] = config['AWS_SECRET_ACCESS_KEY']
-    os.environ['S3_ENDPOINT'] = config['S3_ENDPOINT']
-else:
-    if not ('AWS_ACCESS_KEY_ID' and 'AWS_SECRET_ACCESS_KEY' and 'S3_ENDPOINT') in os.environ:
-        logger.warning('S3 connection could not be configured. No config file was found. Filehandler will only work for local files!')
-        os.environ['AWS_ACCESS_KEY_ID'] = ""
-        os.environ['AWS_SECRET_ACCESS_KEY'] = ""
-        os.environ['S3_ENDPOINT'] = "s3"
-
+from .settings import configure_s3, get_s3_settings, reset_s3_settings
 from .filehandler import *
+from .dataset import to_dataset, read_dataset
+from .listing import ListingIndex, get_listing_index, list_s3_objects
+from .transfer import resumable_download, resumable_upload, abort_resumable_upload
+from .dedup import configure_dedup, collect_garbage
+from .metrics import enable_metrics, disable_metrics, metrics_summary, add_recorder, remove_recorder, start_prometheus_server, MetricsAggregator
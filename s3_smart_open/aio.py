@@ -0,0 +1,629 @@
+# Copyright (c) 2022 RWTH Aachen - Werkzeugmaschinenlabor (WZL)
+# Contact: Simon Cramer, s.cramer@wzl-mq.rwth-aachen.de
+
+import os
+import io
+import shutil
+import asyncio
+import tempfile
+import logging
+import weakref
+import functools
+import contextlib
+import concurrent.futures
+from . import filehandler
+from . import serialization
+from . import dedup
+from .lazy import lazy_import, optional_import
+from .settings import get_s3_settings
+from .filehandler import generate_s3_strings, _endpoint_url, _is_not_found, _batches, _transfer_settings, _DELETE_BATCH_SIZE
+
+dill = lazy_import('dill')
+joblib = lazy_import('joblib')
+pd = lazy_import('pandas')
+pyarrow = lazy_import('pyarrow', 'pyarrow.feather')
+botocore = lazy_import('botocore', 'botocore.exceptions')
+aiobotocore = optional_import('aiobotocore', 'aiobotocore.session', 'aiobotocore.config')
+
+logger = logging.getLogger(__name__)
+
+_DOWNLOAD_CHUNK_SIZE = 1024*1024
+
+_aio_settings = {
+    'max_concurrency': 64,
+    'max_pool_connections': 64,
+    'executor_workers': None,
+}
+_aio_pools = weakref.WeakKeyDictionary()
+_aio_locks = weakref.WeakKeyDictionary()
+_aio_executor = {'pid': None, 'executor': None}
+
+def configure_aio(max_concurrency=None,max_pool_connections=None,executor_workers=None):
+    """Changes the settings of the async functions. Clients that were created before are rebuilt on next use.
+    Args:
+        max_concurrency (int): Maximum number of s3 requests in flight per event loop
+        max_pool_connections (int): Maximum number of open connections of the async client
+        executor_workers (int): Number of threads for (de)serialization and local file access
+    """
+    updates = {
+        'max_concurrency': max_concurrency,
+        'max_pool_connections': max_pool_connections,
+        'executor_workers': executor_workers,
+    }
+    for name, value in updates.items():
+        if value is not None:
+            _aio_settings[name] = value
+    if executor_workers is not None:
+        _aio_executor['pid'] = None
+
+def _get_executor():
+    """Returns the thread pool for blocking work, rebuilt after a fork
+    Returns:
+        concurrent.futures.ThreadPoolExecutor
+    """
+    if _aio_executor['pid'] != os.getpid():
+        _aio_executor['executor'] = concurrent.futures.ThreadPoolExecutor(max_workers=_aio_settings['executor_workers'],thread_name_prefix='s3-aio')
+        _aio_executor['pid'] = os.getpid()
+    return _aio_executor['executor']
+
+async def _run_blocking(function,*args,**kwargs):
+    """Runs a blocking function in the thread pool
+    Args:
+        function (callable): Function to run
+    Returns:
+        Return value of the function
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(),functools.partial(function,*args,**kwargs))
+
+async def _get_pool():
+    """Returns the pool of the running event loop with the aiobotocore s3 client and the concurrency limiter.
+    The client is created once per event loop and rebuilt after a fork, changed credentials or changed settings.
+    Concurrent cold starts wait for the same client. A replaced client is closed when its last call finished.
+    Returns:
+        [dict]: Pool with client, limit and the number of running calls
+    """
+    if aiobotocore is None:
+        raise ImportError('aiobotocore is required for async s3 access. Install it with pip install aiobotocore')
+    loop = asyncio.get_running_loop()
+    key = (os.getpid(),
+           *get_s3_settings()[:3],
+           tuple(sorted(_aio_settings.items())),
+           tuple(sorted(filehandler._s3_pool_settings.items())))
+    pool = _aio_pools.get(loop)
+    if pool is not None and pool['key'] == key:
+        return pool
+    lock = _aio_locks.get(loop)
+    if lock is None:
+        lock = _aio_locks[loop] = asyncio.Lock()
+    async with lock:
+        pool = _aio_pools.get(loop)
+        if pool is not None and pool['key'] == key:
+            return pool
+        if pool is not None:
+            del _aio_pools[loop]
+            await _retire(pool)
+        settings = filehandler._s3_pool_settings
+        config = aiobotocore.config.AioConfig(max_pool_connections=_aio_settings['max_pool_connections'],
+                           retries={'max_attempts': settings['max_attempts'], 'mode': settings['retry_mode']},
+                           connect_timeout=settings['connect_timeout'],
+                           read_timeout=settings['read_timeout'],
+                           )
+        context = aiobotocore.session.get_session().create_client('s3',
+                                              endpoint_url=_endpoint_url(key[1]),
+                                              aws_access_key_id=key[2],
+                                              aws_secret_access_key=key[3],
+                                              config=config,
+                                              )
+        pool = {'key': key, 'context': context, 'client': await context.__aenter__(),
+                'limit': asyncio.Semaphore(_aio_settings['max_concurrency']), 'calls': 0, 'retired': False}
+        _aio_pools[loop] = pool
+    return pool
+
+async def _retire(pool):
+    """Closes the client of a pool that is no longer used for new calls. If calls are still running, the last one closes it.
+    Args:
+        pool (dict): Pool from _get_pool
+    """
+    pool['retired'] = True
+    if pool['calls'] == 0:
+        await pool['context'].__aexit__(None, None, None)
+
+@contextlib.asynccontextmanager
+async def _client():
+    """Uses the s3 client of the running event loop. The client is not closed while the block runs, even if it is replaced.
+    Yields:
+        aiobotocore Client and asyncio.Semaphore
+    """
+    pool = await _get_pool()
+    pool['calls'] += 1
+    try:
+        yield pool['client'], pool['limit']
+    finally:
+        pool['calls'] -= 1
+        if pool['retired'] and pool['calls'] == 0:
+            await pool['context'].__aexit__(None, None, None)
+
+async def close():
+    """Closes the async s3 client of the running event loop. Call it before the event loop is closed.
+    Calls that are still running finish with the client, which is closed after the last of them.
+    """
+    pool = _aio_pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await _retire(pool)
+
+def _s3_key(path,filename):
+    """Splits a s3 path and a filename into bucket name and key
+    Args:
+        path (str): s3://BUCKETNAME/KEY
+        filename (str): Filename of the object
+    Returns:
+        strings: bucket_name, key
+    """
+    bucket_name, prefix, path = generate_s3_strings(path)
+    return bucket_name, prefix+filename
+
+async def get_filenames(input_path,filenames_list=None,file_types=None):
+    """Looking for files in a given path. Checks files if a list of filenames is given
+    Args:
+        input_path (str): Path where to look for files
+        filenames_list (list[str]): Filenames to check if they exists
+        file_types (list[str]): File types to be filtered e.g. ".fth" , ".pckl"
+    Returns:
+        [list[str]]: List of filenames
+    """
+    if input_path[:5] != 's3://':
+        return await _run_blocking(filehandler.get_filenames,input_path,filenames_list,file_types)
+    if type(filenames_list)==str:
+        filenames_list=[filenames_list]
+    bucket_name, prefix, path = generate_s3_strings(input_path)
+    async with _client() as (s3c, limit):
+        if filenames_list:
+            async def _exists(filename):
+                async with limit:
+                    try:
+                        await s3c.head_object(Bucket=bucket_name, Key=prefix+filename)
+                    except botocore.exceptions.ClientError as e:
+                        if e.response['Error']['Code'] == "404":
+                            logger.warning("{}{}".format(filename,' does not exsist!'))
+                            return False
+                return True
+            exists = await asyncio.gather(*[_exists(filename) for filename in filenames_list])
+            filenames = [filename for filename, found in zip(filenames_list, exists) if found]
+        else:
+            filenames = []
+            paginator = s3c.get_paginator('list_objects_v2')
+            async for page in paginator.paginate(Bucket=bucket_name,Prefix=prefix):
+                for obj in page.get('Contents', []):
+                    filename = obj['Key'][obj['Key'].rfind('/')+1:]
+                    if not filename == '':
+                        filenames.append(filename)
+    if file_types:
+        file_types = set([file_types] if type(file_types)==str else file_types)
+        filenames = [filename for filename in filenames if filename[filename.rfind('.'):] in file_types]
+    logger.info('{}{}'.format('Returning filenames: ',filenames))
+    return filenames
+
+async def _read_bytes(input_path,filename):
+    """Reads the content of a file
+    Args:
+        input_path (str): Path to the file to read
+        filename (str): Filename of the file to read
+    Raises:
+        ValueError: When file or filepath do not exsist
+    Returns:
+        [bytes]: Content of the file
+    """
+    logger.info('----Download started: {} ----'.format(filename))
+    try:
+        if input_path[:5] == 's3://':
+            bucket_name, key = _s3_key(input_path,filename)
+            async with _client() as (s3c, limit):
+                async with limit:
+                    response = await s3c.get_object(Bucket=bucket_name, Key=key)
+                    async with response['Body'] as stream:
+                        data = await stream.read()
+        else:
+            data = await _run_blocking(_read_local,os.path.join(input_path,filename))
+    except Exception as e:
+        if _is_not_found(e):
+            raise ValueError('Input path or filename does not exist!') from e
+        raise
+    logger.info('----Download finished: {} ----'.format(filename))
+    return data
+
+async def _read_object_bytes(input_path,filename):
+    """Reads the content of a file written by to_pckl, to_dill or to_joblib. Pointers written with dedup=True are resolved to their blob.
+    Args:
+        input_path (str): Path to the file to read
+        filename (str): Filename of the file to read
+    Returns:
+        [bytes]: Content of the file or of the blob it points to
+    """
+    data = await _read_bytes(input_path,filename)
+    pointer = dedup.parse_pointer(data)
+    if pointer is not None:
+        data = await _read_bytes(*dedup.split_blob_path(pointer))
+    return data
+
+def _read_local(path):
+    with open(path, 'rb') as infile:
+        return infile.read()
+
+def _read_range(path,start,length):
+    with open(path, 'rb') as infile:
+        infile.seek(start)
+        return infile.read(length)
+
+def _write_local(path,data):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'wb') as outfile:
+        outfile.write(data)
+
+def _copy_local(source,destination):
+    os.makedirs(os.path.dirname(destination) or '.', exist_ok=True)
+    shutil.copyfile(source, destination)
+
+def _open_temp(path):
+    """Opens a temp file next to a file, so the finished download can replace the file atomically
+    Args:
+        path (str): Path of the file
+    Returns:
+        File object opened for binary writing and the path of the temp file
+    """
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    handle, tmp_path = tempfile.mkstemp(dir=directory, prefix='.'+os.path.basename(path), suffix='.tmp')
+    return os.fdopen(handle, 'wb'), tmp_path
+
+async def _write_bytes(output_path,filename,data):
+    """Writes bytes to a file. Large s3 objects are uploaded with concurrent multipart requests.
+    Args:
+        output_path (str): Path to the file to write.
+        filename (str): Filename of the file to write.
+        data (bytes): Content of the file
+    """
+    logger.info('----Upload started: {} ----'.format(filename))
+    if output_path[:5] != 's3://':
+        await _run_blocking(_write_local,os.path.join(output_path,filename),data)
+    else:
+        bucket_name, key = _s3_key(output_path,filename)
+        async with _client() as (s3c, limit):
+            if len(data) <= _transfer_settings['multipart_threshold']:
+                async with limit:
+                    await s3c.put_object(Bucket=bucket_name, Key=key, Body=data)
+            else:
+                view = memoryview(data)
+
+                async def _read_part(start, length):
+                    return bytes(view[start:start+length])
+
+                await _multipart_upload(s3c,limit,bucket_name,key,len(data),_read_part)
+    logger.info('----Upload finished: {} ----'.format(filename))
+
+async def _multipart_upload(s3c,limit,bucket_name,key,size,read_part):
+    """Uploads an object in concurrent parts of multipart_chunksize. At most max_concurrency parts of configure_transfer
+    are read and uploaded at the same time, so only these parts are held in memory.
+    Args:
+        s3c (aiobotocore Client): Client used for the requests
+        limit (asyncio.Semaphore): Concurrency limiter
+        bucket_name (str): Name of the bucket
+        key (str): Key of the object
+        size (int): Size of the object in bytes
+        read_part (coroutine function): Returns the content of a part, takes (start, length)
+    """
+    chunksize = _transfer_settings['multipart_chunksize']
+    parts_limit = asyncio.Semaphore(_transfer_settings['max_concurrency'])
+    async with limit:
+        upload = await s3c.create_multipart_upload(Bucket=bucket_name, Key=key)
+    async def _part(number, start):
+        async with parts_limit:
+            body = await read_part(start, min(chunksize, size-start))
+            async with limit:
+                response = await s3c.upload_part(Bucket=bucket_name, Key=key, UploadId=upload['UploadId'],
+                                                 PartNumber=number, Body=body)
+        return {'PartNumber': number, 'ETag': response['ETag']}
+    try:
+        parts = await asyncio.gather(*[_part(number+1, start) for number, start in enumerate(range(0, size, chunksize))])
+        async with limit:
+            await s3c.complete_multipart_upload(Bucket=bucket_name, Key=key, UploadId=upload['UploadId'], MultipartUpload={'Parts': parts})
+    except BaseException:
+        async with limit:
+            await s3c.abort_multipart_upload(Bucket=bucket_name, Key=key, UploadId=upload['UploadId'])
+        raise
+
+def _load_feather(data,columns,filename):
+    pandas_file = pd.read_feather(io.BytesIO(data),columns)
+    if 'index' in pandas_file.columns:
+        pandas_file.drop(columns=['index'], inplace=True)
+        logger.info('Dropped column index on import from file {}. If this is unintentional rename column in file.'.format(filename))
+    return pandas_file
+
+def _dump_feather(dataframe):
+    outfile = io.BytesIO()
+    pyarrow.feather.write_feather(pyarrow.Table.from_pandas(dataframe,preserve_index=False),outfile)
+    return outfile.getvalue()
+
+def _dump(dump,data,compression=None):
+    outfile = io.BytesIO()
+    with serialization.compressed_writer(outfile,compression) as stream:
+        dump(data,stream)
+    return outfile.getvalue()
+
+def _load(load,data):
+    return load(serialization.decompressed_reader(io.BytesIO(data))[0])
+
+def _write_json(data,stream):
+    stream.write(serialization.dumps_json(data))
+
+async def read_pd_fth(input_path,filename,columns=None,col_limit=None):
+    """Reads feather file from path and returns a pandas dataframe
+    Args:
+        input_path (str): Path to the file to read
+        filename (str): Filename of the file to read
+        columns (list[str]): If not provided, all columns are read.
+        col_limit (int): Use col_limit to check if the amount of columns is not higher than col_limit!
+    Returns:
+        [pandas.DataFrame]: Pandas Dataframe
+    """
+    if columns and type(columns) != list:
+        columns = [columns]
+    data = await _read_bytes(input_path,filename)
+    pandas_file = await _run_blocking(_load_feather,data,columns,filename)
+    if col_limit:
+        assert pandas_file.shape[1] <= int(col_limit), 'Amount of columns is higher than the provided limit of columns. Use col_limit when only a specified amount of columns is allowed for further execution!'
+    return pandas_file
+
+async def read_pckl(input_path,filename):
+    """Reads pickle file from path and returns the pickled object
+    Args:
+        input_path (str): Path to the file to read
+        filename (str): Filename of the file to read
+    Returns:
+        Can be everything that is pickleable
+    """
+    return await _run_blocking(serialization.load_pickle,io.BytesIO(await _read_object_bytes(input_path,filename)))
+
+async def read_dill(input_path,filename):
+    """Reads dill file from path and returns the serialized object
+    Args:
+        input_path (str): Path to the file to read
+        filename (str): Filename of the file to read
+    Returns:
+        Can be everything that can be serialized with dill
+    """
+    return await _run_blocking(serialization.load_pickle,io.BytesIO(await _read_object_bytes(input_path,filename)),dill.loads,dill.load)
+
+async def read_joblib(input_path,filename):
+    """Reads joblib file from path and returns the joblib object
+    Args:
+        input_path (str): Path to the file to read
+        filename (str): Filename of the file to read
+    Returns:
+        Can be everything that is pickleable.
+    """
+    return await _run_blocking(_load,joblib.load,await _read_object_bytes(input_path,filename))
+
+async def read_json(input_path,filename):
+    """Reads json file from path and returns json content
+    Args:
+        input_path (str): Path to the file to read
+        filename (str): Filename of the file to read
+    Returns:
+        Json content
+    """
+    return await _run_blocking(_load,lambda infile: serialization.loads_json(infile.read()),await _read_bytes(input_path,filename))
+
+async def read_txt(input_path,filename):
+    """Reads a txt file.
+    Args:
+        input_path (str): Path to the file to read
+        filename (str): Filename of the file to read
+    Raises:
+        ValueError: When file or filepath do not exsist
+    Returns:
+        [str]: txt file content
+    """
+    return (await _read_bytes(input_path,filename)).decode('utf-8')
+
+async def to_pd_fth(output_path,filename,dataframe):
+    """Writes a pandas Dataframe to a given path as feather file.
+    Args:
+        output_path (str): Path to the file to write.
+        filename (str): Filename of the file to write.
+        dataframe (pandas.Datarame): Pandas Dataframe which should be saved as .fth.
+    """
+    await _write_bytes(output_path,filename,await _run_blocking(_dump_feather,dataframe))
+
+async def to_pckl(output_path,filename,data,compression=None,protocol=None):
+    """Writes an object to a given path as pickle file.
+    Args:
+        output_path (str): Path to the file to write.
+        filename (str): Filename of the file to write.
+        data (anything): Could be anything that is pickleable.
+        compression (str): Compress the file with "zstd", "lz4" or "gzip". Readers detect the compression automatically.
+        protocol (int): Pickle protocol. With protocol 5 large buffers like NumPy arrays are written out-of-band.
+    """
+    await _write_bytes(output_path,filename,await _run_blocking(_dump,functools.partial(serialization.dump_pickle,protocol=protocol),data,compression))
+
+async def to_dill(output_path,filename,data,compression=None):
+    """Writes an object to a given path as dill file.
+    Args:
+        output_path (str): Path to the file to write.
+        filename (str): Filename of the file to write.
+        data (anything): Could be anything that can be serialized with dill.
+        compression (str): Compress the file with "zstd", "lz4" or "gzip". Readers detect the compression automatically.
+    """
+    await _write_bytes(output_path,filename,await _run_blocking(_dump,dill.dump,data,compression))
+
+async def to_joblib(output_path,filename,data,compression=None):
+    """Writes an object to a given path as joblib file.
+    Args:
+        output_path (str): Path to the file to write.
+        filename (str): Filename of the file to write.
+        data (anything): Could be anything that is pickleable.
+        compression (str): Compress the file with "zstd", "lz4" or "gzip". Readers detect the compression automatically.
+    """
+    await _write_bytes(output_path,filename,await _run_blocking(_dump,joblib.dump,data,compression))
+
+async def to_json(output_path,filename,data,compression=None):
+    """Writes an object as json file. Uses orjson for encoding if it is installed.
+    Args:
+        output_path (str): Path to the file to write.
+        filename (str): Filename of the file to write.
+        data (anything): Object that can be serialized as json
+        compression (str): Compress the file with "zstd", "lz4" or "gzip". Readers detect the compression automatically.
+    """
+    await _write_bytes(output_path,filename,await _run_blocking(_dump,_write_json,data,compression))
+
+async def to_txt(output_path,filename,data):
+    """Writes a string as txt file
+    Args:
+        output_path (str): Path to the file to write.
+        filename (str): Filename of the file to write.
+        data (str): string that will be written
+    """
+    await _write_bytes(output_path,filename,data.encode('utf-8'))
+
+async def to_s3(output_path,filename,data):
+    """Uploads a local file to s3 storage.
+    Args:
+        output_path (str): Path to s3 storage
+        filename (str): The object will be save with this filename
+        data (str): Path to the local file that will be uploaded
+    """
+    try:
+        await _upload_file(output_path,filename,data)
+    except (botocore.exceptions.ClientError, OSError) as e:
+        logger.error(e)
+
+async def _upload_file(output_path,filename,local_path):
+    """Uploads a local file. Large files are read and uploaded part by part instead of being read into memory.
+    Args:
+        output_path (str): Path to s3 storage
+        filename (str): The object will be save with this filename
+        local_path (str): Path to the local file
+    """
+    if output_path[:5] != 's3://':
+        logger.info('----Upload started: {} ----'.format(filename))
+        await _run_blocking(_copy_local,local_path,os.path.join(output_path,filename))
+        logger.info('----Upload finished: {} ----'.format(filename))
+        return
+    size = await _run_blocking(os.path.getsize,local_path)
+    if size <= _transfer_settings['multipart_threshold']:
+        await _write_bytes(output_path,filename,await _run_blocking(_read_local,local_path))
+        return
+    logger.info('----Upload started: {} ----'.format(filename))
+    bucket_name, key = _s3_key(output_path,filename)
+
+    async def _read_part(start, length):
+        return await _run_blocking(_read_range,local_path,start,length)
+
+    async with _client() as (s3c, limit):
+        await _multipart_upload(s3c,limit,bucket_name,key,size,_read_part)
+    logger.info('----Upload finished: {} ----'.format(filename))
+
+async def _download_file(input_path,filename,local_path):
+    """Downloads a file to local disk. The body is written in chunks to a temp file, which replaces local_path when the download is complete.
+    Args:
+        input_path (str): Path to the file to read
+        filename (str): Filename of the file to read
+        local_path (str): Path of the downloaded file
+    Raises:
+        ValueError: When file or filepath do not exsist
+    """
+    if input_path[:5] != 's3://':
+        if not os.path.isfile(os.path.join(input_path,filename)):
+            raise ValueError('Input path or filename does not exist!')
+        await _run_blocking(_copy_local,os.path.join(input_path,filename),local_path)
+        return
+    logger.info('----Download started: {} ----'.format(filename))
+    bucket_name, key = _s3_key(input_path,filename)
+    outfile, tmp_path = await _run_blocking(_open_temp,local_path)
+    try:
+        async with _client() as (s3c, limit):
+            async with limit:
+                response = await s3c.get_object(Bucket=bucket_name, Key=key)
+                async with response['Body'] as stream:
+                    while True:
+                        chunk = await stream.read(_DOWNLOAD_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        await _run_blocking(outfile.write,chunk)
+        await _run_blocking(outfile.close)
+        await _run_blocking(os.replace,tmp_path,local_path)
+    except BaseException as e:
+        outfile.close()
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        if isinstance(e, Exception) and _is_not_found(e):
+            raise ValueError('Input path or filename does not exist!') from e
+        raise
+    logger.info('----Download finished: {} ----'.format(filename))
+
+async def from_s3(input_path,filename,output_path=None):
+    """Downloads a given object from s3 storage to local disk
+    Args:
+        input_path (str): Path to s3 storage, ! without filename !
+        filename (str): Name of the Object in the s3 storage.
+        output_path (str): Path where object will be saved on local disk
+    """
+    try:
+        await _download_file(input_path,filename,os.path.join(output_path or '',filename))
+    except (botocore.exceptions.ClientError, ValueError) as e:
+        logger.error(e)
+
+async def delete_s3_objects(path,filenames=None,file_types=None):
+    """Delete a folder or objects inside a folder/bucket+key(s3) and optional in combination with given filenames and file types.
+    Args:
+        path (str): s3 path (s3://bucketname/key)
+        filenames=None (list[str]): List of filenames that will be delete. When no filenames are given all files inside the the folder/key will be deleted.
+        file_types=None (list[str]): When file type is not none only files with the given file types will be deleted.
+    Returns:
+        [dict]: Summary with the list of deleted keys or paths and the failed keys or paths mapped to the reason
+    """
+    if path[:5] != 's3://':
+        return await _run_blocking(filehandler.delete_s3_objects,path,filenames,file_types)
+    if type(filenames)==str:
+        filenames=[filenames]
+    if type(file_types)==str:
+        file_types=[file_types]
+    filenames = set(filenames) if filenames else None
+    file_types = set(file_types) if file_types else None
+    bucket_name, main_prefix, tmp_path = generate_s3_strings(path)
+    async with _client() as (s3c, limit):
+        keys = []
+        paginator = s3c.get_paginator('list_objects_v2')
+        async for page in paginator.paginate(Bucket=bucket_name,Prefix=main_prefix):
+            for obj in page.get('Contents', []):
+                filename = obj['Key'][obj['Key'].rfind('/')+1:]
+                if filename == '' and (filenames or file_types):
+                    continue
+                if filenames and filename not in filenames:
+                    continue
+                if file_types and filename[filename.rfind('.'):] not in file_types:
+                    continue
+                keys.append(obj['Key'])
+
+        async def _delete(batch):
+            async with limit:
+                response = await s3c.delete_objects(Bucket=bucket_name,Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True})
+            return {error['Key']: error.get('Message', error.get('Code')) for error in response.get('Errors', [])}
+
+        batches = list(_batches(keys,_DELETE_BATCH_SIZE))
+        results = await asyncio.gather(*[_delete(batch) for batch in batches], return_exceptions=True)
+    summary = {'deleted': [], 'failed': {}}
+    for index, (batch, failed) in enumerate(zip(batches, results)):
+        if isinstance(failed, BaseException):
+            if not isinstance(failed, Exception):
+                raise failed
+            logger.warning("Failed to delete batch {} ; Reason {}".format(index,failed))
+            summary['failed']['batch {}'.format(index)] = failed
+            continue
+        for key, reason in failed.items():
+            logger.warning("Failed to delete : {} ; Reason {}".format(key,reason))
+        summary['failed'].update(failed)
+        summary['deleted'].extend(key for key in batch if key not in failed)
+    from .listing import _discard
+    await _run_blocking(_discard,bucket_name,summary['deleted'])
+    return summary
@@ -0,0 +1,227 @@
+# Copyright (c) 2022 RWTH Aachen - Werkzeugmaschinenlabor (WZL)
+# Contact: Simon Cramer, s.cramer@wzl-mq.rwth-aachen.de
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+import contextlib
+from . import metrics
+from .lazy import lazy_import
+
+botocore = lazy_import('botocore', 'botocore.exceptions')
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_cache_settings = {
+    'directory': None,
+    'max_bytes': 10*1024**3,
+}
+_cache_lock = threading.Lock()
+_evict_lock = threading.Lock()
+_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'bytes_downloaded': 0, 'bytes_served': 0}
+_OPEN_ATTEMPTS = 3
+
+def configure_cache(directory=None,max_bytes=None):
+    """Enables the local disk cache for s3 reads. The cache directory can be shared by several processes on one node.
+    Args:
+        directory (str): Directory of the cache. Defaults to s3_smart_open_cache in the temp directory.
+        max_bytes (int): Maximum size of the cached objects. Least recently used objects are evicted above this size.
+    """
+    if directory is None:
+        directory = os.path.join(tempfile.gettempdir(), 's3_smart_open_cache')
+    for sub_directory in ('blobs', 'index', 'tmp'):
+        os.makedirs(os.path.join(directory, sub_directory), exist_ok=True)
+    with _cache_lock:
+        _cache_settings['directory'] = directory
+        if max_bytes is not None:
+            _cache_settings['max_bytes'] = max_bytes
+    logger.info('s3 read cache enabled in {}'.format(directory))
+
+def disable_cache():
+    """Disables the local disk cache. Cached files are kept.
+    """
+    with _cache_lock:
+        _cache_settings['directory'] = None
+
+def cache_enabled():
+    """Checks if the local disk cache is enabled
+    Returns:
+        [bool]: True if s3 reads go through the cache
+    """
+    return _cache_settings['directory'] is not None
+
+def cache_stats():
+    """Returns the statistics of the cache in this process
+    Returns:
+        [dict]: hits, misses, evictions, bytes_downloaded, bytes_served and the hit_rate
+    """
+    with _cache_lock:
+        stats = dict(_cache_stats)
+    requests = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits']/requests if requests else 0.0
+    return stats
+
+def clear_cache():
+    """Deletes all cached objects
+    """
+    directory = _cache_settings['directory']
+    if directory is None:
+        return
+    for sub_directory in ('blobs', 'index'):
+        shutil.rmtree(os.path.join(directory, sub_directory), ignore_errors=True)
+        os.makedirs(os.path.join(directory, sub_directory), exist_ok=True)
+
+def _count(name,value=1):
+    with _cache_lock:
+        _cache_stats[name] += value
+
+def _digest(*parts):
+    return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()
+
+def _blobs():
+    """Lists the cached objects
+    Returns:
+        [list[tuple]]: Path, last access time and size of every cached object
+    """
+    blobs = []
+    blob_directory = os.path.join(_cache_settings['directory'], 'blobs')
+    for entry in os.scandir(blob_directory):
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        blobs.append((entry.path, stat.st_mtime, stat.st_size))
+    return blobs
+
+def _atomic_write(path,write):
+    """Writes a file through a temporary file in the cache, so other processes never see a partial file
+    Args:
+        path (str): Final path of the file
+        write (callable): Gets the open temporary file and writes the content
+    """
+    handle, tmp_path = tempfile.mkstemp(dir=os.path.join(_cache_settings['directory'], 'tmp'))
+    try:
+        with os.fdopen(handle, 'wb') as outfile:
+            write(outfile)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+@contextlib.contextmanager
+def _eviction_lock():
+    """Serializes evictions of all processes that share the cache directory with a lock file.
+    Without fcntl (e.g. on Windows) only the threads of this process are serialized and concurrent evictions tolerate files that are already deleted.
+    """
+    with _evict_lock:
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(_cache_settings['directory'], 'lock'), 'a') as lockfile:
+            fcntl.flock(lockfile, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lockfile, fcntl.LOCK_UN)
+
+def _evict(keep=None):
+    """Deletes least recently used objects until the cache is below max_bytes. Objects opened by readers stay readable until they are closed.
+    The size of the cache is computed from the directory, so objects downloaded by other processes are counted as well.
+    Args:
+        keep (str): Path of an object that must not be evicted, e.g. the object that was just downloaded
+    """
+    with _eviction_lock():
+        blobs = sorted(_blobs(), key=lambda blob: blob[1])
+        total = sum(size for path, mtime, size in blobs)
+        for path, mtime, size in blobs:
+            if total <= _cache_settings['max_bytes']:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+                _count('evictions')
+            except FileNotFoundError:
+                pass
+            total -= size
+
+def cached_path(s3c,bucket_name,key):
+    """Returns the path of a local copy of a s3 object.
+    A cached copy is validated with a conditional GET (If-None-Match with the cached ETag), which returns no body if the object did not change.
+    Otherwise the object is downloaded into the cache, keyed by bucket, key and ETag.
+    Args:
+        s3c (boto3 Client): Client used for the requests
+        bucket_name (str): Name of the bucket
+        key (str): Key of the object
+    Raises:
+        botocore.exceptions.ClientError: When the object cannot be read, e.g. NoSuchKey
+    Returns:
+        [str]: Path to the cached file
+    """
+    index_path = os.path.join(_cache_settings['directory'], 'index', _digest(bucket_name, key))
+    etag = None
+    try:
+        with open(index_path, 'r') as infile:
+            etag = json.load(infile)['etag']
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
+    blob_path = os.path.join(_cache_settings['directory'], 'blobs', _digest(bucket_name, key, etag)) if etag else None
+    try:
+        if blob_path and os.path.exists(blob_path):
+            response = s3c.get_object(Bucket=bucket_name, Key=key, IfNoneMatch=etag)
+        else:
+            response = s3c.get_object(Bucket=bucket_name, Key=key)
+    except botocore.exceptions.ClientError as e:
+        if e.response['Error']['Code'] in ('304', 'NotModified'):
+            now = time.time()
+            try:
+                os.utime(blob_path, (now, now))
+                _count('hits')
+                metrics.count(cache_hits=1)
+                _count('bytes_served', os.path.getsize(blob_path))
+                return blob_path
+            except FileNotFoundError:
+                response = s3c.get_object(Bucket=bucket_name, Key=key)
+        else:
+            raise
+    _count('misses')
+    etag = response['ETag']
+    blob_path = os.path.join(_cache_settings['directory'], 'blobs', _digest(bucket_name, key, etag))
+    _atomic_write(blob_path, lambda outfile: shutil.copyfileobj(response['Body'], outfile, 1024*1024))
+    _atomic_write(index_path, lambda outfile: outfile.write(json.dumps({'bucket': bucket_name, 'key': key, 'etag': etag}).encode('utf-8')))
+    _count('bytes_downloaded', os.path.getsize(blob_path))
+    _evict(keep=blob_path)
+    return blob_path
+
+def open_cached(s3c,bucket_name,key,opener=open,*args):
+    """Opens the local copy of a s3 object. If another process evicts the copy before it is opened, the object is fetched again.
+    Args:
+        s3c (boto3 Client): Client used for the requests
+        bucket_name (str): Name of the bucket
+        key (str): Key of the object
+        opener (callable): Opens the path of the copy, e.g. open or pyarrow.memory_map
+        *args: Further arguments passed to opener, e.g. the mode
+    Raises:
+        botocore.exceptions.ClientError: When the object cannot be read, e.g. NoSuchKey
+    Returns:
+        File object returned by opener
+    """
+    for attempt in range(_OPEN_ATTEMPTS):
+        path = cached_path(s3c,bucket_name,key)
+        try:
+            return opener(path,*args)
+        except FileNotFoundError:
+            if attempt == _OPEN_ATTEMPTS-1:
+                raise
+            logger.info('Cached copy of {} was evicted before it was opened, fetching it again'.format(key))
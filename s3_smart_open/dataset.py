@@ -0,0 +1,353 @@
+# Copyright (c) 2022 RWTH Aachen - Werkzeugmaschinenlabor (WZL)
+# Contact: Simon Cramer, s.cramer@wzl-mq.rwth-aachen.de
+
+import os
+import logging
+import urllib.parse
+from .lazy import lazy_import
+from .filehandler import (generate_s3_strings, _get_file_handle, _get_s3_client, _transport_params, _open_random_access, _list_objects,
+                          _run_many, to_json, read_json)
+
+pd = lazy_import('pandas')
+pyarrow = lazy_import('pyarrow', 'pyarrow.compute', 'pyarrow.feather', 'pyarrow.ipc', 'pyarrow.parquet')
+smart_open = lazy_import('smart_open')
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILENAME = '_manifest.json'
+_NULL_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+_EXTENSIONS = {'parquet': '.parquet', 'feather': '.fth'}
+_OPERATORS = ('==', '!=', '<', '<=', '>', '>=', 'in', 'not in')
+
+def _join(path,*parts):
+    """Joins a local or s3 path with relative parts
+    Args:
+        path (str): Local path or s3://BUCKETNAME/KEY
+        parts (str): Relative parts separated by "/"
+    Returns:
+        [str]: Joined path
+    """
+    parts = [part for part in parts if part]
+    if path[:5] == 's3://':
+        return '/'.join([path.rstrip('/')] + parts)
+    return os.path.join(path, *[sub_part for part in parts for sub_part in part.split('/')])
+
+def _partition_directory(partition_cols,values):
+    """Builds the Hive style directory of a partition e.g. machine=M1/day=2022-01-01
+    Args:
+        partition_cols (list[str]): Names of the partition columns
+        values (tuple): Values of the partition columns
+    Returns:
+        [str]: Relative directory
+    """
+    parts = []
+    for column, value in zip(partition_cols, values):
+        value = _NULL_PARTITION if pd.isna(value) else urllib.parse.quote(str(value), safe='')
+        parts.append('{}={}'.format(column, value))
+    return '/'.join(parts)
+
+def _json_value(value):
+    """Converts numpy and pandas scalars into values that can be stored in the json manifest
+    Args:
+        value (anything): Scalar value
+    Returns:
+        Value of a json type or None
+    """
+    if value is None or (not isinstance(value, (list, dict)) and pd.isna(value)):
+        return None
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+def _statistics(table):
+    """Computes min and max of every column with a numeric, boolean or string type
+    Args:
+        table (pyarrow.Table): Data of one file
+    Returns:
+        [dict]: [min, max] by column name
+    """
+    statistics = {}
+    for name, column in zip(table.column_names, table.columns):
+        if not (pyarrow.types.is_integer(column.type) or pyarrow.types.is_floating(column.type)
+                or pyarrow.types.is_boolean(column.type) or pyarrow.types.is_string(column.type)):
+            continue
+        min_max = pyarrow.compute.min_max(column)
+        statistics[name] = [_json_value(min_max['min'].as_py()), _json_value(min_max['max'].as_py())]
+    return statistics
+
+def _write_file(savepath,table,file_format,row_group_size):
+    """Writes one file of a dataset
+    Args:
+        savepath (str): Full path from _get_file_handle
+        table (pyarrow.Table): Data of the file
+        file_format (str): "parquet" or "feather"
+        row_group_size (int): Maximum number of rows per row group or record batch
+    """
+    with smart_open.open(savepath,'wb', transport_params=_transport_params(savepath)) as outfile:
+        if file_format == 'parquet':
+            pyarrow.parquet.write_table(table,outfile,row_group_size=row_group_size)
+        else:
+            pyarrow.feather.write_feather(table,outfile,chunksize=row_group_size)
+
+def to_dataset(output_path,dataset_name,dataframe,partition_cols=None,file_format='parquet',row_group_size=None,max_workers=None):
+    """Writes a pandas Dataframe as partitioned dataset. Every combination of the partition columns is written into its own
+    Hive style directory (e.g. dataset/machine=M1/day=2022-01-01/part-00000.parquet) and a manifest with the partition values,
+    row counts and min/max statistics of every file is written to dataset/_manifest.json.
+    Args:
+        output_path (str): Path where the dataset directory is written.
+        dataset_name (str): Name of the dataset directory.
+        dataframe (pandas.Dataframe): Data of the dataset.
+        partition_cols (list[str]): Columns to partition by. Their values are stored in the directory names, not in the files.
+        file_format (str): "parquet" or "feather"
+        row_group_size (int): Maximum number of rows per row group (parquet) or record batch (feather).
+        max_workers (int): Number of files written in parallel. Defaults to the size of the s3 connection pool.
+    Returns:
+        [dict]: Manifest of the dataset
+    """
+    if file_format not in _EXTENSIONS:
+        raise ValueError('Unknown file format {}! Use "parquet" or "feather".'.format(file_format))
+    if type(partition_cols)==str:
+        partition_cols=[partition_cols]
+    partition_cols = partition_cols or []
+    dataset_path = _join(output_path, dataset_name)
+    if partition_cols:
+        groups = dataframe.groupby(partition_cols, dropna=False, observed=True, sort=True)
+    else:
+        groups = [((), dataframe)]
+    files = []
+    jobs = []
+    for values, group in groups:
+        if not isinstance(values, tuple):
+            values = (values,)
+        directory = _partition_directory(partition_cols, values)
+        filename = 'part-{:05d}{}'.format(len(files), _EXTENSIONS[file_format])
+        table = pyarrow.Table.from_pandas(group.drop(columns=partition_cols), preserve_index=False)
+        files.append({'path': '/'.join(part for part in (directory, filename) if part),
+                      'partition': {column: _json_value(value) for column, value in zip(partition_cols, values)},
+                      'rows': table.num_rows,
+                      'statistics': _statistics(table)})
+        jobs.append((files[-1]['path'], (_get_file_handle(_join(dataset_path, directory), filename), table)))
+    logger.info('----Upload started: {} ({} files) ----'.format(dataset_name, len(jobs)))
+    write = lambda path, job: _write_file(job[0], job[1], file_format, row_group_size)
+    errors = {path: error for path, result, error in _run_many(write, jobs, max_workers, dataset_path) if error is not None}
+    if errors:
+        raise IOError('Failed to write {} files of dataset {}: {}'.format(len(errors), dataset_name, errors))
+    manifest = {'format': file_format, 'partition_cols': partition_cols, 'files': files}
+    to_json(dataset_path, MANIFEST_FILENAME, manifest)
+    logger.info('----Upload finished: {} ----'.format(dataset_name))
+    return manifest
+
+def _parse_partition(path):
+    """Reads the partition values from a Hive style path. Values are returned as strings.
+    Args:
+        path (str): Relative path of a file
+    Returns:
+        [dict]: Partition values by column name
+    """
+    partition = {}
+    for part in path.split('/')[:-1]:
+        if '=' in part:
+            column, value = part.split('=', 1)
+            partition[column] = None if value == _NULL_PARTITION else urllib.parse.unquote(value)
+    return partition
+
+def _discover(dataset_path):
+    """Builds a manifest by listing a dataset without manifest
+    Args:
+        dataset_path (str): Path to the dataset directory
+    Returns:
+        [dict]: Manifest without statistics and row counts
+    """
+    if dataset_path[:5] == 's3://':
+        bucket_name, prefix, path = generate_s3_strings(dataset_path)
+        paths = [key[len(prefix):] for key in _list_objects(_get_s3_client(), bucket_name, prefix)]
+    else:
+        paths = [os.path.relpath(os.path.join(root, filename), dataset_path).replace(os.sep, '/')
+                 for root, dirs, filenames in os.walk(dataset_path) for filename in filenames]
+    files = []
+    file_format = None
+    for path in sorted(paths):
+        for candidate, extension in _EXTENSIONS.items():
+            if path.endswith(extension):
+                file_format = candidate
+                files.append({'path': path, 'partition': _parse_partition(path), 'statistics': {}})
+    partition_cols = list(files[0]['partition']) if files else []
+    return {'format': file_format or 'parquet', 'partition_cols': partition_cols, 'files': files}
+
+def _compare(value,operator,reference):
+    """Evaluates a filter for a single value. Partition values from paths without manifest are strings, so they are also compared as strings.
+    Args:
+        value (anything): Value of the data
+        operator (str): One of ==, !=, <, <=, >, >=, in, not in
+        reference (anything): Value of the filter
+    Returns:
+        [bool]: Result of the comparison
+    """
+    if operator == 'in':
+        return any(_compare(value, '==', item) for item in reference)
+    if operator == 'not in':
+        return not _compare(value, 'in', reference)
+    if isinstance(value, str) and not isinstance(reference, str):
+        reference = str(reference)
+    if operator == '==':
+        return value == reference
+    if operator == '!=':
+        return value != reference
+    if value is None:
+        return False
+    if operator == '<':
+        return value < reference
+    if operator == '<=':
+        return value <= reference
+    if operator == '>':
+        return value > reference
+    return value >= reference
+
+def _may_match(statistics,filters):
+    """Checks with min/max statistics if some rows may match all filters
+    Args:
+        statistics (dict): [min, max] by column name
+        filters (list[tuple]): Filters as (column, operator, value)
+    Returns:
+        [bool]: False if no row can match
+    """
+    for column, operator, reference in filters:
+        if column not in statistics or None in statistics[column]:
+            continue
+        minimum, maximum = statistics[column]
+        try:
+            if operator == '==' and not (minimum <= reference <= maximum):
+                return False
+            if operator == 'in' and not any(minimum <= item <= maximum for item in reference):
+                return False
+            if operator in ('<', '<=') and not _compare(minimum, operator, reference):
+                return False
+            if operator in ('>', '>=') and not _compare(maximum, operator, reference):
+                return False
+        except TypeError:
+            continue
+    return True
+
+def _filter_expression(filters):
+    """Builds a pyarrow expression from filters
+    Args:
+        filters (list[tuple]): Filters as (column, operator, value)
+    Returns:
+        pyarrow.compute.Expression or None
+    """
+    expression = None
+    for column, operator, reference in filters:
+        field = pyarrow.compute.field(column)
+        condition = {
+            '==': lambda: field == reference,
+            '!=': lambda: field != reference,
+            '<': lambda: field < reference,
+            '<=': lambda: field <= reference,
+            '>': lambda: field > reference,
+            '>=': lambda: field >= reference,
+            'in': lambda: field.isin(list(reference)),
+            'not in': lambda: ~field.isin(list(reference)),
+        }[operator]()
+        expression = condition if expression is None else expression & condition
+    return expression
+
+def _read_file(dataset_path,entry,columns,filters):
+    """Reads one file of a dataset. Parquet row groups whose statistics cannot match the filters are not downloaded.
+    Args:
+        dataset_path (str): Path to the dataset directory
+        entry (dict): Manifest entry of the file
+        columns (list[str]): Columns to read without partition columns. If not provided, all columns are read.
+        filters (list[tuple]): Filters on columns of the file as (column, operator, value)
+    Returns:
+        [pyarrow.Table]: Rows of the file that match the filters
+    """
+    directory, filename = entry['path'].rsplit('/', 1) if '/' in entry['path'] else ('', entry['path'])
+    source = _open_random_access(_join(dataset_path, directory), filename)
+    read_columns = None if columns is None else list(dict.fromkeys(columns + [column for column, operator, value in filters]))
+    if entry['path'].endswith(_EXTENSIONS['parquet']):
+        parquet_file = pyarrow.parquet.ParquetFile(source)
+        names = set(parquet_file.schema_arrow.names)
+        row_groups = []
+        for index in range(parquet_file.num_row_groups):
+            row_group = parquet_file.metadata.row_group(index)
+            statistics = {}
+            for position in range(row_group.num_columns):
+                # Row group columns are leaves, nested columns have several leaves with paths like "b.list.element"
+                column = row_group.column(position)
+                column_statistics = column.statistics
+                if column.path_in_schema in names and column_statistics is not None and column_statistics.has_min_max:
+                    statistics[column.path_in_schema] = [column_statistics.min, column_statistics.max]
+            if _may_match(statistics, filters):
+                row_groups.append(index)
+        table = parquet_file.read_row_groups(row_groups, columns=read_columns)
+    else:
+        reader = pyarrow.ipc.open_file(source)
+        if read_columns:
+            options = pyarrow.ipc.IpcReadOptions(included_fields=sorted(reader.schema.names.index(column) for column in read_columns))
+            reader = pyarrow.ipc.open_file(source, options=options)
+        table = reader.read_all()
+    if filters:
+        table = table.filter(_filter_expression(filters))
+    if columns is not None:
+        table = table.select(columns)
+    return table
+
+def read_dataset(input_path,dataset_name,columns=None,filters=None,max_workers=None):
+    """Reads a partitioned dataset written with to_dataset. Only files whose partition values and statistics can match the filters
+    are read, and of these only the row groups (parquet) and columns that are needed. Files are read in parallel.
+    Args:
+        input_path (str): Path that contains the dataset directory.
+        dataset_name (str): Name of the dataset directory.
+        columns (list[str]): If not provided, all columns are read.
+        filters (list[tuple]): Rows have to match all filters, given as (column, operator, value) with operator one of ==, !=, <, <=, >, >=, in, not in.
+        max_workers (int): Number of files read in parallel. Defaults to the size of the s3 connection pool.
+    Returns:
+        [pandas.DataFrame]: Pandas Dataframe
+    """
+    if columns and type(columns) != list:
+        columns = [columns]
+    filters = list(filters or [])
+    for column, operator, value in filters:
+        if operator not in _OPERATORS:
+            raise ValueError('Unknown operator {}! Use one of {}.'.format(operator, _OPERATORS))
+    dataset_path = _join(input_path, dataset_name)
+    try:
+        manifest = read_json(dataset_path, MANIFEST_FILENAME)
+    except ValueError:
+        logger.info('No manifest found for {}, listing the dataset'.format(dataset_name))
+        manifest = _discover(dataset_path)
+    partition_cols = manifest['partition_cols']
+    partition_filters = [item for item in filters if item[0] in partition_cols]
+    file_filters = [item for item in filters if item[0] not in partition_cols]
+    file_columns = None if columns is None else [column for column in columns if column not in partition_cols]
+    selected = []
+    for entry in manifest['files']:
+        if not all(_compare(entry['partition'].get(column), operator, value) for column, operator, value in partition_filters):
+            continue
+        if not _may_match(entry.get('statistics', {}), file_filters):
+            continue
+        selected.append(entry)
+    logger.info('----Download started: {} ({} of {} files) ----'.format(dataset_name, len(selected), len(manifest['files'])))
+
+    def _read(index, entry):
+        table = _read_file(dataset_path, entry, file_columns, file_filters)
+        frame = table.to_pandas()
+        for column in partition_cols:
+            if columns is None or column in columns:
+                frame[column] = entry['partition'].get(column)
+        return frame
+
+    frames = {}
+    for index, frame, error in _run_many(_read, enumerate(selected), max_workers, dataset_path):
+        if error is not None:
+            raise error
+        frames[index] = frame
+    logger.info('----Download finished: {} ----'.format(dataset_name))
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    dataframe = pd.concat([frames[index] for index in sorted(frames)], ignore_index=True)
+    if columns is not None:
+        dataframe = dataframe[columns]
+    return dataframe
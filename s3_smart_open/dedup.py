@@ -0,0 +1,244 @@
+# Copyright (c) 2022 RWTH Aachen - Werkzeugmaschinenlabor (WZL)
+# Contact: Simon Cramer, s.cramer@wzl-mq.rwth-aachen.de
+
+import io
+import json
+import time
+import hashlib
+import logging
+import tempfile
+import contextlib
+from . import metrics
+from .lazy import lazy_import
+from .serialization import _PrefixedReader
+from .filehandler import generate_s3_strings, _get_s3_client, _get_transfer_config, _is_not_found, _run_many, _batches, _DELETE_BATCH_SIZE
+
+botocore = lazy_import('botocore', 'botocore.exceptions')
+
+logger = logging.getLogger(__name__)
+
+POINTER_MAGIC = b'S3SOPTR1'
+_SHA256_METADATA = 's3so-sha256'
+
+_dedup_settings = {
+    'store_path': None,
+    'spool_size': 64*1024*1024,
+    'pointer_max_size': 4096,
+}
+
+def configure_dedup(store_path=None,spool_size=None):
+    """Changes the settings of the content addressed writes (dedup=True of to_pckl, to_dill and to_joblib).
+    Args:
+        store_path (str): s3 path of the blob store, e.g. s3://bucket/blobs. Defaults to .s3_smart_open_blobs in the bucket of the written file.
+        spool_size (int): Serialized objects up to this amount of bytes are kept in memory until the upload, larger ones in a temp file
+    """
+    if store_path is not None:
+        _dedup_settings['store_path'] = store_path.rstrip('/')
+    if spool_size is not None:
+        _dedup_settings['spool_size'] = spool_size
+
+def _store_path(bucket_name):
+    """Returns the s3 path of the blob store for a bucket
+    Args:
+        bucket_name (str): Bucket of the written file
+    Returns:
+        [str]: s3://BUCKETNAME/PREFIX of the blob store
+    """
+    return _dedup_settings['store_path'] or 's3://{}/.s3_smart_open_blobs'.format(bucket_name)
+
+def _bucket_key(path):
+    """Splits a s3 path into bucket and key
+    Args:
+        path (str): s3://BUCKETNAME/KEY
+    Returns:
+        [tuple]: bucket name and key, the key is empty for the bucket itself
+    """
+    bucket_name, separator, key = path[5:].partition('/')
+    return bucket_name, key
+
+def _blob_location(store_path,digest):
+    """Returns the bucket and key of a blob. Blobs are spread over 256 prefixes by the first byte of the hash.
+    Args:
+        store_path (str): s3 path of the blob store
+        digest (str): sha256 of the content as hex
+    Returns:
+        [tuple]: bucket name and key
+    """
+    bucket_name, prefix = _bucket_key(store_path.rstrip('/')+'/')
+    return bucket_name, '{}sha256/{}/{}'.format(prefix, digest[:2], digest)
+
+
+class _HashingWriter(io.RawIOBase):
+    """Writes to a spool file and computes the sha256 and size of everything written
+    """
+
+    def __init__(self,spool):
+        super().__init__()
+        self._spool = spool
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self,data):
+        self.sha256.update(data)
+        self.size += len(memoryview(data).cast('B'))
+        return self._spool.write(data)
+
+
+@contextlib.contextmanager
+def blob_writer(output_path,filename):
+    """Opens a content addressed writer. The written bytes are hashed while they are spooled.
+    On close the content is uploaded as blob named by its sha256, unless a blob with that hash, size and stored sha256 exists already,
+    and a small pointer object to the blob is written at output_path/filename.
+    An existing blob is copied onto itself, which renews its LastModified, so collect_garbage keeps it for min_age after the new pointer was written.
+    Args:
+        output_path (str): s3 path of the pointer
+        filename (str): Filename of the pointer
+    Yields:
+        File object opened for binary writing
+    """
+    bucket_name, prefix, path = generate_s3_strings(output_path)
+    with tempfile.SpooledTemporaryFile(max_size=_dedup_settings['spool_size'], prefix='s3_smart_open_') as spool:
+        writer = _HashingWriter(spool)
+        yield writer
+        digest = writer.sha256.hexdigest()
+        store_path = _store_path(bucket_name)
+        blob_bucket, blob_key = _blob_location(store_path, digest)
+        metadata = {_SHA256_METADATA: digest}
+        s3c = _get_s3_client()
+        with metrics.network():
+            try:
+                head = s3c.head_object(Bucket=blob_bucket, Key=blob_key)
+                # Blobs without the stored sha256 (e.g. damaged or written by older versions) are uploaded again
+                exists = head['ContentLength'] == writer.size and head.get('Metadata', {}).get(_SHA256_METADATA) == digest
+            except botocore.exceptions.ClientError as e:
+                if not _is_not_found(e):
+                    raise
+                exists = False
+            if exists:
+                s3c.copy({'Bucket': blob_bucket, 'Key': blob_key}, blob_bucket, blob_key,
+                         ExtraArgs={'Metadata': metadata, 'MetadataDirective': 'REPLACE'}, Config=_get_transfer_config())
+                logger.info('Blob {} of {} exists, skipped upload of {} bytes'.format(digest, filename, writer.size))
+            else:
+                spool.seek(0)
+                s3c.upload_fileobj(spool, blob_bucket, blob_key, ExtraArgs={'Metadata': metadata}, Config=_get_transfer_config())
+                metrics.count(bytes=writer.size)
+            pointer = {'sha256': digest, 'size': writer.size, 'blob': 's3://{}/{}'.format(blob_bucket, blob_key)}
+            s3c.put_object(Bucket=bucket_name, Key=prefix+filename, Body=POINTER_MAGIC+json.dumps(pointer).encode('utf-8'),
+                           Metadata={'s3so-blob': digest})
+
+def read_pointer(infile):
+    """Checks if a file is a pointer to a blob and reads it
+    Args:
+        infile (file object): File object opened for binary reading
+    Returns:
+        [tuple]: File object to read the content from and the pointer as dict or None if the file is no pointer
+    """
+    if hasattr(infile, 'peek'):
+        head = infile.peek(len(POINTER_MAGIC))[:len(POINTER_MAGIC)]
+    else:
+        head = infile.read(len(POINTER_MAGIC))
+        infile = io.BufferedReader(_PrefixedReader(head, infile))
+    if head != POINTER_MAGIC:
+        return infile, None
+    return infile, parse_pointer(infile.read(_dedup_settings['pointer_max_size']))
+
+def parse_pointer(data):
+    """Parses the content of a pointer object
+    Args:
+        data (bytes): Content of the object
+    Returns:
+        [dict]: sha256, size and s3 path of the blob or None if the content is no pointer
+    """
+    if not data.startswith(POINTER_MAGIC):
+        return None
+    return json.loads(data[len(POINTER_MAGIC):].decode('utf-8'))
+
+def split_blob_path(pointer):
+    """Splits the s3 path of the blob of a pointer into path and filename for the read functions
+    Args:
+        pointer (dict): Pointer from read_pointer
+    Returns:
+        [tuple]: path and filename of the blob
+    """
+    blob = pointer['blob']
+    return blob[:blob.rfind('/')], blob[blob.rfind('/')+1:]
+
+def collect_garbage(path,roots,min_age=24*3600,dry_run=False,max_workers=None):
+    """Deletes blobs of the blob store that no pointer references.
+    Objects below the roots that are small enough to be pointers are read to find the referenced blobs.
+    The roots have to cover every pointer to the store: pointers in other buckets or prefixes are not seen, and their blobs are deleted.
+    Blobs younger than min_age are kept, so blobs of writes that did not write their pointer yet are not deleted.
+    Run it while no writes with dedup=True are running: a write that finds an existing blob during the collection can point to a deleted blob.
+    Args:
+        path (str): s3 path of the blob store or of its bucket, e.g. s3://bucket
+        roots (list[str]): s3 paths that contain all pointers to the store, e.g. every bucket written with dedup=True
+        min_age (float): Minimum age of deleted blobs in seconds
+        dry_run (bool): Only report the unreferenced blobs
+        max_workers (int): Number of parallel requests
+    Raises:
+        ValueError: When no roots are given
+    Returns:
+        [dict]: Summary with the number of blobs, pointers and referenced blobs, the deleted (or with dry_run deletable) blob keys, the freed bytes and failed keys
+    """
+    if type(roots)==str:
+        roots = [roots]
+    if not roots:
+        raise ValueError('collect_garbage needs the roots that contain all pointers to the blob store!')
+    bucket_name, prefix = _bucket_key(path.rstrip('/'))
+    store_bucket, store_prefix = _bucket_key((path.rstrip('/') if prefix else _store_path(bucket_name))+'/')
+    s3c = _get_s3_client()
+    paginator = s3c.get_paginator('list_objects_v2')
+    blobs = {}
+    for page in paginator.paginate(Bucket=store_bucket, Prefix=store_prefix+'sha256/'):
+        for obj in page.get('Contents', []):
+            blobs[obj['Key']] = obj
+    candidates = []
+    for root in roots:
+        bucket_name, prefix = _bucket_key(root)
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                if obj['Size'] <= _dedup_settings['pointer_max_size'] and not (bucket_name == store_bucket and obj['Key'].startswith(store_prefix)):
+                    candidates.append((bucket_name, obj['Key']))
+
+    def _read(candidate, unused):
+        bucket_name, key = candidate
+        return parse_pointer(s3c.get_object(Bucket=bucket_name, Key=key, Range='bytes=0-{}'.format(_dedup_settings['pointer_max_size']-1))['Body'].read())
+
+    referenced = set()
+    pointers = 0
+    for candidate, pointer, error in _run_many(_read, ((candidate, None) for candidate in candidates), max_workers):
+        if error is not None:
+            # A pointer that cannot be read might reference a blob, so nothing is deleted
+            raise RuntimeError('Failed to read {} ; Reason {}'.format(candidate, error)) from error
+        if pointer is not None:
+            pointers += 1
+            referenced.add(_bucket_key(pointer['blob']))
+    deadline = time.time() - min_age
+    unreferenced = [key for key, obj in blobs.items() if (store_bucket, key) not in referenced and obj['LastModified'].timestamp() < deadline]
+    summary = {'blobs': len(blobs), 'pointers': pointers, 'referenced': sum(1 for key in blobs if (store_bucket, key) in referenced),
+               'deleted': [], 'bytes': 0, 'failed': {}}
+    if dry_run:
+        summary['deleted'] = unreferenced
+        summary['bytes'] = sum(blobs[key]['Size'] for key in unreferenced)
+        return summary
+
+    def _delete(index, keys):
+        response = s3c.delete_objects(Bucket=store_bucket, Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True})
+        failed = {error['Key']: error.get('Message', error.get('Code')) for error in response.get('Errors', [])}
+        return [key for key in keys if key not in failed], failed
+
+    for index, result, error in _run_many(_delete, enumerate(_batches(unreferenced, _DELETE_BATCH_SIZE)), max_workers):
+        if error is not None:
+            logger.warning('Failed to delete batch {} ; Reason {}'.format(index, error))
+            summary['failed']['batch {}'.format(index)] = error
+            continue
+        deleted, failed = result
+        summary['deleted'].extend(deleted)
+        summary['failed'].update(failed)
+    summary['bytes'] = sum(blobs[key]['Size'] for key in summary['deleted'])
+    logger.info('Deleted {} of {} blobs ({} bytes), {} referenced by {} pointers'.format(
+        len(summary['deleted']), summary['blobs'], summary['bytes'], summary['referenced'], pointers))
+    return summary
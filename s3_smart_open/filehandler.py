@@ -1,38 +1,176 @@
 # Copyright (c) 2022 RWTH Aachen - Werkzeugmaschinenlabor (WZL)
 # Contact: Simon Cramer, s.cramer@wzl-mq.rwth-aachen.de
 
-import smart_open
-import boto3
 import os
 import logging
-import pickle
-import dill
-import botocore
-import pandas as pd
-import smart_open
-import pyarrow
-import json
 import shutil
-import joblib
+import threading
+import queue
+import contextlib
+import concurrent.futures
+import hashlib
+import re
+import time
+from .lazy import lazy_import
+from .settings import get_s3_settings
+from .rangefile import S3RangeFile, DEFAULT_READ_AHEAD
+from .parallel import download_buffer, parallel_reads_enabled, sequential_ranges
+from . import cache
+from . import serialization
+from . import metrics
+from .cache import configure_cache, disable_cache, cache_stats, clear_cache
+from .parallel import configure_parallel_reads
+
+smart_open = lazy_import('smart_open')
+boto3 = lazy_import('boto3', 'boto3.session', 'boto3.s3.transfer')
+botocore = lazy_import('botocore', 'botocore.config', 'botocore.exceptions')
+dill = lazy_import('dill')
+joblib = lazy_import('joblib')
+pd = lazy_import('pandas')
+pyarrow = lazy_import('pyarrow', 'pyarrow.feather', 'pyarrow.ipc')
 
 logger = logging.getLogger(__name__)
 
+_s3_pool_settings = {
+    'max_pool_connections': 32,
+    'max_attempts': 5,
+    'retry_mode': 'standard',
+    'connect_timeout': 10,
+    'read_timeout': 60,
+}
+_s3_pool_lock = threading.Lock()
+_s3_pool = {'key': None, 'client': None}
+_s3_pool_local = threading.local()
+
+_transfer_settings = {
+    'multipart_threshold': 16*1024*1024,
+    'multipart_chunksize': 16*1024*1024,
+    'max_concurrency': 8,
+}
+
+def configure_s3_pool(max_pool_connections=None,max_attempts=None,retry_mode=None,connect_timeout=None,read_timeout=None):
+    """Changes the settings of the shared s3 connection pool. Clients that were created before are dropped and rebuilt on next use.
+    Args:
+        max_pool_connections (int): Maximum number of open connections kept by the shared client
+        max_attempts (int): Maximum number of attempts per request including retries
+        retry_mode (str): botocore retry mode e.g. "standard", "adaptive" or "legacy"
+        connect_timeout (float): Timeout in seconds for establishing a connection
+        read_timeout (float): Timeout in seconds for reading from a connection
+    """
+    updates = {
+        'max_pool_connections': max_pool_connections,
+        'max_attempts': max_attempts,
+        'retry_mode': retry_mode,
+        'connect_timeout': connect_timeout,
+        'read_timeout': read_timeout,
+    }
+    with _s3_pool_lock:
+        for name, value in updates.items():
+            if value is not None:
+                _s3_pool_settings[name] = value
+        _s3_pool['key'] = None
+        _s3_pool['client'] = None
+
+def reset_s3_pool():
+    """Drops the shared s3 client and resources, e.g. after the credentials have changed.
+    """
+    configure_s3_pool()
+
+def configure_transfer(multipart_threshold=None,multipart_chunksize=None,max_concurrency=None):
+    """Changes the settings used for file uploads and downloads with boto3 (to_s3, from_s3 and the directory functions).
+    Args:
+        multipart_threshold (int): Files larger than this amount of bytes are transferred in multiple parts
+        multipart_chunksize (int): Size of each part in bytes
+        max_concurrency (int): Number of parallel parts per file
+    """
+    updates = {
+        'multipart_threshold': multipart_threshold,
+        'multipart_chunksize': multipart_chunksize,
+        'max_concurrency': max_concurrency,
+    }
+    for name, value in updates.items():
+        if value is not None:
+            _transfer_settings[name] = value
+
+def _get_transfer_config():
+    """Builds the boto3 TransferConfig from the transfer settings
+    Returns:
+        boto3 TransferConfig
+    """
+    return boto3.s3.transfer.TransferConfig(**_transfer_settings)
+
+def _endpoint_url(endpoint):
+    """Builds the endpoint url of the s3 clients. Endpoints without scheme use https, an explicit http:// scheme can be used for local s3 emulators.
+    Args:
+        endpoint (str): Value of S3_ENDPOINT e.g. s3.example.com or http://127.0.0.1:5000
+    Returns:
+        [str]: Endpoint url
+    """
+    return endpoint if '://' in endpoint else 'https://'+endpoint
+
+def _endpoint_host():
+    """Returns S3_ENDPOINT without scheme for s3://endpoint@BUCKETNAME/KEY paths
+    Returns:
+        [str]: Host of the endpoint
+    """
+    return get_s3_settings().endpoint.split('://')[-1]
+
+def _s3_pool_key():
+    """Builds the key the shared s3 client is valid for. A new process (fork) or changed credentials invalidate the client.
+    Returns:
+        [tuple]: pid, endpoint, access key, secret key and pool settings
+    """
+    return (os.getpid(),
+            *get_s3_settings()[:3],
+            tuple(sorted(_s3_pool_settings.items())))
+
+def _new_s3_session(key):
+    """Creates a boto3 session and the client config from a pool key
+    Args:
+        key (tuple): Key generated by _s3_pool_key
+    Returns:
+        boto3 Session and botocore Config
+    """
+    pid, endpoint, access_key, secret_key, settings = key
+    settings = dict(settings)
+    session = boto3.session.Session(aws_access_key_id=access_key,aws_secret_access_key=secret_key)
+    config = botocore.config.Config(max_pool_connections=settings['max_pool_connections'],
+                                    retries={'max_attempts': settings['max_attempts'], 'mode': settings['retry_mode']},
+                                    connect_timeout=settings['connect_timeout'],
+                                    read_timeout=settings['read_timeout'],
+                                    )
+    return session, config
+
+def _get_s3_client():
+    """Returns the s3 Client shared by all threads of the process. boto3 clients are thread safe, so connections are pooled and reused.
+    Returns:
+        boto3 Client
+    """
+    key = _s3_pool_key()
+    s3c = _s3_pool['client']
+    if _s3_pool['key'] != key or s3c is None:
+        with _s3_pool_lock:
+            if _s3_pool['key'] != key or _s3_pool['client'] is None:
+                session, config = _new_s3_session(key)
+                _s3_pool['client'] = session.client('s3',endpoint_url=_endpoint_url(key[1]),config=config)
+                metrics.register_client(_s3_pool['client'])
+                _s3_pool['key'] = key
+            s3c = _s3_pool['client']
+    return s3c
+
 def generate_s3_session():
-    """Generates s3 Client or s3 Resource if needed
+    """Returns the shared s3 Client and a s3 Resource for the calling thread.
+    The resource is created once per thread because boto3 resources are not thread safe.
     Returns:
         boto3 Client and boto3 Resource
-    """    
-    s3c = boto3.client('s3',
-                endpoint_url='https://'+os.environ['S3_ENDPOINT'],
-                aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
-                aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY'],
-                )
-    s3r = boto3.resource('s3',
-                endpoint_url='https://'+os.environ['S3_ENDPOINT'],
-                aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
-                aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY'],
-                )
-    return s3c,s3r
+    """
+    s3c = _get_s3_client()
+    key = _s3_pool['key']
+    if getattr(_s3_pool_local, 'key', None) != key:
+        session, config = _new_s3_session(key)
+        _s3_pool_local.resource = session.resource('s3',endpoint_url=_endpoint_url(key[1]),config=config)
+        _s3_pool_local.key = key
+    return s3c,_s3_pool_local.resource
 
 def generate_s3_strings(path):
     """Generates s3 bucket name, s3 key and s3 path with an endpoint from a path
@@ -58,16 +196,94 @@ def generate_s3_strings(path):
     prefix = path[path.find(bucket_name)+len(bucket_name)+1:]
     if not prefix.endswith('/'):
         prefix =  prefix+'/'
-    path = 's3://'+os.environ['S3_ENDPOINT']+'@'+bucket_name+'/'+prefix
+    path = 's3://'+_endpoint_host()+'@'+bucket_name+'/'+prefix
     return bucket_name, prefix, path
 
-def check_filenames(path,filenames_list,prefix,bucket_name):
+_EXISTS_HEAD_THRESHOLD = 32
+_EXISTS_MAX_SHARDS = 16
+
+def _head_missing_keys(s3c,bucket_name,keys):
+    """Checks keys with concurrent HEAD requests over the shared client
+    Args:
+        s3c (boto3 Client): Client used for the requests
+        bucket_name (str): Name of the bucket to check
+        keys (list[str]): Keys to check
+    Returns:
+        [set]: Keys that do not exist
+    """
+    def _head(key):
+        try:
+            s3c.head_object(Bucket=bucket_name, Key=key)
+        except botocore.exceptions.ClientError as e:
+            if e.response['Error']['Code'] == "404":
+                return key
+        return None
+    if not keys:
+        return set()
+    workers = min(len(keys), _s3_pool_settings['max_pool_connections'])
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        return {key for key in executor.map(_head, keys) if key is not None}
+
+def _shard_prefixes(keys):
+    """Splits sorted keys into a few listing prefixes, so that only the part of the bucket that contains the keys is listed.
+    The common prefix of all keys is extended by one character per shard as long as this results in not more than _EXISTS_MAX_SHARDS shards.
+    Args:
+        keys (list[str]): Sorted keys
+    Returns:
+        [dict]: Listing prefix mapped to the sorted keys it covers
+    """
+    common = os.path.commonprefix(keys)
+    shards = {}
+    for key in keys:
+        shards.setdefault(key[:len(common)+1], []).append(key)
+    if len(shards) > _EXISTS_MAX_SHARDS:
+        shards = {common: keys}
+    return shards
+
+def _list_missing_keys(s3c,bucket_name,shard_prefix,keys):
+    """Checks sorted keys by listing the shard prefix once.
+    S3 lists keys in lexicographic order, so every requested key up to the last listed key is decided after each page.
+    When a page decides fewer keys than concurrent HEAD requests could, the remaining keys are checked with HEAD requests instead.
+    Args:
+        s3c (boto3 Client): Client used for the requests
+        bucket_name (str): Name of the bucket to check
+        shard_prefix (str): Prefix that is listed
+        keys (list[str]): Sorted keys starting with shard_prefix
+    Returns:
+        [set]: Keys that do not exist
+    """
+    wanted = set(keys)
+    found = set()
+    decided = 0
+    paginator = s3c.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name,Prefix=shard_prefix):
+        contents = page.get('Contents', [])
+        for obj in contents:
+            if obj['Key'] in wanted:
+                found.add(obj['Key'])
+        if not contents or not page.get('IsTruncated'):
+            decided = len(keys)
+            break
+        last_key = contents[-1]['Key']
+        decided_before = decided
+        while decided < len(keys) and keys[decided] <= last_key:
+            decided += 1
+        if decided == len(keys):
+            break
+        if decided - decided_before < _s3_pool_settings['max_pool_connections']:
+            break
+    missing = set(keys[:decided]) - found
+    return missing | _head_missing_keys(s3c,bucket_name,keys[decided:])
+
+def check_filenames(path,filenames_list,prefix,bucket_name,method='auto'):
     """Checks files from given filename_list, if they exists
     Args:
         path (str): Path for checking the filenames
         filenames_list (list[str]): List of filenames to check
         prefix (str): Name of the Key/Prefix to check
         bucket_name (str): Name of the bucket to check 
+        method (str): How s3 keys are checked. "head" sends one HEAD request per filename, "list" lists the prefix once
+                      and "auto" uses HEAD requests for short lists and listings otherwise.
     Returns:
         [list]: List of filenames that do not exists in the given path
     """  
@@ -75,14 +291,22 @@ def check_filenames(path,filenames_list,prefix,bucket_name):
         filenames_list=[filenames_list]  
     filenames_remove = []
     if path[:5] == 's3://':
+        s3c = _get_s3_client()
+        keys = sorted({prefix+filename for filename in filenames_list})
+        if method == 'head' or (method == 'auto' and len(keys) <= _EXISTS_HEAD_THRESHOLD):
+            missing = _head_missing_keys(s3c,bucket_name,keys)
+        elif method in ('auto','list'):
+            shards = _shard_prefixes(keys)
+            workers = min(len(shards), _s3_pool_settings['max_pool_connections'])
+            with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                results = executor.map(lambda shard: _list_missing_keys(s3c,bucket_name,shard[0],shard[1]), shards.items())
+                missing = set().union(*results)
+        else:
+            raise ValueError('Unknown method {}! Use "auto", "list" or "head".'.format(method))
         for filename in filenames_list:
-            try:
-                s3c, s3r = generate_s3_session()
-                s3r.Object(bucket_name, prefix+filename).load()
-            except botocore.exceptions.ClientError as e:
-                if e.response['Error']['Code'] == "404":
-                    logger.warning("{}{}".format(filename,' does not exsist!'))
-                    filenames_remove.append(filename)
+            if prefix+filename in missing:
+                logger.warning("{}{}".format(filename,' does not exsist!'))
+                filenames_remove.append(filename)
     else:
         for filename in filenames_list:
             if not os.path.exists(os.path.join(path,filename)):
@@ -90,12 +314,15 @@ def check_filenames(path,filenames_list,prefix,bucket_name):
                 filenames_remove.append(filename)
     return filenames_remove
 
-def get_filenames(input_path,filenames_list=None,file_types=None):
+def get_filenames(input_path,filenames_list=None,file_types=None,use_index=False,index_max_age=None):
     """Looking for files in a given path. Checks files if a list of filenames is given
     Args:
         input_path (str): Path where to look for files
         filenames_list ([type]): Filenames to check if they exists
         file_types ([type]): File types to be filtered e.g. ".fth" , ".pckl"
+        use_index (bool): Lists s3 prefixes through the shared listing index, which is refreshed incrementally instead of listing the whole prefix.
+                          Objects deleted by other clients are listed until the next full scan of the index after index_max_age.
+        index_max_age (float): Seconds after which the listing index does a full scan. Defaults to one hour for a new index.
     Returns:
         [list[str]]: List of filenames
     """    
@@ -108,8 +335,14 @@ def get_filenames(input_path,filenames_list=None,file_types=None):
         if filenames_list:
             filenames_remove = check_filenames(input_path,filenames_list,prefix,bucket_name)
             filenames = filenames_list
+        elif use_index:
+            from .listing import get_listing_index
+            index = get_listing_index('s3://'+bucket_name+'/'+prefix,max_age=index_max_age)
+            index.refresh()
+            filenames = [key[key.rfind('/')+1:] for key in index.table['key'].to_pylist()]
+            filenames = [filename for filename in filenames if not filename == '']
         else: #Looking for Keys in the given Bucket that include the prefix
-            s3c, s3r = generate_s3_session()
+            s3c = _get_s3_client()
             paginator = s3c.get_paginator('list_objects_v2')
             pages = paginator.paginate(Bucket=bucket_name,Prefix=prefix,)
             for page in pages:
@@ -128,119 +361,332 @@ def get_filenames(input_path,filenames_list=None,file_types=None):
             for root, dirs, files in os.walk(input_path):
                 for file in files:
                         filenames.append(file)
+    filenames_remove = set(filenames_remove)
     if file_types:
-        for filename in filenames:
-            if  filename[filename.rfind('.'):] not in file_types:
-                filenames_remove.append(filename)
-    for filename in filenames_remove:
-        filenames.remove(filename)
+        file_types = set([file_types] if type(file_types)==str else file_types)
+        filenames = [filename for filename in filenames if filename[filename.rfind('.'):] in file_types]
+    filenames = [filename for filename in filenames if filename not in filenames_remove]
     logger.info('{}{}'.format('Returning filenames: ',filenames))
     return filenames
  
-def _get_file_handle(path,filename):
+def _get_file_handle(path,filename,create_dirs=True):
     """Editing the path for read and write functions
     Args:
         path (str): Path to the file for reading or path for writing files
         filename (list[str]): file that will be read or will be written to the path
+        create_dirs (bool): Create missing local directories. Not needed for reading.
     Returns:
         [str]: Full path that includes the filename and a correct syntax for reading and writing functions
     """    
     if path[:5] == 's3://':
         if path.endswith('/') or filename.startswith('/'):
-            path = 's3://'+os.environ['S3_ENDPOINT']+'@'+path[5:]+filename
+            path = 's3://'+_endpoint_host()+'@'+path[5:]+filename
         else:
-            path = 's3://'+os.environ['S3_ENDPOINT']+'@'+path[5:]+'/'+filename
+            path = 's3://'+_endpoint_host()+'@'+path[5:]+'/'+filename
     else:
-        os.makedirs(path, exist_ok=True)
+        if create_dirs:
+            os.makedirs(path, exist_ok=True)
         path = os.path.join(path,filename)
     return path
 
-def read_pd_fth(input_path,filename,columns=None,col_limit=None):
-    """Reads feather file from path and returns a pandas dataframe
+def _transport_params(savepath):
+    """Builds the smart_open transport parameters for a path from _get_file_handle. Only s3 paths need the shared client.
+    Args:
+        savepath (str): Path from _get_file_handle
+    Returns:
+        [dict]: Transport parameters
+    """
+    if savepath[:5] == 's3://':
+        return {'client': _get_s3_client()}
+    return {}
+
+def _is_not_found(error):
+    """Checks if an exception or one of its causes reports a missing s3 object or local file
+    Args:
+        error (Exception): Exception raised while opening a file
+    Returns:
+        [bool]: True if the file does not exist
+    """
+    while error is not None:
+        if isinstance(error, FileNotFoundError):
+            return True
+        if isinstance(error, botocore.exceptions.ClientError) and error.response['Error']['Code'] in ('404','NoSuchKey','NoSuchBucket','NotFound'):
+            return True
+        error = error.__cause__ or error.__context__
+    return False
+
+@contextlib.contextmanager
+def _open_input(input_path,filename,mode,check_exists=False,parallel=False,pointers=False):
+    """Opens a file for the read functions.
+    By default the file is opened directly and a missing file is detected from the error of the open call, which saves one request compared to checking first.
+    Args:
+        input_path (str): Path to the file to read
+        filename (str): Filename of the file to read
+        mode (str): "r" or "rb"
+        check_exists (bool): Check if the file exists with get_filenames before opening it
+        parallel (bool): Download s3 objects with parallel ranged requests into a buffer (see configure_parallel_reads) instead of streaming them
+        pointers (bool): Open the blob instead if the file is a pointer written with dedup=True
+    Raises:
+        ValueError: When file or filepath do not exsist
+    Returns:
+        File object
+    """
+    if check_exists and not get_filenames(input_path,filenames_list=filename):
+        raise ValueError('Input path or filename does not exist!')
+    savepath = _get_file_handle(input_path,filename,create_dirs=False)
+    downloaded = False
+    try:
+        with metrics.network():
+            if input_path[:5] == 's3://' and cache.cache_enabled():
+                bucket_name, prefix, path = generate_s3_strings(input_path)
+                infile = cache.open_cached(_get_s3_client(),bucket_name,prefix+filename,open,mode)
+            elif parallel and input_path[:5] == 's3://' and parallel_reads_enabled():
+                bucket_name, prefix, path = generate_s3_strings(input_path)
+                infile = download_buffer(_get_s3_client(),bucket_name,prefix+filename)
+                downloaded = True
+            else:
+                infile = smart_open.open(savepath,mode, transport_params=_transport_params(savepath))
+    except Exception as e:
+        if _is_not_found(e):
+            raise ValueError('Input path or filename does not exist!') from e
+        raise
+    if pointers:
+        from .dedup import read_pointer, split_blob_path
+        infile, pointer = read_pointer(infile)
+        if pointer is not None:
+            infile.close()
+            blob_path, blob_name = split_blob_path(pointer)
+            with _open_input(blob_path,blob_name,mode,parallel=parallel) as infile:
+                yield infile
+            return
+    if downloaded:
+        # download_buffer already counted the bytes and the download time, reading the buffer is no network access
+        with infile:
+            yield infile
+        return
+    with metrics.timed_file(infile) as infile:
+        yield infile
+
+@contextlib.contextmanager
+def _open_output(output_path,filename,dedup=False):
+    """Opens a file for the binary write functions
+    Args:
+        output_path (str): Path to the file to write
+        filename (str): Filename of the file to write
+        dedup (bool): Write s3 objects content addressed with dedup.blob_writer. Ignored for local paths.
+    Yields:
+        File object opened for binary writing
+    """
+    savepath = _get_file_handle(output_path,filename)
+    if dedup and output_path[:5] == 's3://':
+        from .dedup import blob_writer
+        with blob_writer(output_path,filename) as outfile:
+            yield outfile
+        return
+    with metrics.timed_file(smart_open.open(savepath,'wb', transport_params=_transport_params(savepath))) as outfile:
+        yield outfile
+
+def _open_random_access(input_path,filename,read_ahead=None,check_exists=False,memory_map=False):
+    """Opens a file for random access (feather, parquet). s3 objects are read with ranged GET requests, so only the needed parts are downloaded.
+    Args:
+        input_path (str): Path to the file to read
+        filename (str): Filename of the file to read
+        read_ahead (int): Minimum amount of bytes fetched per s3 request of small and sequential reads. Nearby reads are coalesced within this range.
+        check_exists (bool): Check if the file exists before opening it
+        memory_map (bool): Memory map local files and cached s3 objects instead of reading them
+    Raises:
+        ValueError: When file or filepath do not exsist
+    Returns:
+        Source for pyarrow.ipc.open_file or pyarrow.parquet.ParquetFile
+    """
+    if check_exists and not get_filenames(input_path,filenames_list=filename):
+        raise ValueError('Input path or filename does not exist!')
+    if input_path[:5] == 's3://':
+        bucket_name, prefix, path = generate_s3_strings(input_path)
+        try:
+            if cache.cache_enabled():
+                # The copy is opened right away, so it stays readable if another process evicts it
+                return cache.open_cached(_get_s3_client(),bucket_name,prefix+filename,pyarrow.memory_map if memory_map else pyarrow.OSFile)
+            return pyarrow.PythonFile(S3RangeFile(_get_s3_client(),bucket_name,prefix+filename,read_ahead or DEFAULT_READ_AHEAD),mode='r')
+        except botocore.exceptions.ClientError as e:
+            if _is_not_found(e):
+                raise ValueError('Input path or filename does not exist!') from e
+            raise
+    path = os.path.join(input_path,filename)
+    if not os.path.isfile(path):
+        raise ValueError('Input path or filename does not exist!')
+    if memory_map:
+        return pyarrow.memory_map(path)
+    return path
+
+def _arrow_source(infile):
+    """Returns the source for pyarrow readers for a file from _open_input. Downloaded buffers are passed without copying them,
+    so the columns of uncompressed feather files reference the downloaded buffer.
+    Args:
+        infile (file object): File from _open_input
+    Returns:
+        pyarrow.BufferReader or the file object
+    """
+    if hasattr(infile, 'getbuffer'):
+        return pyarrow.BufferReader(pyarrow.py_buffer(infile.getbuffer()))
+    return infile
+
+def _read_fth_selection(source,columns=None,batches=None,rows=None):
+    """Reads selected columns, record batches and rows from a feather (Arrow IPC) file.
+    Only the buffers of the selected columns in the selected record batches are read. Batches behind the end of the row range are not read.
+    Args:
+        source: Source for pyarrow.ipc.open_file
+        columns (list[str]): Columns to read. If not provided, all columns are read.
+        batches (list[int]): Indices of the record batches to read. If not provided, all batches are read.
+        rows (tuple(int, int)): Start and stop of the rows to read, counted over the selected batches
+    Returns:
+        [pyarrow.Table]: Selected part of the file
+    """
+    reader = pyarrow.ipc.open_file(source)
+    if columns:
+        missing = [column for column in columns if column not in reader.schema.names]
+        if missing:
+            raise ValueError('Columns {} do not exist!'.format(missing))
+        options = pyarrow.ipc.IpcReadOptions(included_fields=sorted(reader.schema.names.index(column) for column in columns))
+        reader = pyarrow.ipc.open_file(source,options=options)
+    if batches is None:
+        batches = range(reader.num_record_batches)
+    start, stop = rows if rows else (0, None)
+    selected = []
+    offset = 0
+    first_offset = None
+    for index in batches:
+        if stop is not None and offset >= stop:
+            break
+        batch = reader.get_batch(index)
+        if offset + batch.num_rows > start:
+            if first_offset is None:
+                first_offset = offset
+            selected.append(batch)
+        offset += batch.num_rows
+    table = pyarrow.Table.from_batches(selected,schema=reader.schema)
+    if rows:
+        first_offset = first_offset or 0
+        length = None if stop is None else max(stop - max(start, first_offset), 0)
+        table = table.slice(max(start - first_offset, 0), length)
+    if columns:
+        table = table.select(columns)
+    return table
+
+@metrics.instrument
+def read_arrow_fth(input_path,filename,columns=None,batches=None,rows=None,read_ahead=None,check_exists=False,memory_map=False):
+    """Reads feather file from path and returns a pyarrow Table.
+    When columns, batches or rows are selected, s3 objects are read with ranged GET requests and only the footer and the selected column buffers are downloaded.
+    With memory_map local files and cached s3 objects are memory mapped instead of read, so the table of an uncompressed file references the file pages without copying them.
     Args:
         input_path (str): Path to the file to read
         filename (str): Filename of the file to read
         columns (list[str]): If not provided, all columns are read.
+        batches (list[int]): Indices of the record batches to read. If not provided, all batches are read.
+        rows (tuple(int, int)): Start and stop of the rows to read.
+        read_ahead (int): Minimum amount of bytes fetched per s3 request of small and sequential reads. Reads of neighbouring column buffers are coalesced within this range.
+        check_exists (bool): Check if the file exists before opening it. Costs one extra request, by default a missing file is detected on open.
+        memory_map (bool): Memory map local files and cached s3 objects. Compressed files are still decompressed into memory.
+    Returns:
+        [pyarrow.Table]: Arrow Table
+    """
+    if columns and type(columns) != list:
+        columns = [columns]
+    memory_map = memory_map and (input_path[:5] != 's3://' or cache.cache_enabled())
+    logger.info('----Download started: {} ----'.format(filename))
+    if columns or batches is not None or rows or memory_map:
+        table = _read_fth_selection(_open_random_access(input_path,filename,read_ahead,check_exists,memory_map),columns,batches,rows)
+    else:
+        with _open_input(input_path,filename,'rb',check_exists,parallel=True) as infile:
+            table = pyarrow.feather.read_table(_arrow_source(infile))
+    logger.info('----Download finished: {} ----'.format(filename))
+    return table
+
+@metrics.instrument
+def read_pd_fth(input_path,filename,columns=None,col_limit=None,check_exists=False,batches=None,rows=None,memory_map=False):
+    """Reads feather file from path and returns a pandas dataframe
+    Args:
+        input_path (str): Path to the file to read
+        filename (str): Filename of the file to read
+        columns (list[str]): If not provided, all columns are read. On s3 only the selected columns are downloaded.
         col_limit (int): Use col_limit to check if the amount of columns is not higher than col_limit!
+        check_exists (bool): Check if the file exists before opening it. Costs one extra request, by default a missing file is detected on open.
+        batches (list[int]): Indices of the record batches to read. If not provided, all batches are read.
+        rows (tuple(int, int)): Start and stop of the rows to read.
+        memory_map (bool): Memory map local files and cached s3 objects. Columns without missing values of uncompressed files with a single record batch reference the mapped file instead of being copied.
     Returns:
         [pandas.DataFrame]: Pandas Dataframe
     """    
-    if not get_filenames(input_path,filenames_list=filename):
-        raise ValueError('Input path or filename does not exist!')
     if columns and type(columns) != list:
         columns = [columns]
-    savepath = _get_file_handle(input_path,filename)
-    logger.info('----Download started: {} ----'.format(filename))
-    s3c, s3r = generate_s3_session()
-    with smart_open.open(savepath,'rb', transport_params={'client': s3c}) as infile: 
-        pandas_file =  pd.read_feather(infile,columns)
+    if memory_map and (input_path[:5] != 's3://' or cache.cache_enabled()):
+        pandas_file = read_arrow_fth(input_path,filename,columns,batches,rows,check_exists=check_exists,memory_map=True).to_pandas(split_blocks=True)
+    elif (columns and input_path[:5] == 's3://') or batches is not None or rows:
+        pandas_file = read_arrow_fth(input_path,filename,columns,batches,rows,check_exists=check_exists).to_pandas()
+    else:
+        logger.info('----Download started: {} ----'.format(filename))
+        with _open_input(input_path,filename,'rb',check_exists,parallel=True) as infile:
+            pandas_file =  pd.read_feather(_arrow_source(infile),columns)
+        logger.info('----Download finished: {} ----'.format(filename))
     if 'index' in pandas_file.columns:
         pandas_file.drop(columns=['index'], inplace=True)
         logger.info('Dropped column index on import from file {}. If this is unintentional rename column in file.'.format(filename))
-    logger.info('----Download finished: {} ----'.format(filename))
-    pandas_file.reset_index()
     if col_limit:
         assert pandas_file.shape[1] <= int(col_limit), 'Amount of columns is higher than the provided limit of columns. Use col_limit when only a specified amount of columns is allowed for further execution!'
     return pandas_file
 
-def read_pckl(input_path,filename):
+@metrics.instrument
+def read_pckl(input_path,filename,check_exists=False):
     """Reads pickle file from path and returns the pickled object
     Args:
         input_path (str): Path to the file to read
         filename (str): Filename of the file to read
+        check_exists (bool): Check if the file exists before opening it. Costs one extra request, by default a missing file is detected on open.
     Returns:
         Can be everything that is pickleable
     """     
-    if not get_filenames(input_path,filenames_list=filename):
-        raise ValueError('Input path or filename does not exist!')
-    savepath = _get_file_handle(input_path,filename)
     logger.info('----Download started: {} ----'.format(filename))
-    s3c, s3r = generate_s3_session()
-    with smart_open.open(savepath,'rb', transport_params={'client': s3c}) as infile: 
-        pickle_file =  pickle.load(infile)
+    with _open_input(input_path,filename,'rb',check_exists,parallel=True,pointers=True) as infile:
+        pickle_file =  serialization.load_pickle(infile)
     logger.info('----Download finished: {} ----'.format(filename))
     return pickle_file
 
-def read_dill(input_path,filename):
+@metrics.instrument
+def read_dill(input_path,filename,check_exists=False):
     """Reads dill file from path and returns the serialized object
     Args:
         input_path (str): Path to the file to read
         filename (str): Filename of the file to read
+        check_exists (bool): Check if the file exists before opening it. Costs one extra request, by default a missing file is detected on open.
     Returns:
         Can be everything that can be serialized with dill
     """     
-    if not get_filenames(input_path,filenames_list=filename):
-        raise ValueError('Input path or filename does not exist!')
-    savepath = _get_file_handle(input_path,filename)
     logger.info('----Download started: {} ----'.format(filename))
-    s3c, s3r = generate_s3_session()
-    with smart_open.open(savepath,'rb', transport_params={'client': s3c}) as infile: 
-        dill_file =  dill.load(infile)
+    with _open_input(input_path,filename,'rb',check_exists,parallel=True,pointers=True) as infile:
+        dill_file =  serialization.load_pickle(infile,dill.loads,dill.load)
     logger.info('----Download finished: {} ----'.format(filename))
     return dill_file
 
-def read_joblib(input_path, filename):
+@metrics.instrument
+def read_joblib(input_path, filename,check_exists=False):
     """Reads joblib file from path and returns the joblib object
     Args:
         input_path (str): Path to the file to read
         filename (str): Filename of the file to read
+        check_exists (bool): Check if the file exists before opening it. Costs one extra request, by default a missing file is detected on open.
     Returns:
         Can be everything that is pickleable.
     """ 
-    if not get_filenames(input_path,filenames_list=filename):
-        raise ValueError('Input path or filename does not exist!')
 
-    savepath = _get_file_handle(input_path,filename)
     logger.info('----Download started: {} ----'.format(filename))
-    s3c, s3r = generate_s3_session()
-
-    with smart_open.open(savepath,'rb', transport_params={'client': s3c}) as infile: 
-        joblib_file =  joblib.load(infile)
+    with _open_input(input_path,filename,'rb',check_exists,parallel=True,pointers=True) as infile:
+        joblib_file =  joblib.load(serialization.decompressed_reader(infile)[0])
 
     logger.info('----Download finished: {} ----'.format(filename))
 
     return joblib_file
 
+@metrics.instrument
 def to_pd_fth(output_path,filename,dataframe):
     """Writes a pandas Dataframe to a given path as feather file.
     Args:
@@ -250,104 +696,225 @@ def to_pd_fth(output_path,filename,dataframe):
     """    
     savepath = _get_file_handle(output_path,filename)
     logger.info('----Upload started: {} ----'.format(filename))
-    dataframe.reset_index()
     arrow_table = pyarrow.Table.from_pandas(dataframe,preserve_index=False)
-    s3c, s3r = generate_s3_session()
-    with smart_open.open(savepath,'wb', transport_params={'client': s3c}) as outfile: 
+    with metrics.timed_file(smart_open.open(savepath,'wb', transport_params=_transport_params(savepath))) as outfile: 
         pyarrow.feather.write_feather(arrow_table,outfile)
     logger.info('----Upload finished: {} ----'.format(filename))
 
-def to_pckl(output_path,filename,data):
+_STREAM_END = object()
+_STREAM_ABORT = object()
+
+def _to_record_batches(chunk,schema=None):
+    """Converts a chunk for the streaming feather writer
+    Args:
+        chunk (pandas.DataFrame, pyarrow.RecordBatch or pyarrow.Table): Chunk to convert
+        schema (pyarrow.Schema): Schema of the file. If not provided, the schema of the chunk is used.
+    Returns:
+        [list[pyarrow.RecordBatch]]: Record batches of the chunk
+    """
+    if isinstance(chunk, pd.DataFrame):
+        chunk = pyarrow.Table.from_pandas(chunk,schema=schema,preserve_index=False)
+    elif isinstance(chunk, pyarrow.RecordBatch):
+        chunk = pyarrow.Table.from_batches([chunk])
+    if schema is not None and not chunk.schema.equals(schema):
+        chunk = chunk.cast(schema)
+    return chunk.to_batches()
+
+@contextlib.contextmanager
+def open_fth_writer(output_path,filename,schema=None,compression='lz4',queue_size=2,min_part_size=None):
+    """Opens a streaming feather writer. Every written chunk is encoded as Arrow IPC record batch and uploaded in a background thread,
+    so multipart upload parts are sent while the next chunks are still produced. Peak memory is bounded by queue_size chunks plus the upload part buffer.
+    Args:
+        output_path (str): Path to the file to write.
+        filename (str): Filename of the file to write.
+        schema (pyarrow.Schema): Schema of the file. If not provided, the schema of the first chunk is used.
+        compression (str): Compression of the record batches: "lz4", "zstd" or None
+        queue_size (int): Number of chunks that can wait for the upload
+        min_part_size (int): Size of the multipart upload parts in bytes (s3 only)
+    Yields:
+        [callable]: write(chunk) function that takes a pandas DataFrame, pyarrow RecordBatch or pyarrow Table
+    """
+    savepath = _get_file_handle(output_path,filename)
+    transport_params = _transport_params(savepath)
+    if min_part_size and transport_params:
+        transport_params['min_part_size'] = min_part_size
+    chunks = queue.Queue(maxsize=queue_size)
+    errors = []
+    operation = metrics.current()
+    finished = threading.Event()
+
+    def _upload():
+        try:
+            with metrics.attached(operation), metrics.timed_file(smart_open.open(savepath,'wb', transport_params=transport_params),operation) as outfile:
+                file_schema = schema
+                writer = None
+                while True:
+                    chunk = chunks.get()
+                    if chunk is _STREAM_END or chunk is _STREAM_ABORT:
+                        finished.set()
+                    if chunk is _STREAM_END:
+                        break
+                    if chunk is _STREAM_ABORT:
+                        raise RuntimeError('Streaming upload of {} was aborted'.format(filename))
+                    batches = _to_record_batches(chunk,file_schema)
+                    if writer is None:
+                        file_schema = file_schema or batches[0].schema
+                        writer = pyarrow.ipc.new_file(outfile,file_schema,options=pyarrow.ipc.IpcWriteOptions(compression=compression))
+                    for batch in batches:
+                        writer.write_batch(batch)
+                if writer is None:
+                    writer = pyarrow.ipc.new_file(outfile,file_schema or pyarrow.schema([]),options=pyarrow.ipc.IpcWriteOptions(compression=compression))
+                writer.close()
+        except BaseException as e:
+            errors.append(e)
+            while not finished.is_set():
+                chunk = chunks.get()
+                if chunk is _STREAM_END or chunk is _STREAM_ABORT:
+                    finished.set()
+
+    def write(chunk):
+        if errors:
+            raise errors[0]
+        chunks.put(chunk)
+
+    logger.info('----Upload started: {} ----'.format(filename))
+    thread = threading.Thread(target=_upload,name='fth-writer-{}'.format(filename),daemon=True)
+    thread.start()
+    try:
+        yield write
+    except BaseException:
+        chunks.put(_STREAM_ABORT)
+        thread.join()
+        raise
+    chunks.put(_STREAM_END)
+    thread.join()
+    if errors:
+        raise errors[0]
+    logger.info('----Upload finished: {} ----'.format(filename))
+
+@metrics.instrument
+def to_pd_fth_chunks(output_path,filename,chunks,schema=None,compression='lz4',queue_size=2,min_part_size=None):
+    """Writes chunks of a pandas Dataframe to a given path as one feather file without materializing the whole Dataframe.
+    Args:
+        output_path (str): Path to the file to write.
+        filename (str): Filename of the file to write.
+        chunks (iterable): pandas DataFrames, pyarrow RecordBatches or pyarrow Tables with the same columns
+        schema (pyarrow.Schema): Schema of the file. If not provided, the schema of the first chunk is used.
+        compression (str): Compression of the record batches: "lz4", "zstd" or None
+        queue_size (int): Number of chunks that can wait for the upload
+        min_part_size (int): Size of the multipart upload parts in bytes (s3 only)
+    """
+    with open_fth_writer(output_path,filename,schema,compression,queue_size,min_part_size) as write:
+        for chunk in chunks:
+            write(chunk)
+
+@metrics.instrument
+def to_pckl(output_path,filename,data,compression=None,protocol=None,dedup=False):
     """Writes an object to a given path as pickle file.
     Args:
         output_path (str): Path to the file to write.
         filename (str): Filename of the file to write.
         data (anything): Could be anything that is pickleable.
+        compression (str): Compress the file with "zstd", "lz4" or "gzip". Readers detect the compression automatically.
+        protocol (int): Pickle protocol. With protocol 5 large buffers like NumPy arrays are written out-of-band without copying them into the pickle.
+        dedup (bool): Store the content on s3 once by its hash and write a pointer to it. The upload is skipped if the content exists already.
     """      
-    savepath = _get_file_handle(output_path,filename)
     logger.info('----Upload started: {} ----'.format(filename))
-    s3c, s3r = generate_s3_session()
-    with smart_open.open(savepath,'wb', transport_params={'client': s3c}) as outfile: 
-        pickle.dump(data,outfile)
+    with _open_output(output_path,filename,dedup) as outfile: 
+        with serialization.compressed_writer(outfile,compression) as stream:
+            serialization.dump_pickle(data,stream,protocol)
     logger.info('----Upload finished: {} ----'.format(filename))
 
-def to_dill(output_path,filename,data):
+@metrics.instrument
+def to_dill(output_path,filename,data,compression=None,dedup=False):
     """Writes an object to a given path as dill file.
     Args:
         output_path (str): Path to the file to write.
         filename (str): Filename of the file to write.
         data (anything): Could be anything that can be serialized with dill.
+        compression (str): Compress the file with "zstd", "lz4" or "gzip". Readers detect the compression automatically.
+        dedup (bool): Store the content on s3 once by its hash and write a pointer to it. The upload is skipped if the content exists already.
     """      
-    savepath = _get_file_handle(output_path,filename)
     logger.info('----Upload started: {} ----'.format(filename))
-    s3c, s3r = generate_s3_session()
-    with smart_open.open(savepath,'wb', transport_params={'client': s3c}) as outfile: 
-        dill.dump(data,outfile)
+    with _open_output(output_path,filename,dedup) as outfile: 
+        with serialization.compressed_writer(outfile,compression) as stream:
+            dill.dump(data,stream)
     logger.info('----Upload finished: {} ----'.format(filename))
 
-def to_joblib(output_path, filename, data):
+@metrics.instrument
+def to_joblib(output_path, filename, data, compression=None, dedup=False):
     """Writes an object to a given path as joblib file.
     Args:
         output_path (str): Path to the file to write.
         filename (str): Filename of the file to write.
         data (anything): Could be anything that is pickleable.
+        compression (str): Compress the file with "zstd", "lz4" or "gzip". Readers detect the compression automatically.
+        dedup (bool): Store the content on s3 once by its hash and write a pointer to it. The upload is skipped if the content exists already.
     """      
-    savepath = _get_file_handle(output_path,filename)
     logger.info('----Upload started: {} ----'.format(filename))
-    s3c, s3r = generate_s3_session()
-
-    with smart_open.open(savepath,'wb', transport_params={'client': s3c}) as outfile: 
-        joblib.dump(data, outfile)
+    with _open_output(output_path,filename,dedup) as outfile: 
+        with serialization.compressed_writer(outfile,compression) as stream:
+            joblib.dump(data, stream)
         
     logger.info('----Upload finished: {} ----'.format(filename))
 
 
-def to_s3(output_path,filename,data):
+@metrics.instrument
+def to_s3(output_path,filename,data,resumable=False,checksum='md5'):
     """Uploads a given object to s3 storage.
     Args:
         output_path (str): Path to s3 storage
         filename (str): The object will be save with this filename
         data (anything): Object that will be uploaded to the s3 storage
+        resumable (bool): Upload with transfer.resumable_upload, which continues an interrupted upload and verifies the parts with checksums
+        checksum (str): Checksum of the parts for resumable uploads: "md5", "crc32" or "crc32c"
     """    
     bucket_name, prefix, path = generate_s3_strings(output_path)
-    s3c, s3r = generate_s3_session()
+    s3c = _get_s3_client()
     try:
-        response = s3c.upload_file(data, bucket_name, prefix+filename)
+        if resumable:
+            from .transfer import resumable_upload
+            resumable_upload(output_path,filename,data,checksum=checksum)
+            return
+        with metrics.network():
+            s3c.upload_file(data, bucket_name, prefix+filename, Config=_get_transfer_config())
+        metrics.count(bytes=os.path.getsize(data))
     except botocore.exceptions.ClientError as e:
         logger.error(e)
     
-def to_json(output_path,filename,data):
-    """Uploads a given object as json file to s3 storage
+@metrics.instrument
+def to_json(output_path,filename,data,compression=None):
+    """Uploads a given object as json file to s3 storage. Uses orjson for encoding if it is installed.
     Args:
         output_path (str): Path to s3 storage
         filename (str): The object will be save with this filename
         data (anything): Object that will be uploaded to the s3 storage
+        compression (str): Compress the file with "zstd", "lz4" or "gzip". Readers detect the compression automatically.
     """    
     savepath = _get_file_handle(output_path,filename)
     logger.info('----Upload started: {} ----'.format(filename))
-    s3c, s3r = generate_s3_session()
-    with smart_open.open(savepath,'w', transport_params={'client': s3c}) as outfile: 
-        json.dump(data,outfile)
+    with metrics.timed_file(smart_open.open(savepath,'wb', transport_params=_transport_params(savepath))) as outfile: 
+        with serialization.compressed_writer(outfile,compression) as stream:
+            stream.write(serialization.dumps_json(data))
     logger.info('----Upload finished: {} ----'.format(filename))
 
-def read_json(input_path,filename):
+@metrics.instrument
+def read_json(input_path,filename,check_exists=False):
     """Reads json file from path and returns json content
     Args:
         input_path (str): Path to the file to read
         filename (str): Filename of the file to read
+        check_exists (bool): Check if the file exists before opening it. Costs one extra request, by default a missing file is detected on open.
     Returns:
         Json content
     """     
-    if not get_filenames(input_path,filenames_list=filename):
-        raise ValueError('Input path or filename does not exist!')
-    savepath = _get_file_handle(input_path,filename)
     logger.info('----Download started: {} ----'.format(filename))
-    s3c, s3r = generate_s3_session()
-    with smart_open.open(savepath,'r', transport_params={'client': s3c}) as infile: 
-        json_file =  json.load(infile)
+    with _open_input(input_path,filename,'rb',check_exists) as infile:
+        json_file =  serialization.loads_json(serialization.decompressed_reader(infile)[0].read())
     logger.info('----Download finished: {} ----'.format(filename))
     return json_file
 
+@metrics.instrument
 def to_txt(output_path,filename,data):
     """Uploads a string as txt file to s3 storagee
     Args:
@@ -357,112 +924,393 @@ def to_txt(output_path,filename,data):
     """    
     savepath = _get_file_handle(output_path,filename)
     logger.info('----Upload started: {} ----'.format(filename))
-    s3c, s3r = generate_s3_session()
-    with smart_open.open(savepath,'w', transport_params={'client': s3c}) as outfile: 
+    with metrics.timed_file(smart_open.open(savepath,'w', transport_params=_transport_params(savepath))) as outfile: 
         outfile.write(data)
     logger.info('----Upload finished: {} ----'.format(filename))
 
-def read_txt(input_path, filename):
+@metrics.instrument
+def read_txt(input_path, filename,check_exists=False):
     """Reads a txt file.
     Args:
         input_path (str): Path to the file to read
         filename (str): Filename of the file to read
+        check_exists (bool): Check if the file exists before opening it. Costs one extra request, by default a missing file is detected on open.
     Raises:
         ValueError: When file or filepath do not exsist
     Returns:
         [str]: txt file content
     """    
-    if not get_filenames(input_path,filenames_list=filename):
-        raise ValueError('Input path or filename does not exist!')
-    savepath = _get_file_handle(input_path,filename)
     logger.info('----Download started: {} ----'.format(filename))
-    s3c, s3r = generate_s3_session()
-    with smart_open.open(savepath,'r', transport_params={'client': s3c}) as infile: 
+    with _open_input(input_path,filename,'r',check_exists) as infile:
         txt_file =  infile.read()
     logger.info('----Download finished: {} ----'.format(filename))
     return txt_file
 
-def from_s3(input_path,filename,output_path=None):
+@metrics.instrument
+def from_s3(input_path,filename,output_path=None,resumable=False):
     """Downloads a given object from s3 storage to local disk
     Args:
         input_path (str): Path to s3 storage, ! without filename !
         filename (str): Name of the Object in the s3 storage.
         output_path (str): Path where object will be saved on local disk
+        resumable (bool): Download with transfer.resumable_download, which continues an interrupted download and verifies the file against the ETag or checksum
     """    
     bucket_name, prefix, path = generate_s3_strings(input_path)
-    s3c, s3r = generate_s3_session()
+    s3c = _get_s3_client()
+    local_path = os.path.join(filename) if output_path == None else os.path.join(output_path,filename)
     try:
-        if output_path == None : 
-             s3c.download_file(bucket_name, prefix+filename,os.path.join(filename))
-        else: 
-            s3c.download_file(bucket_name, prefix+filename,os.path.join(output_path,filename))
+        if resumable:
+            from .transfer import resumable_download
+            resumable_download(input_path,filename,output_path)
+            return
+        with metrics.network():
+            s3c.download_file(bucket_name, prefix+filename,local_path, Config=_get_transfer_config())
+        metrics.count(bytes=os.path.getsize(local_path))
     except botocore.exceptions.ClientError as e:
         logger.error(e)
 
-def local_directory_to_s3(input_path, output_path, directory_name):
+def _list_objects(s3c,bucket_name,prefix):
+    """Lists all objects below a prefix with their metadata
+    Args:
+        s3c (boto3 Client): Client used for the requests
+        bucket_name (str): Name of the bucket
+        prefix (str): Prefix to list
+    Returns:
+        [dict]: Object metadata (Size, ETag, LastModified) by key
+    """
+    objects = {}
+    paginator = s3c.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name,Prefix=prefix):
+        for obj in page.get('Contents', []):
+            objects[obj['Key']] = obj
+    return objects
+
+_MD5_ETAG = re.compile(r'^[0-9a-f]{32}(-[0-9]+)?$')
+
+def _local_etag(local_path,size,etag):
+    """Computes the ETag s3 would show for a local file, so it can be compared with the ETag of an object.
+    Multipart ETags can only be computed if the object was uploaded with the current multipart_chunksize.
+    ETags that are no MD5 digests (e.g. of other s3 compatible storages) are not computed.
+    Args:
+        local_path (str): Path to the local file
+        size (int): Size of the local file
+        etag (str): ETag of the s3 object
+    Returns:
+        [str]: ETag of the local file or None if it cannot be computed
+    """
+    if not _MD5_ETAG.match(etag):
+        return None
+    parts = etag.split('-')
+    chunksize = _transfer_settings['multipart_chunksize'] if len(parts) == 2 else max(size, 1)
+    if len(parts) == 2 and int(parts[1]) != max(1, -(-size // chunksize)):
+        return None
+    digests = []
+    with open(local_path, 'rb') as infile:
+        for chunk in iter(lambda: infile.read(chunksize), b''):
+            digests.append(hashlib.md5(chunk).digest())
+    if len(parts) == 1:
+        return digests[0].hex() if digests else hashlib.md5(b'').hexdigest()
+    return '{}-{}'.format(hashlib.md5(b''.join(digests)).hexdigest(), len(digests))
+
+def _is_unchanged(local_path,obj,upload):
+    """Compares a local file with a s3 object by size and ETag. If the ETag cannot be computed, size and modification times are compared.
+    Files with a different size are reported as changed without reading them.
+    Args:
+        local_path (str): Path to the local file
+        obj (dict): Metadata of the s3 object as returned by list_objects_v2
+        upload (bool): True if the local file is the source, False if the s3 object is the source
+    Returns:
+        [bool]: True if the file does not need to be transferred
+    """
+    stat = os.stat(local_path)
+    if stat.st_size != obj['Size']:
+        return False
+    etag = obj['ETag'].strip('"')
+    local_etag = _local_etag(local_path,stat.st_size,etag)
+    if local_etag is not None:
+        return local_etag == etag
+    remote_mtime = obj['LastModified'].timestamp()
+    return remote_mtime >= stat.st_mtime if upload else stat.st_mtime >= remote_mtime
+
+def _transfer_files(jobs,transfer,max_workers=None):
+    """Runs file transfers in parallel and summarizes them
+    Args:
+        jobs (list[tuple]): Relative path and the arguments for transfer of every file
+        transfer (callable): Transfers one file, returns the number of transferred bytes or None if the file was skipped
+        max_workers (int): Number of parallel transfers
+    Returns:
+        [dict]: Summary with transferred files and their durations in seconds, skipped files, failed files, bytes, seconds and bytes_per_second
+    """
+    def _timed(name, args):
+        started = time.perf_counter()
+        transferred = transfer(*args)
+        return transferred, time.perf_counter()-started
+    started = time.perf_counter()
+    summary = {'transferred': {}, 'skipped': [], 'failed': {}, 'bytes': 0}
+    for name, result, error in _run_many(_timed,jobs,max_workers):
+        if error is not None:
+            logger.error("Failed to transfer : {} ; Reason {}".format(name,error))
+            summary['failed'][name] = error
+        elif result[0] is None:
+            summary['skipped'].append(name)
+        else:
+            summary['transferred'][name] = result[1]
+            summary['bytes'] += result[0]
+    summary['seconds'] = time.perf_counter()-started
+    summary['bytes_per_second'] = summary['bytes']/summary['seconds'] if summary['seconds'] else 0.0
+    logger.info('Transferred {} files ({} bytes, {:.0f} bytes/s), skipped {}, failed {}'.format(
+        len(summary['transferred']),summary['bytes'],summary['bytes_per_second'],len(summary['skipped']),len(summary['failed'])))
+    return summary
+
+def local_directory_to_s3(input_path, output_path, directory_name, max_workers=None, skip_unchanged=True):
     """Upload a local directory to a s3 bucket.
 
     Args:
         input_path (str): Local path to the directory. Does not include the directory to upload itself.
         output_path (str): Path the to the s3 bucket+prefix where the directory should be uploaded to
         directory_name (str): name of the directory to upload.
+        max_workers (int): Number of files uploaded in parallel. Defaults to the size of the s3 connection pool.
+        skip_unchanged (bool): Do not upload files that already exist with the same size and ETag (or an older modification time).
+    Returns:
+        [dict]: Summary with transferred files and their durations in seconds, skipped files, failed files, bytes, seconds and bytes_per_second
     """    
     bucket_name, prefix, path = generate_s3_strings(output_path)
-    s3c, s3r = generate_s3_session()
+    s3c = _get_s3_client()
+    config = _get_transfer_config()
 
     local_directory = os.path.join(input_path, directory_name)
+    remote = _list_objects(s3c,bucket_name,prefix+directory_name+'/') if skip_unchanged else {}
 
+    def _upload(local_path, key):
+        if key in remote and _is_unchanged(local_path,remote[key],upload=True):
+            return None
+        s3c.upload_file(local_path, bucket_name, key, Config=config)
+        return os.path.getsize(local_path)
+
+    jobs = []
     for root, dirs, files in os.walk(local_directory):
         for filename in files:
             local_path = os.path.join(root, filename)
-            relative_path = os.path.relpath(local_path, local_directory)
-            s3_path = os.path.join(directory_name, relative_path)
+            relative_path = os.path.relpath(local_path, local_directory).replace(os.sep, '/')
+            s3_path = directory_name + '/' + relative_path
+            jobs.append((relative_path, (local_path, prefix + s3_path)))
+    return _transfer_files(jobs,_upload,max_workers)
 
-            try:
-                s3c.upload_file(local_path, bucket_name, prefix + s3_path)
-            except botocore.exceptions.ClientError as e:
-                logger.error(e)
+def s3_directory_to_local(input_path, output_path, directory_name, max_workers=None, skip_unchanged=True):
+    """Download a directory from a s3 bucket to local disk.
+
+    Args:
+        input_path (str): Path to the s3 bucket+prefix that contains the directory. Does not include the directory to download itself.
+        output_path (str): Local path where the directory will be saved to
+        directory_name (str): name of the directory to download.
+        max_workers (int): Number of files downloaded in parallel. Defaults to the size of the s3 connection pool.
+        skip_unchanged (bool): Do not download files that already exist locally with the same size and ETag (or a newer modification time).
+    Returns:
+        [dict]: Summary with transferred files and their durations in seconds, skipped files, failed files, bytes, seconds and bytes_per_second
+    """
+    bucket_name, prefix, path = generate_s3_strings(input_path)
+    s3c = _get_s3_client()
+    config = _get_transfer_config()
+
+    remote_directory = prefix + directory_name + '/'
+    local_directory = os.path.join(output_path, directory_name)
+
+    def _download(obj, local_path):
+        if skip_unchanged and os.path.exists(local_path) and _is_unchanged(local_path,obj,upload=False):
+            return None
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        s3c.download_file(bucket_name, obj['Key'], local_path, Config=config)
+        modified = obj['LastModified'].timestamp()
+        os.utime(local_path, (modified, modified))
+        return obj['Size']
+
+    jobs = []
+    for key, obj in _list_objects(s3c,bucket_name,remote_directory).items():
+        relative_path = key[len(remote_directory):]
+        if relative_path == '' or relative_path.endswith('/'):
+            continue
+        jobs.append((relative_path, (obj, os.path.join(local_directory, *relative_path.split('/')))))
+    return _transfer_files(jobs,_download,max_workers)
+
+_DELETE_BATCH_SIZE = 1000
+
+def _batches(iterable,size):
+    """Splits an iterable into lists of a given size
+    Args:
+        iterable (iterable): Items to split
+        size (int): Maximum length of each list
+    Yields:
+        [list]: Next batch of items
+    """
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
 def delete_s3_objects(path,filenames=None,file_types=None):
     """Delete a folder or objects inside a folder/bucket+key(s3) and optional in combination with given filenames and file types.
+    On s3 the prefix is listed once and the matching objects are deleted in concurrent batches of up to 1000 keys while the listing continues.
 
     Args:
         path (str): s3 path (s3://bucketname/key)
         filenames=None (list[str]): List of filenames that will be delete. When no filenames are given all files inside the the folder/key will be deleted.
         file_types=None (list[str]): When file type is not none only files with the given file types will be deleted.
+    Returns:
+        [dict]: Summary with the list of deleted keys or paths and the failed keys or paths mapped to the reason
     """        
+    summary = {'deleted': [], 'failed': {}}
+    if type(filenames)==str:
+        filenames=[filenames]
+    if type(file_types)==str:
+        file_types=[file_types]
     if path[:5] == 's3://':
-        sub_prefix = []
-        s3c, s3r = generate_s3_session()
+        s3c = _get_s3_client()
         bucket_name, main_prefix, tmp_path = generate_s3_strings(path)
-        paginator = s3c.get_paginator('list_objects_v2')
-        pages = paginator.paginate(Bucket=bucket_name,Prefix=main_prefix)
-
-        for page in pages:
-            if 'Contents' in page:
-                for obj in page['Contents']:
-                    prefix = obj['Key'][:obj['Key'].rfind('/')+1]
-                    if not prefix == '' and prefix not in sub_prefix:
-                        sub_prefix.append(prefix)
-        for sub_p in sub_prefix:
-            sub_path  = 's3://' + bucket_name + '/' + sub_p
-            filenames_to_delete = get_filenames(sub_path,filenames,file_types)
-            for f in filenames_to_delete:
-                try:
-                    s3r.Object(bucket_name, sub_p + f ).delete()
-                except botocore.exceptions.ClientError as e:
-                    if e.response['Error']['Code'] == "404":
-                        logger.warning("Failed to delete : {} ; Reason {}".format(f,e))
+        filenames = set(filenames) if filenames else None
+        file_types = set(file_types) if file_types else None
+
+        def _keys():
+            paginator = s3c.get_paginator('list_objects_v2')
+            for page in paginator.paginate(Bucket=bucket_name,Prefix=main_prefix):
+                for obj in page.get('Contents', []):
+                    filename = obj['Key'][obj['Key'].rfind('/')+1:]
+                    if filename == '' and (filenames or file_types):
+                        continue
+                    if filenames and filename not in filenames:
+                        continue
+                    if file_types and filename[filename.rfind('.'):] not in file_types:
+                        continue
+                    yield obj['Key']
+
+        def _delete(index, keys):
+            response = s3c.delete_objects(Bucket=bucket_name,Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True})
+            failed = {error['Key']: error.get('Message', error.get('Code')) for error in response.get('Errors', [])}
+            return [key for key in keys if key not in failed], failed
+
+        batches = enumerate(_batches(_keys(),_DELETE_BATCH_SIZE))
+        for index, result, error in _run_many(_delete,batches):
+            if error is not None:
+                logger.warning("Failed to delete batch {} ; Reason {}".format(index,error))
+                summary['failed']['batch {}'.format(index)] = error
+                continue
+            deleted, failed = result
+            summary['deleted'].extend(deleted)
+            for key, reason in failed.items():
+                logger.warning("Failed to delete : {} ; Reason {}".format(key,reason))
+            summary['failed'].update(failed)
+        from .listing import _discard
+        _discard(bucket_name,summary['deleted'])
     elif os.path.exists(path):
         if filenames == None:
             try:
                 shutil.rmtree(path)
+                summary['deleted'].append(path)
             except Exception as e:
-                logger.warning("Failed to delete : {} ; Reason {}".format(f,e))
+                logger.warning("Failed to delete : {} ; Reason {}".format(path,e))
+                summary['failed'][path] = e
         else:
             filenames = get_filenames(path,filenames,file_types)
             for f in filenames:
                 try:
                     os.remove(os.path.join(path,f))
+                    summary['deleted'].append(f)
                 except Exception as e:
                     logger.warning("Failed to delete : {} ; Reason {}".format(f,e))
+                    summary['failed'][f] = e
+    return summary
+
+def _run_many(function,items,max_workers=None,path=None):
+    """Runs function(key, value) for all items on a bounded thread pool and yields the results in completion order.
+    Only a limited number of items is submitted at once, so results that were already consumed can be freed.
+    Args:
+        function (callable): Function that is called with key and value of every item
+        items (iterable[tuple]): Pairs of key and value
+        max_workers (int): Number of threads. Defaults to the size of the s3 connection pool.
+        path (str): Path the items are read from or written to. For s3 paths the shared client is created before the threads start.
+    Yields:
+        [tuple]: key, result and the raised exception or None
+    """
+    if max_workers is None:
+        max_workers = _s3_pool_settings['max_pool_connections']
+    items = iter(items)
+    if path is not None and path[:5] == 's3://':
+        _get_s3_client()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        running = {}
+        for key, value in items:
+            running[executor.submit(function, key, value)] = key
+            if len(running) >= 2*max_workers:
+                break
+        while running:
+            done, pending = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                key = running.pop(future)
+                error = future.exception()
+                yield key, None if error else future.result(), error
+                next_item = next(items, None)
+                if next_item is not None:
+                    running[executor.submit(function, *next_item)] = next_item[0]
+
+def read_many_as_completed(input_path,filenames,reader=read_pckl,max_workers=None,**kwargs):
+    """Reads many files in parallel and yields them as soon as they are downloaded.
+    Args:
+        input_path (str): Path to the files to read
+        filenames (list[str]): Filenames of the files to read
+        reader (callable): read function that is used for every file e.g. read_pd_fth, read_pckl
+        max_workers (int): Number of parallel downloads. Defaults to the size of the s3 connection pool.
+        **kwargs: Further arguments passed to the reader
+    Yields:
+        [tuple]: filename, content of the file and the raised exception or None. Errors do not stop the other downloads.
+    """
+    if type(filenames)==str:
+        filenames=[filenames]
+    def read(filename, unused):
+        # The files are already downloaded in parallel, so the ranges of every file are fetched one after another
+        with sequential_ranges():
+            return reader(input_path,filename,**kwargs)
+
+    return _run_many(read,((filename, None) for filename in filenames),max_workers,input_path)
+
+def read_many(input_path,filenames,reader=read_pckl,max_workers=None,**kwargs):
+    """Reads many files in parallel.
+    Args:
+        input_path (str): Path to the files to read
+        filenames (list[str]): Filenames of the files to read
+        reader (callable): read function that is used for every file e.g. read_pd_fth, read_pckl
+        max_workers (int): Number of parallel downloads. Defaults to the size of the s3 connection pool.
+        **kwargs: Further arguments passed to the reader
+    Returns:
+        [tuple(dict, dict)]: Contents by filename and exceptions by filename of the files that could not be read
+    """
+    results = {}
+    errors = {}
+    for filename, data, error in read_many_as_completed(input_path,filenames,reader,max_workers,**kwargs):
+        if error is None:
+            results[filename] = data
+        else:
+            logger.warning("Failed to read : {} ; Reason {}".format(filename,error))
+            errors[filename] = error
+    return results, errors
+
+def to_many(output_path,data,writer=to_pckl,max_workers=None,**kwargs):
+    """Writes many objects in parallel.
+    Args:
+        output_path (str): Path to write the files to
+        data (dict): Objects to write by filename
+        writer (callable): write function that is used for every object e.g. to_pd_fth, to_pckl
+        max_workers (int): Number of parallel uploads. Defaults to the size of the s3 connection pool.
+        **kwargs: Further arguments passed to the writer
+    Returns:
+        [dict]: Exceptions by filename of the objects that could not be written
+    """
+    errors = {}
+    write = lambda filename, obj: writer(output_path,filename,obj,**kwargs)
+    for filename, _, error in _run_many(write,data.items(),max_workers,output_path):
+        if error is not None:
+            logger.warning("Failed to write : {} ; Reason {}".format(filename,error))
+            errors[filename] = error
+    return errors
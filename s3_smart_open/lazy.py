@@ -0,0 +1,57 @@
+# Copyright (c) 2022 RWTH Aachen - Werkzeugmaschinenlabor (WZL)
+# Contact: Simon Cramer, s.cramer@wzl-mq.rwth-aachen.de
+
+import types
+import importlib
+import importlib.util
+
+
+class LazyModule(types.ModuleType):
+    """Placeholder for a module that is imported on the first attribute access.
+    Heavy dependencies like pandas, pyarrow or boto3 are only imported when a function that needs them is called.
+    """
+
+    def __init__(self,name,submodules=()):
+        """
+        Args:
+            name (str): Name of the module e.g. "pyarrow"
+            submodules (tuple[str]): Submodules that are imported together with the module e.g. ("pyarrow.feather",)
+        """
+        super().__init__(name)
+        self.__dict__['_lazy_submodules'] = submodules
+
+    def __getattr__(self,attribute):
+        module = importlib.import_module(self.__name__)
+        for submodule in self._lazy_submodules:
+            importlib.import_module(submodule)
+        value = getattr(module, attribute)
+        self.__dict__[attribute] = value
+        return value
+
+    def __repr__(self):
+        return '<lazy module {}>'.format(self.__name__)
+
+def lazy_import(name,*submodules):
+    """Returns a module that is imported on first use
+    Args:
+        name (str): Name of the module
+        submodules (str): Submodules that are used through the module, e.g. "boto3.s3.transfer"
+    Returns:
+        [LazyModule]: The module placeholder
+    """
+    return LazyModule(name, submodules)
+
+def optional_import(name,*submodules):
+    """Returns a module that is imported on first use, if it is installed
+    Args:
+        name (str): Name of the module
+        submodules (str): Submodules that are used through the module
+    Returns:
+        [LazyModule]: The module placeholder or None if the module is not installed
+    """
+    try:
+        if importlib.util.find_spec(name) is None:
+            return None
+    except (ImportError, ValueError):
+        return None
+    return LazyModule(name, submodules)
@@ -0,0 +1,359 @@
+# Copyright (c) 2022 RWTH Aachen - Werkzeugmaschinenlabor (WZL)
+# Contact: Simon Cramer, s.cramer@wzl-mq.rwth-aachen.de
+
+import os
+import time
+import fnmatch
+import hashlib
+import logging
+import datetime
+import tempfile
+import threading
+import concurrent.futures
+from .lazy import lazy_import
+from .settings import get_s3_settings
+from .filehandler import generate_s3_strings, _get_s3_client, _s3_pool_settings
+
+pyarrow = lazy_import('pyarrow', 'pyarrow.compute', 'pyarrow.feather')
+
+logger = logging.getLogger(__name__)
+
+_INDEX_VERSION = '1'
+_PAGE_SIZE = 1000
+_GAP_PAGE_SIZE = 16
+_TIMESTAMP_UNIT = 'ms'
+
+DEFAULT_MAX_AGE = 3600
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def _schema():
+    """Returns the schema of the index tables
+    Returns:
+        [pyarrow.Schema]: key, size, etag and last_modified
+    """
+    return pyarrow.schema([
+        ('key', pyarrow.string()),
+        ('size', pyarrow.int64()),
+        ('etag', pyarrow.string()),
+        ('last_modified', pyarrow.timestamp(_TIMESTAMP_UNIT, tz='UTC')),
+    ])
+
+def _to_table(objects,prefix):
+    """Converts listed objects into an index table
+    Args:
+        objects (list[dict]): Objects as returned by list_objects_v2
+        prefix (str): Prefix that is removed from the keys
+    Returns:
+        [pyarrow.Table]: Table with the key relative to the prefix, size, etag and last_modified
+    """
+    return pyarrow.table({
+        'key': [obj['Key'][len(prefix):] for obj in objects],
+        'size': [obj['Size'] for obj in objects],
+        'etag': [obj['ETag'] for obj in objects],
+        'last_modified': [obj['LastModified'] for obj in objects],
+    }, schema=_schema())
+
+def _merge(table,new):
+    """Merges new rows into a sorted index table. Rows of new replace rows with the same key.
+    Args:
+        table (pyarrow.Table): Sorted index table
+        new (pyarrow.Table): Rows to merge
+    Returns:
+        [pyarrow.Table]: Sorted index table without duplicate keys
+    """
+    if new.num_rows == 0:
+        return table
+    table = pyarrow.concat_tables([table, new]).sort_by('key').combine_chunks()
+    if table.num_rows < 2:
+        return table
+    keys = table['key']
+    # The sort is stable, so the last row of a key is the newest one
+    last = pyarrow.compute.not_equal(keys.slice(0, table.num_rows-1), keys.slice(1))
+    mask = pyarrow.concat_arrays([last.combine_chunks(), pyarrow.array([True])])
+    return table.filter(mask)
+
+def _gaps(table):
+    """Finds the ranges of the key space in which new keys of appending writers show up:
+    before the first key and after the last key of every run of keys in the same directory.
+    Args:
+        table (pyarrow.Table): Sorted index table
+    Returns:
+        [list[tuple]]: Start after key (None for the start) and stop key (None for the end) of every gap
+    """
+    if table.num_rows == 0:
+        return [(None, None)]
+    keys = table['key'].combine_chunks()
+    parents = pyarrow.compute.replace_substring_regex(keys, pattern='[^/]*$', replacement='')
+    changes = pyarrow.compute.not_equal(parents.slice(0, len(keys)-1), parents.slice(1))
+    ends = pyarrow.compute.indices_nonzero(changes).to_pylist()
+    gaps = [(None, keys[0].as_py())]
+    gaps.extend((keys[end].as_py(), keys[end+1].as_py()) for end in ends)
+    gaps.append((keys[len(keys)-1].as_py(), None))
+    return gaps
+
+
+class ListingIndex:
+    """Index of all objects below a s3 prefix with their size, ETag and last modified time.
+    The first refresh lists the prefix once. Later refreshes only list the gaps behind the last key of every directory
+    (using StartAfter), which finds the objects that were added by writers that append new, increasingly named keys
+    (e.g. numbered or time stamped files, new partitions). Deleted or overwritten objects and new keys that sort before
+    the last key of their directory are only found by a full scan, which is done when max_age is exceeded or full=True is passed.
+    Until then the index can list objects that were deleted by other clients and miss such keys.
+    Deletes through delete_s3_objects are applied to the index directly.
+    The index is stored as a lz4 compressed feather file, so other processes and later runs can continue from it.
+    """
+
+    def __init__(self,path,index_directory=None,max_age=DEFAULT_MAX_AGE):
+        """
+        Args:
+            path (str): s3://BUCKETNAME/KEY
+            index_directory (str): Directory of the stored indexes. Defaults to s3_smart_open_listings in the temp directory.
+            max_age (float): Seconds after which a refresh does a full scan (default one hour). With None only refresh(full=True) does one.
+        Raises:
+            ValueError: When the path is not a s3 path
+        """
+        if path[:5] != 's3://':
+            raise ValueError('ListingIndex only supports s3 paths!')
+        self.bucket_name, self.prefix, tmp_path = generate_s3_strings(path)
+        self.endpoint = get_s3_settings().endpoint
+        self.max_age = max_age
+        if index_directory is None:
+            index_directory = os.path.join(tempfile.gettempdir(), 's3_smart_open_listings')
+        os.makedirs(index_directory, exist_ok=True)
+        digest = hashlib.sha256('\0'.join([self.endpoint, self.bucket_name, self.prefix]).encode('utf-8')).hexdigest()
+        self.index_path = os.path.join(index_directory, digest+'.fth')
+        self._lock = threading.RLock()
+        self._table = None
+        self.scanned_at = None
+        self.refreshed_at = None
+        self._load()
+
+    def _load(self):
+        """Loads the stored index, if it exists and belongs to this prefix
+        """
+        try:
+            table = pyarrow.feather.read_table(self.index_path, memory_map=False)
+        except (FileNotFoundError, pyarrow.ArrowInvalid) as e:
+            if not isinstance(e, FileNotFoundError):
+                logger.warning('Ignoring broken listing index {} ; Reason {}'.format(self.index_path, e))
+            return
+        metadata = {key.decode('utf-8'): value.decode('utf-8') for key, value in (table.schema.metadata or {}).items()}
+        if metadata.get('version') != _INDEX_VERSION or metadata.get('bucket') != self.bucket_name or metadata.get('prefix') != self.prefix:
+            return
+        self._table = table.replace_schema_metadata(None)
+        self.scanned_at = float(metadata['scanned_at'])
+        self.refreshed_at = float(metadata['refreshed_at'])
+
+    def _save(self):
+        """Stores the index atomically next to the previous version
+        """
+        metadata = {
+            'version': _INDEX_VERSION,
+            'bucket': self.bucket_name,
+            'prefix': self.prefix,
+            'scanned_at': repr(self.scanned_at),
+            'refreshed_at': repr(self.refreshed_at),
+        }
+        handle, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.index_path), suffix='.tmp')
+        os.close(handle)
+        try:
+            pyarrow.feather.write_feather(self._table.replace_schema_metadata(metadata), tmp_path, compression='lz4')
+            os.replace(tmp_path, self.index_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _list(self,s3c,start_after=None,stop=None,page_size=_PAGE_SIZE):
+        """Lists objects of the prefix in key order
+        Args:
+            s3c (boto3 Client): Client used for the requests
+            start_after (str): Key relative to the prefix after which the listing starts
+            stop (str): Key relative to the prefix at which the listing stops
+            page_size (int): Keys of the first request. The page size is doubled for every following request up to 1000.
+        Returns:
+            [list[dict]]: Listed objects
+        """
+        objects = []
+        kwargs = {'Bucket': self.bucket_name, 'Prefix': self.prefix}
+        if start_after is not None:
+            kwargs['StartAfter'] = self.prefix+start_after
+        while True:
+            page = s3c.list_objects_v2(MaxKeys=page_size, **kwargs)
+            for obj in page.get('Contents', []):
+                if stop is not None and obj['Key'][len(self.prefix):] >= stop:
+                    return objects
+                objects.append(obj)
+            if not page.get('IsTruncated'):
+                return objects
+            kwargs['ContinuationToken'] = page['NextContinuationToken']
+            page_size = min(page_size*2, _PAGE_SIZE)
+
+    def refresh(self,full=False):
+        """Updates the index from s3. Does a full scan for a new index, with full=True, when max_age is exceeded,
+        or when listing the gaps would need more requests than a full scan.
+        Args:
+            full (bool): Forces a full scan
+        Returns:
+            [int]: Number of objects that were added or changed
+        """
+        s3c = _get_s3_client()
+        with self._lock:
+            now = time.time()
+            full = full or self._table is None or (self.max_age is not None and now - self.scanned_at > self.max_age)
+            gaps = None if full else _gaps(self._table)
+            if not full and len(gaps) > max(self._table.num_rows // _PAGE_SIZE, 1):
+                full = True
+            if full:
+                objects = self._list(s3c)
+                new = _to_table(objects, self.prefix)
+                if self._table is None:
+                    changed = new.num_rows
+                else:
+                    versions = lambda table: pyarrow.compute.binary_join_element_wise(table['key'], table['etag'], '\0')
+                    known = pyarrow.compute.is_in(versions(new), value_set=versions(self._table).combine_chunks())
+                    changed = new.num_rows - pyarrow.compute.sum(known.cast(pyarrow.int64())).as_py()
+                self._table = new.sort_by('key').combine_chunks()
+                self.scanned_at = now
+                logger.info('Full listing of s3://{}/{} found {} objects'.format(self.bucket_name, self.prefix, new.num_rows))
+            else:
+                workers = min(len(gaps), _s3_pool_settings['max_pool_connections'])
+                with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+                    results = executor.map(lambda gap: self._list(s3c, gap[0], gap[1], _GAP_PAGE_SIZE), gaps)
+                    objects = [obj for result in results for obj in result]
+                new = _to_table(objects, self.prefix)
+                self._table = _merge(self._table, new)
+                changed = new.num_rows
+                logger.info('Incremental listing of s3://{}/{} found {} new objects in {} gaps'.format(self.bucket_name, self.prefix, changed, len(gaps)))
+            self.refreshed_at = now
+            self._save()
+        return changed
+
+    def discard(self,keys):
+        """Removes deleted objects from the index
+        Args:
+            keys (list[str]): Full keys of the deleted objects
+        """
+        relative = [key[len(self.prefix):] for key in keys if key.startswith(self.prefix)]
+        if not relative:
+            return
+        with self._lock:
+            if self._table is None:
+                return
+            deleted = pyarrow.compute.is_in(self._table['key'], value_set=pyarrow.array(relative, pyarrow.string()))
+            self._table = self._table.filter(pyarrow.compute.invert(deleted))
+            self._save()
+
+    def __len__(self):
+        return 0 if self._table is None else self._table.num_rows
+
+    @property
+    def table(self):
+        """[pyarrow.Table]: Index with the key relative to the prefix, size, etag and last_modified, sorted by key"""
+        return _to_table([], self.prefix) if self._table is None else self._table
+
+    def query(self,pattern=None,suffix=None,min_size=None,max_size=None,modified_since=None):
+        """Selects objects from the index without requests to s3
+        Args:
+            pattern (str): Glob pattern matched against the key relative to the prefix, e.g. "machine=M1/*.fth". * also matches "/".
+            suffix (str or list[str]): Suffixes of the key e.g. ".fth" , ".pckl"
+            min_size (int): Minimum size in bytes
+            max_size (int): Maximum size in bytes
+            modified_since (datetime.datetime): Only objects modified after this time. Naive times are treated as UTC.
+        Returns:
+            [pyarrow.Table]: Matching rows of the index
+        """
+        table = self.table
+        masks = []
+        if pattern is not None:
+            regex = fnmatch.translate(pattern)
+            if regex.endswith('\\Z'):
+                regex = regex[:-2]+'\\z'
+            masks.append(pyarrow.compute.match_substring_regex(table['key'], regex))
+        if suffix:
+            suffix = [suffix] if type(suffix)==str else suffix
+            suffix_masks = [pyarrow.compute.ends_with(table['key'], value) for value in suffix]
+            mask = suffix_masks[0]
+            for suffix_mask in suffix_masks[1:]:
+                mask = pyarrow.compute.or_(mask, suffix_mask)
+            masks.append(mask)
+        if min_size is not None:
+            masks.append(pyarrow.compute.greater_equal(table['size'], min_size))
+        if max_size is not None:
+            masks.append(pyarrow.compute.less_equal(table['size'], max_size))
+        if modified_since is not None:
+            if modified_since.tzinfo is None:
+                modified_since = modified_since.replace(tzinfo=datetime.timezone.utc)
+            since = pyarrow.scalar(modified_since, type=pyarrow.timestamp(_TIMESTAMP_UNIT, tz='UTC'))
+            masks.append(pyarrow.compute.greater(table['last_modified'], since))
+        if not masks:
+            return table
+        mask = masks[0]
+        for other in masks[1:]:
+            mask = pyarrow.compute.and_(mask, other)
+        return table.filter(mask)
+
+    def objects(self,**kwargs):
+        """Selects objects from the index like query, in the format of list_objects_v2
+        Args:
+            kwargs: Arguments of query
+        Returns:
+            [list[dict]]: Key, Size, ETag and LastModified of the matching objects
+        """
+        return [{'Key': self.prefix+row['key'], 'Size': row['size'], 'ETag': row['etag'], 'LastModified': row['last_modified']}
+                for row in self.query(**kwargs).to_pylist()]
+
+
+def get_listing_index(path,index_directory=None,max_age=None):
+    """Returns the listing index of a s3 prefix that is shared in this process
+    Args:
+        path (str): s3://BUCKETNAME/KEY
+        index_directory (str): Directory of the stored indexes. Defaults to s3_smart_open_listings in the temp directory.
+        max_age (float): Seconds after which a refresh does a full scan. Defaults to DEFAULT_MAX_AGE for a new index, an existing index keeps its max_age.
+    Returns:
+        [ListingIndex]: Index of the prefix
+    """
+    bucket_name, prefix, tmp_path = generate_s3_strings(path)
+    key = (get_s3_settings().endpoint, bucket_name, prefix)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = ListingIndex(path, index_directory=index_directory,
+                                                 max_age=DEFAULT_MAX_AGE if max_age is None else max_age)
+        elif max_age is not None:
+            index.max_age = max_age
+    return index
+
+def list_s3_objects(path,pattern=None,file_types=None,min_size=None,max_size=None,modified_since=None,refresh=True,max_age=None):
+    """Lists the objects below a s3 prefix with their metadata through the shared listing index
+    Args:
+        path (str): s3://BUCKETNAME/KEY
+        pattern (str): Glob pattern matched against the key relative to the path
+        file_types (list[str]): File types to be filtered e.g. ".fth" , ".pckl"
+        min_size (int): Minimum size in bytes
+        max_size (int): Maximum size in bytes
+        modified_since (datetime.datetime): Only objects modified after this time
+        refresh (bool): Updates the index from s3 before the query
+        max_age (float): Seconds after which a refresh does a full scan, see get_listing_index
+    Returns:
+        [list[dict]]: Key, Size, ETag and LastModified of the matching objects
+    """
+    index = get_listing_index(path,max_age=max_age)
+    if refresh or index.refreshed_at is None:
+        index.refresh()
+    return index.objects(pattern=pattern,suffix=file_types,min_size=min_size,max_size=max_size,modified_since=modified_since)
+
+def _discard(bucket_name,keys):
+    """Removes deleted keys from all listing indexes of this process
+    Args:
+        bucket_name (str): Name of the bucket
+        keys (list[str]): Deleted keys
+    """
+    current_endpoint = get_s3_settings().endpoint
+    with _indexes_lock:
+        indexes = [index for (endpoint, bucket, prefix), index in _indexes.items() if bucket == bucket_name and endpoint == current_endpoint]
+    for index in indexes:
+        index.discard(keys)
@@ -0,0 +1,429 @@
+# Copyright (c) 2022 RWTH Aachen - Werkzeugmaschinenlabor (WZL)
+# Contact: Simon Cramer, s.cramer@wzl-mq.rwth-aachen.de
+
+import time
+import logging
+import functools
+import threading
+import contextlib
+import collections
+
+logger = logging.getLogger(__name__)
+
+_recorders = []
+_recorders_lock = threading.Lock()
+_local = threading.local()
+_aggregator = {'aggregator': None}
+
+
+class Operation:
+    """Measurements of one read or write call.
+    network_time is the time spent waiting for s3 or the local disk (opening, reading and writing the file object),
+    serialization_time is the rest of the call, e.g. (de)serialization and (de)compression.
+    """
+
+    __slots__ = ('operation', 'path', 'filename', 'bucket', 'key', 'bytes', 'requests', 'retries', 'cache_hits',
+                 'started', 'duration', 'first_byte', 'network_time', 'error', '_lock')
+
+    def __init__(self,operation,path,filename):
+        self.operation = operation
+        self.path = path
+        self.filename = filename
+        self.bucket = None
+        self.key = filename
+        if path and path[:5] == 's3://':
+            bucket_and_prefix = path[5:].rstrip('/')
+            self.bucket = bucket_and_prefix.split('/')[0]
+            prefix = bucket_and_prefix[len(self.bucket)+1:]
+            self.key = prefix+'/'+filename if prefix and filename else prefix or filename
+        self.bytes = 0
+        self.requests = 0
+        self.retries = 0
+        self.cache_hits = 0
+        self.started = time.perf_counter()
+        self.duration = None
+        self.first_byte = None
+        self.network_time = 0.0
+        self.error = None
+        self._lock = threading.Lock()
+
+    def add(self,**values):
+        """Adds values to the counters, e.g. add(bytes=1024, requests=1)
+        """
+        with self._lock:
+            for name, value in values.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    @property
+    def serialization_time(self):
+        """[float]: Time of the call that was not spent on file or network access"""
+        if self.duration is None:
+            return None
+        return max(self.duration - self.network_time, 0.0)
+
+    def as_dict(self):
+        """Returns the measurements
+        Returns:
+            [dict]: All fields and the serialization_time
+        """
+        values = {name: getattr(self, name) for name in self.__slots__ if not name.startswith('_')}
+        values['serialization_time'] = self.serialization_time
+        return values
+
+
+def add_recorder(recorder):
+    """Adds a recorder that is called with every finished Operation, e.g. for profiling or an own exporter.
+    Recorders are called in the thread of the operation and should return quickly.
+    Args:
+        recorder (callable): Function that takes an Operation
+    """
+    with _recorders_lock:
+        _recorders.append(recorder)
+
+def remove_recorder(recorder):
+    """Removes a recorder added with add_recorder
+    Args:
+        recorder (callable): The recorder to remove
+    """
+    with _recorders_lock:
+        if recorder in _recorders:
+            _recorders.remove(recorder)
+
+def metrics_enabled():
+    """Checks if operations are measured
+    Returns:
+        [bool]: True if at least one recorder is registered
+    """
+    return bool(_recorders)
+
+def current():
+    """Returns the operation measured in this thread
+    Returns:
+        [Operation]: The operation or None if nothing is measured
+    """
+    return getattr(_local, 'operation', None)
+
+def count(**values):
+    """Adds values to the counters of the operation measured in this thread, if there is one
+    """
+    operation = getattr(_local, 'operation', None)
+    if operation is not None:
+        operation.add(**values)
+
+@contextlib.contextmanager
+def network(operation=None):
+    """Adds the time spent in the with block to the network time of an operation
+    Args:
+        operation (Operation): Operation to add to. Defaults to the operation measured in this thread.
+    """
+    operation = operation or getattr(_local, 'operation', None)
+    if operation is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        operation.add(network_time=time.perf_counter()-started)
+
+@contextlib.contextmanager
+def attached(operation):
+    """Makes an operation the measured operation of the calling thread, e.g. in worker threads
+    Args:
+        operation (Operation): Operation or None
+    """
+    previous = getattr(_local, 'operation', None)
+    if operation is None or previous is operation:
+        yield
+        return
+    _local.operation = operation
+    try:
+        yield
+    finally:
+        _local.operation = previous
+
+def _finish(operation):
+    operation.duration = time.perf_counter() - operation.started
+    for recorder in list(_recorders):
+        try:
+            recorder(operation)
+        except Exception as e:
+            logger.warning('Recorder {} failed ; Reason {}'.format(recorder, e))
+
+def instrument(function):
+    """Decorates a read or write function with the arguments (path, filename, ...), so that every call is measured while recorders are registered.
+    Without recorders the function is called directly.
+    Args:
+        function (callable): Function to measure
+    Returns:
+        [callable]: Measured function
+    """
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not _recorders or getattr(_local, 'operation', None) is not None:
+            return function(*args, **kwargs)
+        path = args[0] if args else kwargs.get('input_path', kwargs.get('output_path'))
+        filename = args[1] if len(args) > 1 else kwargs.get('filename')
+        operation = Operation(function.__name__, path, filename)
+        _local.operation = operation
+        try:
+            return function(*args, **kwargs)
+        except BaseException as e:
+            operation.error = type(e).__name__
+            raise
+        finally:
+            _local.operation = None
+            _finish(operation)
+    return wrapper
+
+def _after_call(http_response=None, parsed=None, **kwargs):
+    """botocore after-call handler that counts requests, retries and the time to the first response of the measured operation
+    """
+    operation = getattr(_local, 'operation', None)
+    if operation is None:
+        return
+    retries = (parsed or {}).get('ResponseMetadata', {}).get('RetryAttempts', 0)
+    operation.add(requests=1+retries, retries=retries)
+    if operation.first_byte is None:
+        operation.first_byte = time.perf_counter() - operation.started
+
+def register_client(s3c):
+    """Registers the request counting on a boto3 client
+    Args:
+        s3c (boto3 Client): Client to measure
+    """
+    s3c.meta.events.register('after-call.s3', _after_call)
+
+
+class _TimedFile:
+    """Wraps a file object and measures the bytes and the time of reads, writes and close for an operation.
+    """
+
+    def __init__(self,infile,operation):
+        self._file = infile
+        self._operation = operation
+
+    def _timed(self,method,*args):
+        started = time.perf_counter()
+        data = method(*args)
+        self._operation.add(network_time=time.perf_counter()-started)
+        return data
+
+    def read(self,*args):
+        data = self._timed(self._file.read,*args)
+        self._operation.add(bytes=len(data))
+        return data
+
+    def readline(self,*args):
+        data = self._timed(self._file.readline,*args)
+        self._operation.add(bytes=len(data))
+        return data
+
+    def readinto(self,buffer):
+        length = self._timed(self._file.readinto,buffer)
+        self._operation.add(bytes=length or 0)
+        return length
+
+    def write(self,data):
+        length = self._timed(self._file.write,data)
+        self._operation.add(bytes=len(data))
+        return length
+
+    def close(self):
+        self._timed(self._file.close)
+
+    def __iter__(self):
+        return iter(self.readline, self._file.read(0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        # The wrapped file decides how to finish, e.g. smart_open aborts a multipart upload on an exception instead of completing it
+        return self._timed(self._file.__exit__,*args)
+
+    def __getattr__(self,name):
+        return getattr(self._file, name)
+
+def timed_file(infile,operation=None):
+    """Wraps a file object for an operation, so its reads and writes are measured
+    Args:
+        infile (file object): File object to wrap
+        operation (Operation): Operation to add to. Defaults to the operation measured in this thread.
+    Returns:
+        The wrapped file object or infile if nothing is measured
+    """
+    operation = operation or getattr(_local, 'operation', None)
+    if operation is None:
+        return infile
+    return _TimedFile(infile, operation)
+
+
+class MetricsAggregator:
+    """Recorder that aggregates operations per operation name and bucket.
+    Counters are kept for all operations, percentiles are computed over the last window operations.
+    """
+
+    def __init__(self,window=10000):
+        """
+        Args:
+            window (int): Number of recent operations per operation name and bucket used for the percentiles
+        """
+        self.window = window
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def __call__(self,operation):
+        label = (operation.operation, operation.bucket or 'local')
+        with self._lock:
+            series = self._series.get(label)
+            if series is None:
+                series = self._series[label] = {
+                    'count': 0, 'errors': 0, 'bytes': 0, 'requests': 0, 'retries': 0, 'cache_hits': 0,
+                    'duration_sum': 0.0, 'network_time_sum': 0.0,
+                    'duration': collections.deque(maxlen=self.window),
+                    'network_time': collections.deque(maxlen=self.window),
+                    'serialization_time': collections.deque(maxlen=self.window),
+                    'first_byte': collections.deque(maxlen=self.window),
+                }
+            series['count'] += 1
+            series['errors'] += operation.error is not None
+            series['bytes'] += operation.bytes
+            series['requests'] += operation.requests
+            series['retries'] += operation.retries
+            series['cache_hits'] += operation.cache_hits
+            series['duration_sum'] += operation.duration
+            series['network_time_sum'] += operation.network_time
+            series['duration'].append(operation.duration)
+            series['network_time'].append(operation.network_time)
+            series['serialization_time'].append(operation.serialization_time)
+            if operation.first_byte is not None:
+                series['first_byte'].append(operation.first_byte)
+
+    def reset(self):
+        """Deletes all aggregated values
+        """
+        with self._lock:
+            self._series = {}
+
+    def summary(self,quantiles=(0.5,0.9,0.99)):
+        """Returns the aggregated values
+        Args:
+            quantiles (tuple[float]): Quantiles of the times
+        Returns:
+            [dict]: Counters, throughput in bytes per second of network time and the quantiles of duration, network_time,
+                    serialization_time and first_byte in seconds, by "operation bucket"
+        """
+        with self._lock:
+            series = {label: {name: list(value) if isinstance(value, collections.deque) else value for name, value in values.items()}
+                      for label, values in self._series.items()}
+        summary = {}
+        for (operation, bucket), values in series.items():
+            entry = {name: values[name] for name in ('count', 'errors', 'bytes', 'requests', 'retries', 'cache_hits', 'duration_sum')}
+            entry['throughput'] = values['bytes']/values['network_time_sum'] if values['network_time_sum'] else None
+            for name in ('duration', 'network_time', 'serialization_time', 'first_byte'):
+                entry[name] = {quantile: _quantile(values[name], quantile) for quantile in quantiles}
+            summary['{} {}'.format(operation, bucket)] = entry
+        return summary
+
+    def to_prometheus(self,quantiles=(0.5,0.9,0.99)):
+        """Exports the aggregated values in the Prometheus text format
+        Args:
+            quantiles (tuple[float]): Quantiles of the operation duration
+        Returns:
+            [str]: Metrics in the Prometheus text exposition format
+        """
+        with self._lock:
+            series = {label: dict(values, duration=list(values['duration'])) for label, values in self._series.items()}
+        lines = []
+        counters = (('operations_total', 'count', 'Number of operations'),
+                    ('errors_total', 'errors', 'Number of failed operations'),
+                    ('bytes_total', 'bytes', 'Bytes read or written'),
+                    ('requests_total', 'requests', 'Number of s3 requests'),
+                    ('retries_total', 'retries', 'Number of retried s3 requests'),
+                    ('cache_hits_total', 'cache_hits', 'Number of reads served from the local cache'),
+                    ('network_seconds_total', 'network_time_sum', 'Time spent on file or network access'))
+        for metric, name, description in counters:
+            lines.append('# HELP s3_smart_open_{} {}'.format(metric, description))
+            lines.append('# TYPE s3_smart_open_{} counter'.format(metric))
+            for (operation, bucket), values in sorted(series.items()):
+                lines.append('s3_smart_open_{}{{operation="{}",bucket="{}"}} {}'.format(metric, operation, bucket, values[name]))
+        lines.append('# HELP s3_smart_open_operation_seconds Duration of the operations')
+        lines.append('# TYPE s3_smart_open_operation_seconds summary')
+        for (operation, bucket), values in sorted(series.items()):
+            labels = 'operation="{}",bucket="{}"'.format(operation, bucket)
+            for quantile in quantiles:
+                lines.append('s3_smart_open_operation_seconds{{{},quantile="{}"}} {}'.format(labels, quantile, _quantile(values['duration'], quantile)))
+            lines.append('s3_smart_open_operation_seconds_sum{{{}}} {}'.format(labels, values['duration_sum']))
+            lines.append('s3_smart_open_operation_seconds_count{{{}}} {}'.format(labels, values['count']))
+        return '\n'.join(lines)+'\n'
+
+def _quantile(values,quantile):
+    """Computes a quantile with the nearest rank method
+    Args:
+        values (list[float]): Values
+        quantile (float): Quantile between 0 and 1
+    Returns:
+        [float]: The quantile or None for no values
+    """
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(int(quantile*len(values)), len(values)-1)]
+
+def enable_metrics(window=10000):
+    """Starts measuring all read and write functions with the shared MetricsAggregator
+    Args:
+        window (int): Number of recent operations used for the percentiles
+    Returns:
+        [MetricsAggregator]: The shared aggregator
+    """
+    with _recorders_lock:
+        aggregator = _aggregator['aggregator']
+        if aggregator is None:
+            aggregator = _aggregator['aggregator'] = MetricsAggregator(window)
+        if aggregator not in _recorders:
+            _recorders.append(aggregator)
+    return aggregator
+
+def disable_metrics():
+    """Stops the shared MetricsAggregator. Its values are kept.
+    """
+    aggregator = _aggregator['aggregator']
+    if aggregator is not None:
+        remove_recorder(aggregator)
+
+def metrics_summary():
+    """Returns the summary of the shared MetricsAggregator
+    Returns:
+        [dict]: See MetricsAggregator.summary
+    """
+    aggregator = _aggregator['aggregator']
+    return aggregator.summary() if aggregator is not None else {}
+
+def start_prometheus_server(port,address=''):
+    """Serves the metrics of the shared MetricsAggregator for Prometheus in a daemon thread
+    Args:
+        port (int): Port of the http server
+        address (str): Address to listen on
+    Returns:
+        [http.server.HTTPServer]: The running server. Call shutdown() to stop it.
+    """
+    import http.server
+    aggregator = enable_metrics()
+
+    class _Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = aggregator.to_prometheus().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self,*args):
+            pass
+
+    server = http.server.ThreadingHTTPServer((address, port), _Handler)
+    threading.Thread(target=server.serve_forever, name='s3-smart-open-metrics', daemon=True).start()
+    return server
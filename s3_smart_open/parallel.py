@@ -0,0 +1,291 @@
+# Copyright (c) 2022 RWTH Aachen - Werkzeugmaschinenlabor (WZL)
+# Contact: Simon Cramer, s.cramer@wzl-mq.rwth-aachen.de
+
+import io
+import os
+import mmap
+import logging
+import tempfile
+import threading
+import contextlib
+import concurrent.futures
+from . import metrics
+from .lazy import lazy_import
+
+botocore = lazy_import('botocore', 'botocore.exceptions')
+
+logger = logging.getLogger(__name__)
+
+_parallel_settings = {
+    'enabled': True,
+    'min_part_size': 8*1024*1024,
+    'max_part_size': 64*1024*1024,
+    'max_concurrency': 16,
+    'memory_limit': 1024**3,
+}
+_range_executor = {'pid': None, 'workers': None, 'executor': None}
+_range_executor_lock = threading.Lock()
+_local = threading.local()
+
+def configure_parallel_reads(enabled=None,min_part_size=None,max_part_size=None,max_concurrency=None,memory_limit=None):
+    """Changes the settings of the parallel download used by read_pd_fth, read_arrow_fth, read_pckl, read_dill and read_joblib for s3 objects.
+    Args:
+        enabled (bool): Download s3 objects in parallel ranges. If False, objects are streamed with one request.
+        min_part_size (int): Size of the first range and minimum size of the other ranges in bytes. Objects up to this size are fetched with one request.
+        max_part_size (int): Maximum size of a range in bytes
+        max_concurrency (int): Maximum number of ranges fetched at the same time, shared by all downloads of the process
+        memory_limit (int): Objects larger than this amount of bytes are downloaded into a memory mapped temp file instead of memory
+    """
+    updates = {
+        'enabled': enabled,
+        'min_part_size': min_part_size,
+        'max_part_size': max_part_size,
+        'max_concurrency': max_concurrency,
+        'memory_limit': memory_limit,
+    }
+    for name, value in updates.items():
+        if value is not None:
+            _parallel_settings[name] = value
+
+def parallel_reads_enabled():
+    """Checks if s3 objects are downloaded in parallel ranges
+    Returns:
+        [bool]: True if the parallel download is enabled
+    """
+    return _parallel_settings['enabled']
+
+
+class BufferFile(io.RawIOBase):
+    """Read only, seekable file object over a buffer in memory or a memory mapped file.
+    getbuffer and read_view return views of the buffer, so deserializers that support it (Arrow, pickles with out-of-band buffers) do not copy the data.
+    """
+
+    def __init__(self,buffer):
+        """
+        Args:
+            buffer (bytes-like): Content of the file, e.g. a bytearray or mmap
+        """
+        super().__init__()
+        self._buffer = buffer
+        self._view = memoryview(buffer).cast('B')
+        self._position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self,offset,whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._position = offset
+        elif whence == io.SEEK_CUR:
+            self._position += offset
+        elif whence == io.SEEK_END:
+            self._position = len(self._view) + offset
+        else:
+            raise ValueError('Invalid whence {}'.format(whence))
+        self._position = max(self._position, 0)
+        return self._position
+
+    def readinto(self,buffer):
+        length = max(min(len(buffer), len(self._view) - self._position), 0)
+        buffer[:length] = self._view[self._position:self._position+length]
+        self._position += length
+        return length
+
+    def read(self,size=-1):
+        end = len(self._view) if size is None or size < 0 else min(self._position + size, len(self._view))
+        data = self._view[self._position:end].tobytes()
+        self._position = max(end, self._position)
+        return data
+
+    def peek(self,size=0):
+        return self._view[self._position:self._position+max(size, 1)].tobytes()
+
+    def readline(self,size=-1):
+        end = len(self._view) if size is None or size < 0 else min(self._position + size, len(self._view))
+        newline = self._buffer.find(b'\n', self._position, end)
+        return self.read((newline + 1 if newline >= 0 else end) - self._position)
+
+    def getbuffer(self):
+        """Returns a view of the whole buffer
+        Returns:
+            [memoryview]: View of the content
+        """
+        return self._view
+
+    def read_view(self,length):
+        """Reads a given amount of bytes as view of the buffer instead of a copy
+        Args:
+            length (int): Amount of bytes
+        Raises:
+            EOFError: When the file ends before
+        Returns:
+            [memoryview]: View of the content
+        """
+        if self._position + length > len(self._view):
+            raise EOFError('File ended after {} of {} bytes'.format(len(self._view) - self._position, length))
+        view = self._view[self._position:self._position+length]
+        self._position += length
+        return view
+
+
+def _get_range_executor():
+    """Returns the thread pool that fetches the ranges of all downloads of the process, so concurrent downloads
+    together use at most max_concurrency threads and connections. It is rebuilt after a fork or a changed max_concurrency.
+    Returns:
+        concurrent.futures.ThreadPoolExecutor
+    """
+    workers = _parallel_settings['max_concurrency']
+    if _range_executor['pid'] != os.getpid() or _range_executor['workers'] != workers:
+        with _range_executor_lock:
+            if _range_executor['pid'] != os.getpid() or _range_executor['workers'] != workers:
+                previous = _range_executor['executor'] if _range_executor['pid'] == os.getpid() else None
+                _range_executor['executor'] = concurrent.futures.ThreadPoolExecutor(max_workers=workers,thread_name_prefix='s3-ranges')
+                _range_executor['workers'] = workers
+                _range_executor['pid'] = os.getpid()
+                if previous is not None:
+                    previous.shutdown(wait=False)
+    return _range_executor['executor']
+
+@contextlib.contextmanager
+def sequential_ranges():
+    """Fetches the ranges of downloads started in the calling thread one after another in this thread.
+    Used by the workers of read_many, which already download many objects in parallel.
+    """
+    previous = getattr(_local, 'sequential', False)
+    _local.sequential = True
+    try:
+        yield
+    finally:
+        _local.sequential = previous
+
+def _plan(size,first,max_workers=None):
+    """Splits the rest of an object after the first range into ranges. The ranges get larger with the object size,
+    so every worker fetches about two ranges, and the number of workers grows with the number of ranges.
+    Args:
+        size (int): Size of the object in bytes
+        first (int): Size of the first range, which was already fetched
+        max_workers (int): Maximum number of parallel requests. Defaults to max_concurrency of configure_parallel_reads.
+    Returns:
+        [tuple]: List of (start, end) with end exclusive and the number of workers
+    """
+    max_workers = max_workers or _parallel_settings['max_concurrency']
+    remaining = size - first
+    if remaining <= 0:
+        return [], 0
+    part_size = -(-remaining // (2*max_workers))
+    part_size = min(max(part_size, _parallel_settings['min_part_size']), _parallel_settings['max_part_size'])
+    ranges = [(start, min(start+part_size, size)) for start in range(first, size, part_size)]
+    return ranges, min(max_workers, len(ranges))
+
+def _allocate(size,memory_map=None):
+    """Allocates the buffer of a download
+    Args:
+        size (int): Size of the object in bytes
+        memory_map (bool): Use a memory mapped temp file. Defaults to True for objects above memory_limit of configure_parallel_reads.
+    Returns:
+        [bytearray or mmap]: Writable buffer of the given size
+    """
+    if memory_map is None:
+        memory_map = size > _parallel_settings['memory_limit']
+    if not memory_map or size == 0:
+        return bytearray(size)
+    # The temp file is deleted on close, the mapping keeps the pages until it is released
+    with tempfile.TemporaryFile(prefix='s3_smart_open_') as tmp:
+        tmp.truncate(size)
+        return mmap.mmap(tmp.fileno(), size)
+
+def _read_body(body,view):
+    """Reads a response body into a view
+    Args:
+        body (botocore StreamingBody): Body of a get_object response
+        view (memoryview): Part of the download buffer
+    Raises:
+        IOError: When the body ends before the view is full
+    """
+    position = 0
+    while position < len(view):
+        read = body.readinto(view[position:])
+        if not read:
+            raise IOError('Response ended after {} of {} bytes'.format(position, len(view)))
+        position += read
+
+def download_buffer(s3c,bucket_name,key,max_workers=None,memory_map=None):
+    """Downloads a s3 object with concurrent ranged GET requests into one buffer.
+    The first request fetches min_part_size bytes and returns the object size, so small objects need one request only.
+    The other ranges are fetched in parallel on the shared range thread pool directly into their part of the buffer,
+    or sequentially in the calling thread inside sequential_ranges.
+    Args:
+        s3c (boto3 Client): Client used for the requests
+        bucket_name (str): Name of the bucket
+        key (str): Key of the object
+        max_workers (int): Maximum number of parallel requests. Defaults to max_concurrency of configure_parallel_reads.
+        memory_map (bool): Download into a memory mapped temp file. Defaults to True for objects above memory_limit.
+    Returns:
+        [BufferFile]: File object over the downloaded content
+    """
+    first = _parallel_settings['min_part_size']
+    try:
+        response = s3c.get_object(Bucket=bucket_name, Key=key, Range='bytes=0-{}'.format(first-1))
+    except botocore.exceptions.ClientError as e:
+        if e.response['Error']['Code'] != 'InvalidRange':
+            raise
+        # Ranges of empty objects are not satisfiable
+        response = s3c.get_object(Bucket=bucket_name, Key=key)
+    content_range = response.get('ContentRange')
+    size = int(content_range.split('/')[-1]) if content_range else response['ContentLength']
+    buffer = _allocate(size, memory_map)
+    view = memoryview(buffer)
+    _read_body(response['Body'], view[:response['ContentLength']])
+    metrics.count(bytes=response['ContentLength'])
+    ranges, workers = _plan(size, response['ContentLength'], max_workers)
+    if ranges:
+        operation = metrics.current()
+        etag = response['ETag']
+
+        def _fetch(start, end):
+            with metrics.attached(operation):
+                part = s3c.get_object(Bucket=bucket_name, Key=key, Range='bytes={}-{}'.format(start, end-1), IfMatch=etag)
+                _read_body(part['Body'], view[start:end])
+                metrics.count(bytes=end-start)
+
+        if getattr(_local, 'sequential', False) or workers <= 1:
+            logger.debug('Downloading {} ({} bytes) in {} sequential ranges'.format(key, size, len(ranges)+1))
+            for start, end in ranges:
+                _fetch(start, end)
+        else:
+            logger.debug('Downloading {} ({} bytes) in {} ranges with {} workers'.format(key, size, len(ranges)+1, workers))
+            _fetch_all(_fetch, ranges, workers)
+    return BufferFile(buffer)
+
+def _fetch_all(fetch,ranges,workers):
+    """Fetches ranges on the shared range thread pool with at most workers of them in flight.
+    After an error the running ranges are finished before it is raised, so no thread writes into the buffer afterwards.
+    Args:
+        fetch (callable): Fetches one range, takes (start, end)
+        ranges (list[tuple]): Ranges from _plan
+        workers (int): Maximum number of ranges in flight
+    """
+    executor = _get_range_executor()
+    pending = iter(ranges)
+    running = set()
+    error = None
+    for start, end in pending:
+        running.add(executor.submit(fetch, start, end))
+        if len(running) >= workers:
+            break
+    while running:
+        done, running = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is not None and error is None:
+                error = future.exception()
+            next_range = next(pending, None) if error is None else None
+            if next_range is not None:
+                running.add(executor.submit(fetch, *next_range))
+    if error is not None:
+        raise error
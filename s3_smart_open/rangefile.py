@@ -0,0 +1,147 @@
+# Copyright (c) 2022 RWTH Aachen - Werkzeugmaschinenlabor (WZL)
+# Contact: Simon Cramer, s.cramer@wzl-mq.rwth-aachen.de
+
+import io
+import logging
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_READ_AHEAD = 1024*1024
+SMALL_READ = 64*1024
+MAX_WINDOWS = 4
+
+
+class S3RangeFile(io.RawIOBase):
+    """Read only, seekable file object for a s3 object that fetches data with ranged GET requests.
+    Fetched ranges are kept in a few windows. Reads are served from the windows and only the missing bytes are fetched.
+    Small reads (e.g. the metadata of an Arrow record batch) and sequential reads fetch at least read_ahead bytes,
+    so the neighbouring buffers are coalesced into one request. Other reads fetch the requested bytes only,
+    so skipped columns of an Arrow file are not downloaded.
+    The first request fetches the last read_ahead bytes of the object, which returns the object size and,
+    for Arrow/feather files, the footer.
+    """
+
+    def __init__(self,s3c,bucket_name,key,read_ahead=DEFAULT_READ_AHEAD,max_windows=MAX_WINDOWS):
+        """
+        Args:
+            s3c (boto3 Client): Client used for the requests
+            bucket_name (str): Name of the bucket
+            key (str): Key of the object
+            read_ahead (int): Minimum amount of bytes fetched per request of small and sequential reads
+            max_windows (int): Number of fetched ranges kept in memory, including the end of the object (at least 2)
+        """
+        super().__init__()
+        self.s3c = s3c
+        self.bucket_name = bucket_name
+        self.key = key
+        self.read_ahead = max(int(read_ahead), 1)
+        self.max_windows = max(int(max_windows), 2)
+        self.requests = 0
+        self.bytes_fetched = 0
+        self._operation = metrics.current()
+        self._position = 0
+        self._last_end = None
+        self._windows = []
+        self.size = None
+        self._fetch('bytes=-{}'.format(self.read_ahead))
+
+    def _fetch(self,byte_range):
+        """Fetches a byte range and keeps it as the newest window. When there are more than max_windows, the oldest window
+        except the first one (the end of the object with the footer) is dropped.
+        Args:
+            byte_range (str): Value of the Range header
+        Returns:
+            [tuple]: First byte and content of the window
+        """
+        with metrics.attached(self._operation), metrics.network(self._operation):
+            response = self.s3c.get_object(Bucket=self.bucket_name,Key=self.key,Range=byte_range)
+            data = response['Body'].read()
+        self.requests += 1
+        self.bytes_fetched += len(data)
+        if self._operation is not None:
+            self._operation.add(bytes=len(data))
+        content_range = response.get('ContentRange')
+        if content_range:
+            span, total = content_range.split(' ')[-1].split('/')
+            self.size = int(total)
+            start = int(span.split('-')[0]) if span != '*' else 0
+        else:
+            self.size = len(data)
+            start = 0
+        window = (start, memoryview(data))
+        self._windows.append(window)
+        if len(self._windows) > self.max_windows:
+            del self._windows[1]
+        return window
+
+    def _window_at(self,position):
+        """Returns the window that contains a byte
+        Args:
+            position (int): Position of the byte
+        Returns:
+            [tuple]: First byte and content of the window or None if no window contains the byte
+        """
+        for start, data in reversed(self._windows):
+            if start <= position < start + len(data):
+                return start, data
+        return None
+
+    def _fetch_missing(self,position,end,extend):
+        """Fetches the bytes from position up to end or up to the next window, whichever comes first
+        Args:
+            position (int): First missing byte
+            end (int): Byte after the last requested byte
+            extend (bool): Fetch at least read_ahead bytes
+        Returns:
+            [tuple]: First byte and content of the new window
+        """
+        limit = min([start for start, data in self._windows if start > position] + [self.size])
+        fetch_end = min(max(end, position + self.read_ahead) if extend else end, limit)
+        return self._fetch('bytes={}-{}'.format(position, max(fetch_end, position+1) - 1))
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self,offset,whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self._position = offset
+        elif whence == io.SEEK_CUR:
+            self._position += offset
+        elif whence == io.SEEK_END:
+            self._position = self.size + offset
+        else:
+            raise ValueError('Invalid whence {}'.format(whence))
+        self._position = max(self._position, 0)
+        return self._position
+
+    def readinto(self,buffer):
+        """Reads into a buffer. Parts of the range that are in a window are copied from it, only the rest is fetched.
+        Args:
+            buffer (writable buffer): Buffer to fill
+        Returns:
+            [int]: Number of bytes read
+        """
+        length = min(len(buffer), self.size - self._position)
+        if length <= 0:
+            return 0
+        view = memoryview(buffer).cast('B')
+        end = self._position + length
+        extend = length < SMALL_READ or self._position == self._last_end
+        position = self._position
+        while position < end:
+            window = self._window_at(position) or self._fetch_missing(position, end, extend)
+            start, data = window
+            chunk = min(end, start + len(data)) - position
+            if chunk <= 0:
+                raise IOError('Range request at byte {} of {} returned no data'.format(position, self.key))
+            view[position-self._position:position-self._position+chunk] = data[position-start:position-start+chunk]
+            position += chunk
+        self._position = self._last_end = end
+        return length
@@ -0,0 +1,254 @@
+# Copyright (c) 2022 RWTH Aachen - Werkzeugmaschinenlabor (WZL)
+# Contact: Simon Cramer, s.cramer@wzl-mq.rwth-aachen.de
+
+import io
+import gzip
+import json
+import math
+import pickle
+import struct
+import logging
+from .lazy import optional_import
+
+zstandard = optional_import('zstandard')
+lz4 = optional_import('lz4', 'lz4.frame')
+orjson = optional_import('orjson')
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIONS = ('zstd', 'lz4', 'gzip')
+
+_MAGIC = {
+    'zstd': b'\x28\xb5\x2f\xfd',
+    'lz4': b'\x04\x22\x4d\x18',
+    'gzip': b'\x1f\x8b',
+}
+_OOB_MAGIC = b'S3SOOOB5'
+_HEADER_SIZE = 8
+
+
+class _PrefixedReader(io.RawIOBase):
+    """Replays bytes that were already read from a file object before reading on from the file object itself.
+    """
+
+    def __init__(self,head,infile):
+        super().__init__()
+        self._head = head
+        self._infile = infile
+
+    def readable(self):
+        return True
+
+    def readinto(self,buffer):
+        if self._head:
+            length = min(len(buffer), len(self._head))
+            buffer[:length] = self._head[:length]
+            self._head = self._head[length:]
+            return length
+        return self._infile.readinto(buffer)
+
+
+def _require(compression):
+    """Checks if the package for a compression is installed
+    Args:
+        compression (str): "zstd", "lz4" or "gzip"
+    Raises:
+        ImportError: When the package is missing
+        ValueError: When the compression is unknown
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError('Unknown compression {}! Use one of {}.'.format(compression, COMPRESSIONS))
+    if compression == 'zstd' and zstandard is None:
+        raise ImportError('zstandard is required for zstd compression. Install it with pip install zstandard')
+    if compression == 'lz4' and lz4 is None:
+        raise ImportError('lz4 is required for lz4 compression. Install it with pip install lz4')
+
+def compressed_writer(outfile,compression=None,level=None):
+    """Wraps a binary file object, so everything written to it is compressed
+    Args:
+        outfile (file object): File object opened for binary writing
+        compression (str): "zstd", "lz4", "gzip" or None for no compression
+        level (int): Compression level. If not provided, the default level of the codec is used.
+    Returns:
+        File object that has to be closed before outfile
+    """
+    if compression is None:
+        return _NonClosingWriter(outfile)
+    _require(compression)
+    if compression == 'zstd':
+        compressor = zstandard.ZstdCompressor(level=3 if level is None else level)
+        return compressor.stream_writer(outfile, closefd=False)
+    if compression == 'lz4':
+        return lz4.frame.LZ4FrameFile(outfile, mode='wb', compression_level=level or 0)
+    return gzip.GzipFile(fileobj=outfile, mode='wb', compresslevel=6 if level is None else level, mtime=0)
+
+def decompressed_reader(infile):
+    """Detects the compression of a binary file object from its first bytes and returns a reader for the uncompressed content.
+    Files that are not compressed are returned unchanged, so files written without compression still load.
+    Args:
+        infile (file object): File object opened for binary reading
+    Returns:
+        [tuple]: File object with the uncompressed content and the name of the detected compression or None
+    """
+    if hasattr(infile, 'peek'):
+        head = infile.peek(_HEADER_SIZE)[:_HEADER_SIZE]
+    else:
+        head = infile.read(_HEADER_SIZE)
+        infile = io.BufferedReader(_PrefixedReader(head, infile))
+    for compression, magic in _MAGIC.items():
+        if head.startswith(magic):
+            _require(compression)
+            if compression == 'zstd':
+                return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(infile, closefd=False)), compression
+            if compression == 'lz4':
+                return io.BufferedReader(lz4.frame.LZ4FrameFile(infile, mode='rb')), compression
+            return io.BufferedReader(gzip.GzipFile(fileobj=infile, mode='rb')), compression
+    return infile, None
+
+
+class _NonClosingWriter(io.RawIOBase):
+    """Passes writes through to a file object without closing it, so uncompressed and compressed writers can be used the same way.
+    """
+
+    def __init__(self,outfile):
+        super().__init__()
+        self._outfile = outfile
+
+    def writable(self):
+        return True
+
+    def write(self,data):
+        return self._outfile.write(data)
+
+
+def dump_pickle(data,outfile,protocol=None):
+    """Pickles an object into a file object.
+    With protocol 5 large buffers (e.g. of NumPy arrays) are written out-of-band directly from memory after a small header,
+    instead of being copied into the pickle stream.
+    Args:
+        data (anything): Could be anything that is pickleable.
+        outfile (file object): File object opened for binary writing
+        protocol (int): Pickle protocol. If not provided, the default protocol is used.
+    """
+    if protocol is None or protocol < 5:
+        pickle.dump(data, outfile, protocol=protocol)
+        return
+    buffers = []
+    main = pickle.dumps(data, protocol=protocol, buffer_callback=buffers.append)
+    raws = [buffer.raw() for buffer in buffers]
+    outfile.write(_OOB_MAGIC)
+    outfile.write(struct.pack('<I', len(raws)))
+    outfile.write(struct.pack('<{}Q'.format(len(raws)+1), len(main), *[raw.nbytes for raw in raws]))
+    outfile.write(main)
+    for raw in raws:
+        outfile.write(raw)
+
+def _read_exactly(infile,length):
+    """Reads a given amount of bytes into a new writable buffer
+    Args:
+        infile (file object): File object opened for binary reading
+        length (int): Amount of bytes
+    Raises:
+        EOFError: When the file ends before
+    Returns:
+        [bytearray]: Buffer with the content
+    """
+    buffer = bytearray(length)
+    view = memoryview(buffer)
+    position = 0
+    while position < length:
+        read = infile.readinto(view[position:])
+        if not read:
+            raise EOFError('File ended after {} of {} bytes'.format(position, length))
+        position += read
+    return buffer
+
+def _read_buffer(infile,length):
+    """Reads a given amount of bytes as buffer for pickle.loads. Files over a downloaded buffer return views of it instead of copies.
+    Args:
+        infile (file object): File object opened for binary reading
+        length (int): Amount of bytes
+    Returns:
+        [bytearray or memoryview]: Buffer with the content
+    """
+    if hasattr(infile, 'read_view'):
+        return infile.read_view(length)
+    return _read_exactly(infile, length)
+
+def load_pickle(infile,loads=pickle.loads,load=pickle.load):
+    """Loads a pickled object from a file object. Detects compression and pickles with out-of-band buffers.
+    Out-of-band buffers of uncompressed pickles in a downloaded buffer are not copied.
+    Args:
+        infile (file object): File object opened for binary reading
+        loads (callable): Function to load pickled bytes with out-of-band buffers
+        load (callable): Function to load a pickle stream
+    Returns:
+        Can be everything that is pickleable
+    """
+    infile, compression = decompressed_reader(infile)
+    head = infile.peek(len(_OOB_MAGIC))[:len(_OOB_MAGIC)]
+    if head != _OOB_MAGIC:
+        return load(infile)
+    infile.read(len(_OOB_MAGIC))
+    count, = struct.unpack('<I', _read_exactly(infile, 4))
+    lengths = struct.unpack('<{}Q'.format(count+1), _read_exactly(infile, 8*(count+1)))
+    main = _read_buffer(infile, lengths[0])
+    buffers = [_read_buffer(infile, length) for length in lengths[1:]]
+    return loads(main, buffers=buffers)
+
+def _has_non_finite(data):
+    """Checks if an object contains NaN or Infinity floats, including NumPy scalars and arrays
+    Args:
+        data (anything): Object to check
+    Returns:
+        [bool]: True if a float is not finite
+    """
+    if isinstance(data, float):
+        return not math.isfinite(data)
+    if isinstance(data, dict):
+        return any(_has_non_finite(value) for value in data.values())
+    if isinstance(data, (list, tuple)):
+        return any(_has_non_finite(value) for value in data)
+    if getattr(getattr(data, 'dtype', None), 'kind', None) in ('f', 'c'):
+        return _has_non_finite(data.tolist())
+    return False
+
+def _json_default(data):
+    """Converts NumPy arrays and scalars for the json module
+    """
+    if hasattr(data, 'tolist'):
+        return data.tolist()
+    raise TypeError('Object of type {} is not JSON serializable'.format(type(data).__name__))
+
+def dumps_json(data):
+    """Serializes an object as json. Uses orjson if it is installed, which is several times faster than the json module.
+    orjson writes NaN and Infinity as null, so objects with these floats are written with the json module as NaN and Infinity.
+    Objects orjson does not support fall back to the json module as well.
+    Args:
+        data (anything): Object that can be serialized as json
+    Returns:
+        [bytes]: UTF-8 encoded json
+    """
+    if orjson is not None:
+        try:
+            encoded = orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+        except TypeError:
+            encoded = None
+        # Only output with null can contain a replaced NaN or Infinity
+        if encoded is not None and (b'null' not in encoded or not _has_non_finite(data)):
+            return encoded
+    return json.dumps(data, default=_json_default).encode('utf-8')
+
+def loads_json(data):
+    """Parses json. Uses orjson if it is installed and falls back to the json module for content orjson rejects (e.g. NaN).
+    Args:
+        data (bytes): json content
+    Returns:
+        Json content
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(data)
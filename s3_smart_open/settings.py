@@ -0,0 +1,85 @@
+# Copyright (c) 2022 RWTH Aachen - Werkzeugmaschinenlabor (WZL)
+# Contact: Simon Cramer, s.cramer@wzl-mq.rwth-aachen.de
+
+import os
+import logging
+import threading
+import collections
+
+logger = logging.getLogger(__name__)
+
+CONFIG_PATH = os.path.join('s3config','config.yaml')
+
+S3Settings = collections.namedtuple('S3Settings', ['endpoint', 'access_key_id', 'secret_access_key', 'source'])
+
+_settings_lock = threading.Lock()
+# The config file is looked up relative to the working directory at import time, like before it was read on import
+_settings = {'explicit': None, 'config_path': os.path.abspath(CONFIG_PATH), 'file': None, 'file_loaded': False, 'resolved': None, 'warned': False}
+
+def configure_s3(endpoint=None,access_key_id=None,secret_access_key=None,config_path=None):
+    """Configures the s3 connection explicitly instead of through s3config/config.yaml or environment variables.
+    Clients that were created before are rebuilt on next use.
+    Args:
+        endpoint (str): s3 endpoint e.g. s3.example.com or http://127.0.0.1:5000
+        access_key_id (str): Access key
+        secret_access_key (str): Secret key
+        config_path (str): Path of a yaml config file with AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY and S3_ENDPOINT, used when no endpoint is given
+    """
+    with _settings_lock:
+        if endpoint is not None:
+            _settings['explicit'] = S3Settings(endpoint, access_key_id or '', secret_access_key or '', 'configure_s3')
+        if config_path is not None:
+            _settings['config_path'] = config_path
+            _settings['file'] = None
+            _settings['file_loaded'] = False
+        _settings['resolved'] = None
+
+def reset_s3_settings():
+    """Forgets the explicit configuration and the loaded config file, so the settings are resolved again on next use
+    """
+    with _settings_lock:
+        _settings.update(explicit=None, config_path=os.path.abspath(CONFIG_PATH), file=None, file_loaded=False, resolved=None, warned=False)
+
+def _load_config_file(path):
+    """Loads the s3 settings from a yaml config file
+    Args:
+        path (str): Path of the config file
+    Returns:
+        [S3Settings]: Settings of the file or None if it does not exist
+    """
+    if not os.path.exists(path):
+        return None
+    import yaml
+    with open(path,'r') as stream:
+        config = yaml.safe_load(stream)
+    return S3Settings(config['S3_ENDPOINT'], config['AWS_ACCESS_KEY_ID'], config['AWS_SECRET_ACCESS_KEY'], path)
+
+def get_s3_settings():
+    """Returns the s3 settings. They are resolved on first use and cached:
+    settings from configure_s3, else the config file s3config/config.yaml (read once), else the environment variables
+    AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY and S3_ENDPOINT. The environment is checked on every call, so changed variables take effect.
+    Returns:
+        [S3Settings]: endpoint, access_key_id, secret_access_key and the source of the settings
+    """
+    if _settings['explicit'] is not None:
+        return _settings['explicit']
+    if not _settings['file_loaded']:
+        with _settings_lock:
+            if not _settings['file_loaded']:
+                _settings['file'] = _load_config_file(_settings['config_path'])
+                _settings['file_loaded'] = True
+    if _settings['file'] is not None:
+        return _settings['file']
+    environment = (os.environ.get('S3_ENDPOINT'), os.environ.get('AWS_ACCESS_KEY_ID', ''), os.environ.get('AWS_SECRET_ACCESS_KEY', ''))
+    resolved = _settings['resolved']
+    if resolved is not None and resolved[0] == environment:
+        return resolved[1]
+    endpoint, access_key_id, secret_access_key = environment
+    if endpoint is None:
+        if not _settings['warned']:
+            logger.warning('S3 connection could not be configured. No config file was found. Filehandler will only work for local files!')
+            _settings['warned'] = True
+        endpoint = 's3'
+    settings = S3Settings(endpoint, access_key_id, secret_access_key, 'environment')
+    _settings['resolved'] = (environment, settings)
+    return settings
@@ -0,0 +1,638 @@
+# Copyright (c) 2022 RWTH Aachen - Werkzeugmaschinenlabor (WZL)
+# Contact: Simon Cramer, s.cramer@wzl-mq.rwth-aachen.de
+
+import os
+import re
+import json
+import zlib
+import base64
+import hashlib
+import logging
+import tempfile
+import threading
+import concurrent.futures
+from . import metrics
+from .lazy import lazy_import, optional_import
+from .filehandler import generate_s3_strings, _get_s3_client, _is_not_found, _transfer_settings
+
+botocore = lazy_import('botocore', 'botocore.exceptions')
+crc32c = optional_import('crc32c')
+
+logger = logging.getLogger(__name__)
+
+CHECKSUMS = ('md5', 'crc32', 'crc32c')
+
+_STATE_VERSION = 1
+_CHECKSUM_FIELDS = {'crc32': 'ChecksumCRC32', 'crc32c': 'ChecksumCRC32C'}
+_MD5_ETAG = re.compile(r'^[0-9a-f]{32}(-\d+)?$')
+_MIN_PART_SIZE = 5*1024*1024
+_MAX_PARTS = 10000
+_BLOCK_SIZE = 1024*1024
+
+
+class _Crc:
+    """hashlib like wrapper for crc functions with the signature function(data, value)
+    """
+
+    def __init__(self,function):
+        self._function = function
+        self._value = 0
+
+    def update(self,data):
+        self._value = self._function(data, self._value)
+
+    def digest(self):
+        return (self._value & 0xffffffff).to_bytes(4, 'big')
+
+
+def _require(checksum):
+    """Checks if a checksum algorithm is known and available
+    Args:
+        checksum (str): "md5", "crc32" or "crc32c"
+    Raises:
+        ImportError: When the package for crc32c is missing
+        ValueError: When the checksum is unknown
+    """
+    if checksum not in CHECKSUMS:
+        raise ValueError('Unknown checksum {}! Use one of {}.'.format(checksum, CHECKSUMS))
+    if checksum == 'crc32c' and crc32c is None:
+        raise ImportError('crc32c is required for crc32c checksums. Install it with pip install crc32c')
+
+def _hasher(checksum):
+    """Creates a hash object for a checksum algorithm
+    Args:
+        checksum (str): "md5", "crc32" or "crc32c"
+    Returns:
+        Object with update(data) and digest()
+    """
+    if checksum == 'md5':
+        return hashlib.md5()
+    if checksum == 'crc32':
+        return _Crc(zlib.crc32)
+    return _Crc(crc32c.crc32c)
+
+def _encode(checksum,digest):
+    """Encodes a digest the way s3 shows it: md5 as hex (ETag), crc checksums as base64
+    Args:
+        checksum (str): "md5", "crc32" or "crc32c"
+        digest (bytes): Raw digest
+    Returns:
+        [str]: Encoded digest
+    """
+    if checksum == 'md5':
+        return digest.hex()
+    return base64.b64encode(digest).decode('ascii')
+
+def _decode(checksum,value):
+    """Decodes a digest encoded with _encode
+    Args:
+        checksum (str): "md5", "crc32" or "crc32c"
+        value (str): Encoded digest
+    Returns:
+        [bytes]: Raw digest
+    """
+    if checksum == 'md5':
+        return bytes.fromhex(value)
+    return base64.b64decode(value)
+
+def _composite(checksum,values):
+    """Computes the checksum s3 shows for a multipart object from the checksums of its parts
+    Args:
+        checksum (str): "md5", "crc32" or "crc32c"
+        values (list[str]): Encoded checksums of the parts in order
+    Returns:
+        [str]: Encoded checksum of the object, e.g. the multipart ETag
+    """
+    hasher = _hasher(checksum)
+    hasher.update(b''.join(_decode(checksum, value) for value in values))
+    return '{}-{}'.format(_encode(checksum, hasher.digest()), len(values))
+
+def _same(expected,actual):
+    """Compares two encoded checksums. Some s3 implementations leave out the number of parts of composite checksums.
+    Args:
+        expected (str): Computed checksum
+        actual (str): Checksum reported by s3
+    Returns:
+        [bool]: True if the checksums match
+    """
+    if actual is None:
+        return False
+    return expected.strip('"').split('-')[0] == actual.strip('"').split('-')[0]
+
+def _hash_file(local_path,start,end,checksum):
+    """Computes the checksum of a byte range of a local file
+    Args:
+        local_path (str): Path to the file
+        start (int): First byte
+        end (int): Byte after the last byte
+        checksum (str): "md5", "crc32" or "crc32c"
+    Returns:
+        [str]: Encoded checksum
+    """
+    hasher = _hasher(checksum)
+    with open(local_path, 'rb') as infile:
+        infile.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            block = infile.read(min(_BLOCK_SIZE, remaining))
+            if not block:
+                break
+            hasher.update(block)
+            remaining -= len(block)
+    return _encode(checksum, hasher.digest())
+
+def _part_size(size,part_size=None):
+    """Chooses the part size of a transfer. Objects with more than 10000 parts of the configured size get larger parts.
+    Args:
+        size (int): Size of the object in bytes
+        part_size (int): Requested part size. Defaults to multipart_chunksize of configure_transfer.
+    Returns:
+        [int]: Part size in bytes
+    """
+    part_size = part_size or _transfer_settings['multipart_chunksize']
+    return max(part_size, _MIN_PART_SIZE, -(-size // _MAX_PARTS))
+
+def _parts(size,part_size):
+    """Splits an object into parts
+    Args:
+        size (int): Size of the object in bytes
+        part_size (int): Size of the parts in bytes
+    Returns:
+        [list[tuple]]: Part number (starting at 1), first byte and byte after the last byte of every part
+    """
+    return [(number+1, start, min(start+part_size, size)) for number, start in enumerate(range(0, max(size, 1), part_size))]
+
+def _state_path(kind,*names):
+    """Returns the path of the state file of a transfer in s3_smart_open_transfers in the temp directory
+    Args:
+        kind (str): "upload" or "download"
+        names (str): Values that identify the transfer, e.g. bucket, key and local path
+    Returns:
+        [str]: Path of the state file
+    """
+    directory = os.path.join(tempfile.gettempdir(), 's3_smart_open_transfers')
+    os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha256('\0'.join((kind,)+names).encode('utf-8')).hexdigest()
+    return os.path.join(directory, '{}-{}.json'.format(kind, digest))
+
+def _load_state(path):
+    """Loads the state of an interrupted transfer
+    Args:
+        path (str): Path of the state file
+    Returns:
+        [dict]: State or None if there is no valid state
+    """
+    try:
+        with open(path, 'r') as infile:
+            state = json.load(infile)
+    except (OSError, ValueError):
+        return None
+    if state.get('version') != _STATE_VERSION:
+        return None
+    return state
+
+def _save_state(path,state):
+    """Writes the state of a transfer atomically, so an interruption never leaves a half written state
+    Args:
+        path (str): Path of the state file
+        state (dict): State to write
+    """
+    handle, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'w') as outfile:
+            json.dump(state, outfile)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _remove(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+def _run_parts(function,parts,max_workers=None):
+    """Transfers parts in parallel. The measured operation of the calling thread is attached to the workers.
+    Args:
+        function (callable): Transfers one part, takes (number, start, end)
+        parts (list[tuple]): Parts from _parts
+        max_workers (int): Number of parallel parts. Defaults to max_concurrency of configure_transfer.
+    """
+    if not parts:
+        return
+    operation = metrics.current()
+
+    def _attached(part):
+        with metrics.attached(operation):
+            return function(*part)
+
+    max_workers = max_workers or _transfer_settings['max_concurrency']
+    with metrics.network(), concurrent.futures.ThreadPoolExecutor(max_workers=min(max_workers, len(parts))) as executor:
+        for future in [executor.submit(_attached, part) for part in parts]:
+            future.result()
+
+def _with_attempts(function,max_attempts,name):
+    """Calls a transfer function until it succeeds. Every attempt continues from the state the last attempt left behind.
+    Args:
+        function (callable): Runs one attempt
+        max_attempts (int): Maximum number of attempts
+        name (str): Name of the transferred file for the log
+    Raises:
+        ValueError: When the object or file does not exist
+    Returns:
+        Result of function
+    """
+    for attempt in range(1, max_attempts+1):
+        try:
+            return function()
+        except Exception as e:
+            if _is_not_found(e):
+                raise ValueError('Input path or filename does not exist!') from e
+            if attempt == max_attempts:
+                raise
+            logger.warning('Transfer of {} failed in attempt {} of {}, resuming ; Reason {}'.format(name, attempt, max_attempts, e))
+
+def _object_checksum(head):
+    """Finds the checksum an object can be verified with
+    Args:
+        head (dict): Response of head_object with ChecksumMode ENABLED
+    Returns:
+        [tuple]: checksum algorithm and encoded value, or (None, None) if the object has no usable checksum
+    """
+    etag = head['ETag'].strip('"')
+    if _MD5_ETAG.match(etag):
+        return 'md5', etag
+    for checksum, field in _CHECKSUM_FIELDS.items():
+        if head.get(field) and (checksum != 'crc32c' or crc32c is not None):
+            return checksum, head[field]
+    return None, None
+
+@metrics.instrument
+def resumable_download(input_path,filename,output_path=None,part_size=None,max_workers=None,verify=True,max_attempts=3):
+    """Downloads an object from s3 storage to local disk in parts that are fetched in parallel with ranged GET requests.
+    The data is written to <file>.part and the completed parts are recorded in a state file, so an interrupted download
+    continues with the missing parts on the next call. If the object changed in between, the download starts over.
+    The parts follow the part boundaries of multipart uploads, so the object is verified against its ETag (MD5)
+    or its CRC32/CRC32C checksum without reading the file again.
+    Args:
+        input_path (str): Path to s3 storage, ! without filename !
+        filename (str): Name of the Object in the s3 storage.
+        output_path (str): Path where object will be saved on local disk
+        part_size (int): Size of the parts in bytes. Defaults to the part size of the upload or multipart_chunksize of configure_transfer.
+        max_workers (int): Number of parallel parts. Defaults to max_concurrency of configure_transfer.
+        verify (bool): Verify the downloaded file and, when resuming, the parts that were downloaded before
+        max_attempts (int): Number of attempts before the last error is raised. Every attempt resumes the download.
+    Raises:
+        ValueError: When the object does not exist or the downloaded file does not match the checksum of the object
+    Returns:
+        [dict]: Summary with bytes, transferred bytes, resumed bytes, parts and the checksum used for verification
+    """
+    bucket_name, prefix, path = generate_s3_strings(input_path)
+    local_path = filename if output_path is None else os.path.join(output_path, filename)
+    logger.info('----Download started: {} ----'.format(filename))
+    summary = _with_attempts(lambda: _download(_get_s3_client(), bucket_name, prefix+filename, local_path, part_size, max_workers, verify), max_attempts, filename)
+    logger.info('----Download finished: {} ----'.format(filename))
+    return summary
+
+def _upload_parts(s3c,bucket_name,key,count,max_workers=None):
+    """Finds the parts a multipart object was uploaded with by HEAD requests with PartNumber
+    Args:
+        s3c (boto3 Client): Client used for the requests
+        bucket_name (str): Name of the bucket
+        key (str): Key of the object
+        count (int): Number of parts
+        max_workers (int): Number of parallel requests
+    Returns:
+        [list[tuple]]: Part number, first byte and byte after the last byte of every part
+    """
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers or _transfer_settings['max_concurrency']) as executor:
+        sizes = list(executor.map(lambda number: s3c.head_object(Bucket=bucket_name, Key=key, PartNumber=number)['ContentLength'], range(1, count+1)))
+    parts = []
+    start = 0
+    for number, size in enumerate(sizes, 1):
+        parts.append((number, start, start+size))
+        start += size
+    return parts
+
+def _verify_download(s3c,bucket_name,key,part_path,parts,values,head,checksum,expected,max_workers):
+    """Compares a downloaded file with the checksum of the object.
+    Composite checksums of multipart objects are built from the checksums of the downloaded parts if the parts have the
+    boundaries of the upload, else from the local file with the part boundaries s3 reports.
+    Returns:
+        [str]: Checksum of the downloaded file
+    """
+    size = head['ContentLength']
+    etag = head['ETag'].strip('"')
+    if checksum == 'md5':
+        composite = '-' in etag
+    else:
+        composite = head.get('ChecksumType', 'COMPOSITE' if '-' in etag else 'FULL_OBJECT') == 'COMPOSITE'
+    if not composite:
+        return values[0] if len(parts) == 1 else _hash_file(part_path, 0, size, checksum)
+    count = int(etag.split('-')[1]) if '-' in etag else head.get('PartsCount') or 1
+    if len(parts) == count:
+        actual = _composite(checksum, values)
+        if _same(actual, expected):
+            return actual
+    # The upload had parts of different sizes, e.g. from a streaming writer
+    upload_parts = _upload_parts(s3c, bucket_name, key, count, max_workers)
+    return _composite(checksum, [_hash_file(part_path, start, end, checksum) for number, start, end in upload_parts])
+
+def _download(s3c,bucket_name,key,local_path,part_size,max_workers,verify):
+    """Runs one attempt of resumable_download
+    """
+    head = s3c.head_object(Bucket=bucket_name, Key=key, ChecksumMode='ENABLED')
+    size = head['ContentLength']
+    etag = head['ETag']
+    checksum, expected = _object_checksum(head)
+    if part_size is None and '-' in etag:
+        # Parts with the boundaries of the upload have the checksums the object checksum was built from
+        part_size = s3c.head_object(Bucket=bucket_name, Key=key, PartNumber=1)['ContentLength']
+    else:
+        part_size = _part_size(size, part_size)
+    parts = _parts(size, part_size)
+    part_path = local_path+'.part'
+    state_path = _state_path('download', bucket_name, key, os.path.abspath(local_path))
+    state = _load_state(state_path)
+    if state is None or state['etag'] != etag or state['part_size'] != part_size or not os.path.exists(part_path):
+        state = {'version': _STATE_VERSION, 'bucket': bucket_name, 'key': key, 'etag': etag, 'size': size,
+                 'part_size': part_size, 'checksum': checksum, 'parts': {}}
+        if os.path.dirname(local_path):
+            os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        with open(part_path, 'wb') as outfile:
+            outfile.truncate(size)
+        _save_state(state_path, state)
+    elif verify and checksum is not None:
+        for number, start, end in parts:
+            value = state['parts'].get(str(number))
+            if value is not None and _hash_file(part_path, start, end, checksum) != value:
+                logger.warning('Part {} of {} changed on disk, downloading it again'.format(number, local_path))
+                del state['parts'][str(number)]
+    missing = [part for part in parts if str(part[0]) not in state['parts']]
+    resumed = size - sum(end-start for number, start, end in missing)
+    if resumed:
+        logger.info('Resuming download of {} with {} of {} parts missing'.format(key, len(missing), len(parts)))
+    lock = threading.Lock()
+
+    def _download_part(number, start, end):
+        hasher = _hasher(checksum) if checksum else None
+        if start < end:
+            response = s3c.get_object(Bucket=bucket_name, Key=key, Range='bytes={}-{}'.format(start, end-1), IfMatch=etag)
+            written = 0
+            with open(part_path, 'r+b') as outfile:
+                outfile.seek(start)
+                for block in response['Body'].iter_chunks(_BLOCK_SIZE):
+                    outfile.write(block)
+                    if hasher is not None:
+                        hasher.update(block)
+                    written += len(block)
+                outfile.flush()
+                os.fsync(outfile.fileno())
+            if written != end-start:
+                raise IOError('Part {} of {} is incomplete: {} of {} bytes'.format(number, key, written, end-start))
+            metrics.count(bytes=written)
+        with lock:
+            state['parts'][str(number)] = _encode(checksum, hasher.digest()) if hasher is not None else ''
+            _save_state(state_path, state)
+
+    _run_parts(_download_part, missing, max_workers)
+    if verify and checksum is None:
+        logger.warning('{} has no MD5 ETag or checksum, the download is not verified'.format(key))
+    elif verify:
+        values = [state['parts'][str(number)] for number, start, end in parts]
+        actual = _verify_download(s3c, bucket_name, key, part_path, parts, values, head, checksum, expected, max_workers)
+        if not _same(actual, expected):
+            _remove(state_path)
+            _remove(part_path)
+            raise ValueError('Checksum mismatch for {}: expected {}, downloaded {}'.format(key, expected, actual))
+    os.replace(part_path, local_path)
+    _remove(state_path)
+    return {'bytes': size, 'transferred': size-resumed, 'resumed': resumed, 'parts': len(parts), 'checksum': checksum if verify else None}
+
+@metrics.instrument
+def resumable_upload(output_path,filename,data,part_size=None,max_workers=None,checksum='md5',upload_id=None,max_attempts=3):
+    """Uploads a local file to s3 storage as multipart upload that can be resumed. The completed parts and the upload ID are recorded
+    in a state file, so an interrupted upload reattaches to the multipart upload on the next call and only sends the missing parts.
+    Every part is sent with its checksum (Content-MD5 or x-amz-checksum-crc32/crc32c) and compared with the checksum s3 reports,
+    the object is compared with the composite checksum of all parts after completion.
+    Args:
+        output_path (str): Path to s3 storage
+        filename (str): The object will be save with this filename
+        data (str): Path of the local file to upload
+        part_size (int): Size of the parts in bytes. Defaults to multipart_chunksize of configure_transfer.
+        max_workers (int): Number of parallel parts. Defaults to max_concurrency of configure_transfer.
+        checksum (str): Checksum of the parts: "md5", "crc32" or "crc32c"
+        upload_id (str): ID of an in-progress multipart upload to reattach to, e.g. one started on another machine.
+            The parts that were uploaded before are verified against the local file.
+        max_attempts (int): Number of attempts before the last error is raised. Every attempt resumes the upload.
+    Raises:
+        ValueError: When the file does not exist or the object does not match the checksum of the file
+    Returns:
+        [dict]: Summary with bytes, transferred bytes, resumed bytes, parts, the checksum and the ETag of the object
+    """
+    _require(checksum)
+    if not os.path.isfile(data):
+        raise ValueError('Input path or filename does not exist!')
+    bucket_name, prefix, path = generate_s3_strings(output_path)
+    logger.info('----Upload started: {} ----'.format(filename))
+    summary = _with_attempts(lambda: _upload(_get_s3_client(), bucket_name, prefix+filename, data, part_size, max_workers, checksum, upload_id), max_attempts, filename)
+    logger.info('----Upload finished: {} ----'.format(filename))
+    return summary
+
+def _checksum_arguments(checksum,value):
+    """Builds the request arguments that send the checksum of a part or object
+    Args:
+        checksum (str): "md5", "crc32" or "crc32c"
+        value (str): Encoded checksum
+    Returns:
+        [dict]: Arguments for put_object or upload_part
+    """
+    if checksum == 'md5':
+        return {'ContentMD5': base64.b64encode(bytes.fromhex(value)).decode('ascii')}
+    return {_CHECKSUM_FIELDS[checksum]: value}
+
+def _reported(checksum,response):
+    """Returns the checksum s3 reports for a part or object
+    """
+    if checksum == 'md5':
+        etag = response.get('ETag')
+        # ETags of encrypted objects (SSE-KMS, SSE-C) are no MD5 checksums
+        return etag if etag and _MD5_ETAG.match(etag.strip('"')) else None
+    return response.get(_CHECKSUM_FIELDS[checksum])
+
+def _read_part(local_path,start,end,checksum):
+    """Reads a part of a local file and computes its checksum
+    Returns:
+        [tuple]: Data and encoded checksum
+    """
+    with open(local_path, 'rb') as infile:
+        infile.seek(start)
+        data = infile.read(end-start)
+    hasher = _hasher(checksum)
+    hasher.update(data)
+    return data, _encode(checksum, hasher.digest())
+
+def _list_parts(s3c,bucket_name,key,upload_id):
+    """Lists the parts of a multipart upload
+    Returns:
+        [dict]: Part metadata by part number
+    """
+    uploaded = {}
+    paginator = s3c.get_paginator('list_parts')
+    for page in paginator.paginate(Bucket=bucket_name, Key=key, UploadId=upload_id):
+        for part in page.get('Parts', []):
+            uploaded[part['PartNumber']] = part
+    return uploaded
+
+def _is_no_such_upload(error):
+    return isinstance(error, botocore.exceptions.ClientError) and error.response['Error']['Code'] in ('NoSuchUpload', '404')
+
+def _verified_parts(local_path,parts,uploaded,known,checksum):
+    """Finds the parts of an interrupted multipart upload that do not need to be sent again:
+    parts that s3 still has and whose checksum (or MD5 ETag) matches the local file.
+    Args:
+        local_path (str): Path of the local file
+        parts (list[tuple]): Parts from _parts
+        uploaded (dict): Parts listed by s3 by part number
+        known (dict): Parts recorded in the state file
+        checksum (str): "md5", "crc32" or "crc32c"
+    Returns:
+        [dict]: Checksum and ETag by part number
+    """
+    verified = {}
+    for number, start, end in parts:
+        part = uploaded.get(number)
+        if part is None or part['Size'] != end-start:
+            continue
+        value = known.get(str(number), [None])[0] or _hash_file(local_path, start, end, checksum)
+        reported = _reported(checksum, part)
+        if reported is None and _reported('md5', part) is not None:
+            matches = _same(_hash_file(local_path, start, end, 'md5'), part['ETag'])
+        elif reported is None:
+            matches = str(number) in known
+        else:
+            matches = _same(value, reported)
+        if matches:
+            verified[str(number)] = [value, part['ETag']]
+    return verified
+
+def _upload(s3c,bucket_name,key,local_path,part_size,max_workers,checksum,upload_id):
+    """Runs one attempt of resumable_upload
+    """
+    stat = os.stat(local_path)
+    size = stat.st_size
+    if size <= _transfer_settings['multipart_threshold'] and upload_id is None:
+        data, value = _read_part(local_path, 0, size, checksum)
+        arguments = _checksum_arguments(checksum, value)
+        if checksum != 'md5':
+            arguments['ChecksumAlgorithm'] = checksum.upper()
+        response = s3c.put_object(Bucket=bucket_name, Key=key, Body=data, **arguments)
+        metrics.count(bytes=size)
+        reported = _reported(checksum, response)
+        if reported is None:
+            logger.warning('{} reports no {} checksum, the upload is not verified'.format(key, checksum))
+        elif not _same(value, reported):
+            raise ValueError('Checksum mismatch for {}: sent {}, s3 reported {}'.format(key, value, reported))
+        return {'bytes': size, 'transferred': size, 'resumed': 0, 'parts': 1, 'checksum': checksum, 'etag': response['ETag']}
+
+    state_path = _state_path('upload', bucket_name, key, os.path.abspath(local_path))
+    state = _load_state(state_path)
+    source = [size, stat.st_mtime_ns]
+    if state is not None and upload_id and state['upload_id'] != upload_id:
+        state = None
+    elif state is not None and (state['source'] != source or state['checksum'] != checksum):
+        logger.info('{} changed since the interrupted upload, starting over'.format(local_path))
+        _abort(s3c, bucket_name, key, state['upload_id'])
+        state = None
+    uploaded = {}
+    if state is not None or upload_id:
+        try:
+            uploaded = _list_parts(s3c, bucket_name, key, upload_id or state['upload_id'])
+        except botocore.exceptions.ClientError as e:
+            if not _is_no_such_upload(e) or upload_id:
+                raise
+            logger.info('Upload {} of {} does not exist anymore, starting over'.format(state['upload_id'], key))
+            state = None
+    if state is None and upload_id:
+        # Without a state file the part size is taken from the first part that was uploaded
+        part_size = uploaded[1]['Size'] if 1 in uploaded else _part_size(size, part_size)
+        state = {'upload_id': upload_id, 'part_size': part_size, 'parts': {}}
+    elif state is None:
+        arguments = {'ChecksumAlgorithm': checksum.upper()} if checksum != 'md5' else {}
+        state = {'upload_id': s3c.create_multipart_upload(Bucket=bucket_name, Key=key, **arguments)['UploadId'],
+                 'part_size': _part_size(size, part_size), 'parts': {}}
+    elif 1 in uploaded and uploaded[1]['Size'] != min(state['part_size'], size):
+        logger.warning('Part 1 of upload {} has {} bytes, the state file recorded parts of {} bytes. Using the size of the uploaded part'.format(
+            state['upload_id'], uploaded[1]['Size'], state['part_size']))
+        state.update(part_size=uploaded[1]['Size'], parts={})
+    state.update(version=_STATE_VERSION, bucket=bucket_name, key=key, source=source, checksum=checksum)
+    upload_id = state['upload_id']
+    parts = _parts(size, state['part_size'])
+    if len(parts) > _MAX_PARTS:
+        raise ValueError('{} needs {} parts with part size {}, s3 allows {}'.format(local_path, len(parts), state['part_size'], _MAX_PARTS))
+    state['parts'] = _verified_parts(local_path, parts, uploaded, state['parts'], checksum)
+    _save_state(state_path, state)
+    missing = [part for part in parts if str(part[0]) not in state['parts']]
+    resumed = size - sum(end-start for number, start, end in missing)
+    if resumed:
+        logger.info('Resuming upload {} of {} with {} of {} parts missing'.format(upload_id, key, len(missing), len(parts)))
+    lock = threading.Lock()
+
+    def _upload_part(number, start, end):
+        data, value = _read_part(local_path, start, end, checksum)
+        response = s3c.upload_part(Bucket=bucket_name, Key=key, UploadId=upload_id, PartNumber=number, Body=data, **_checksum_arguments(checksum, value))
+        reported = _reported(checksum, response)
+        if reported is not None and not _same(value, reported):
+            raise ValueError('Checksum mismatch for part {} of {}: sent {}, s3 reported {}'.format(number, key, value, reported))
+        metrics.count(bytes=end-start)
+        with lock:
+            state['parts'][str(number)] = [value, response['ETag']]
+            _save_state(state_path, state)
+
+    _run_parts(_upload_part, missing, max_workers)
+    completed = []
+    for number, start, end in parts:
+        value, etag = state['parts'][str(number)]
+        part = {'PartNumber': number, 'ETag': etag}
+        if checksum != 'md5':
+            part[_CHECKSUM_FIELDS[checksum]] = value
+        completed.append(part)
+    response = s3c.complete_multipart_upload(Bucket=bucket_name, Key=key, UploadId=upload_id, MultipartUpload={'Parts': completed})
+    _remove(state_path)
+    expected = _composite(checksum, [state['parts'][str(number)][0] for number, start, end in parts])
+    reported = _reported(checksum, response)
+    if reported is None and checksum != 'md5':
+        reported = s3c.head_object(Bucket=bucket_name, Key=key, ChecksumMode='ENABLED').get(_CHECKSUM_FIELDS[checksum])
+    if reported is None:
+        logger.warning('{} reports no {} checksum, only the parts were verified'.format(key, checksum))
+    elif not _same(expected, reported):
+        raise ValueError('Checksum mismatch for {}: expected {}, s3 reported {}'.format(key, expected, reported))
+    return {'bytes': size, 'transferred': size-resumed, 'resumed': resumed, 'parts': len(parts), 'checksum': checksum, 'etag': response['ETag']}
+
+def _abort(s3c,bucket_name,key,upload_id):
+    """Aborts a multipart upload, an upload that does not exist anymore is ignored
+    """
+    try:
+        s3c.abort_multipart_upload(Bucket=bucket_name, Key=key, UploadId=upload_id)
+    except botocore.exceptions.ClientError as e:
+        if not _is_no_such_upload(e):
+            raise
+
+def abort_resumable_upload(output_path,filename,data):
+    """Aborts an interrupted resumable_upload, so s3 deletes the uploaded parts, and removes its state file
+    Args:
+        output_path (str): Path to s3 storage
+        filename (str): Filename of the upload
+        data (str): Path of the local file that was uploaded
+    Returns:
+        [str]: ID of the aborted multipart upload or None if there was no interrupted upload
+    """
+    bucket_name, prefix, path = generate_s3_strings(output_path)
+    state_path = _state_path('upload', bucket_name, prefix+filename, os.path.abspath(data))
+    state = _load_state(state_path)
+    if state is None:
+        return None
+    _abort(_get_s3_client(), bucket_name, prefix+filename, state['upload_id'])
+    _remove(state_path)
+    logger.info('Aborted upload {} of {}'.format(state['upload_id'], filename))
+    return state['upload_id']
@@ -21,6 +21,14 @@ setuptools.setup(
         'joblib',
         'dill'
     ],
+    extras_require = {
+        'aio': ['aiobotocore'],
+        'compression': ['zstandard', 'lz4'],
+        'json': ['orjson'],
+        'benchmark': ['moto[server]', 'psutil'],
+        'checksum': ['crc32c'],
+        'test': ['pytest', 'moto[server]', 'aiobotocore'],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "Operating System :: OS Independent",
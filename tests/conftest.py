@@ -0,0 +1,56 @@
+# Copyright (c) 2022 RWTH Aachen - Werkzeugmaschinenlabor (WZL)
+# Contact: Simon Cramer, s.cramer@wzl-mq.rwth-aachen.de
+
+import os
+import pytest
+
+# moto intercepts requests to this endpoint, it has to be set before moto is imported
+os.environ.setdefault('MOTO_S3_CUSTOM_ENDPOINTS', 'https://s3.local')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+moto = pytest.importorskip('moto')
+
+BUCKET = 'bucket'
+
+
+@pytest.fixture
+def s3(monkeypatch):
+    """Mocked s3 with an empty bucket. Yields the shared client of the filehandler.
+    """
+    from s3_smart_open import filehandler, settings
+    monkeypatch.setenv('S3_ENDPOINT', 's3.local')
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'testing')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'testing')
+    settings.reset_s3_settings()
+    with moto.mock_aws():
+        filehandler._s3_pool['client'] = None
+        s3c = filehandler._get_s3_client()
+        s3c.create_bucket(Bucket=BUCKET)
+        yield s3c
+    filehandler._s3_pool['client'] = None
+    settings.reset_s3_settings()
+
+
+@pytest.fixture(scope='session')
+def _moto_server():
+    server_module = pytest.importorskip('moto.server')
+    server = server_module.ThreadedMotoServer(ip_address='127.0.0.1', port=0, verbose=False)
+    server.start()
+    host, port = server.get_host_and_port()
+    yield 'http://{}:{}'.format(host, port)
+    server.stop()
+
+
+@pytest.fixture
+def s3_server(_moto_server):
+    """moto server with an empty bucket, for clients that cannot be mocked in process (aiobotocore). Yields a boto3 client of the server.
+    """
+    import boto3
+    import urllib.request
+    from s3_smart_open import settings
+    urllib.request.urlopen(urllib.request.Request(_moto_server + '/moto-api/reset', method='POST')).close()
+    settings.configure_s3(_moto_server, 'testing', 'testing')
+    s3c = boto3.client('s3', endpoint_url=_moto_server, aws_access_key_id='testing', aws_secret_access_key='testing')
+    s3c.create_bucket(Bucket=BUCKET)
+    yield s3c
+    settings.reset_s3_settings()
@@ -0,0 +1,192 @@
+# Copyright (c) 2022 RWTH Aachen - Werkzeugmaschinenlabor (WZL)
+# Contact: Simon Cramer, s.cramer@wzl-mq.rwth-aachen.de
+
+import os
+import asyncio
+import pandas as pd
+import pytest
+from s3_smart_open import aio, listing
+from conftest import BUCKET
+
+pytest.importorskip('aiobotocore')
+
+PATH = 's3://{}/aio'.format(BUCKET)
+
+
+def _run(coroutine):
+    async def _main():
+        try:
+            return await coroutine
+        finally:
+            await aio.close()
+    return asyncio.run(_main())
+
+
+def test_roundtrip(s3_server):
+    dataframe = pd.DataFrame({'a': range(5), 'b': list('abcde')})
+
+    async def _main():
+        await aio.to_pckl(PATH, 'data.pckl', {'a': [1, 2]})
+        await aio.to_json(PATH, 'data.json', {'b': 1.5})
+        await aio.to_txt(PATH, 'data.txt', 'héllo')
+        await aio.to_pd_fth(PATH, 'data.fth', dataframe)
+        return (await aio.read_pckl(PATH, 'data.pckl'), await aio.read_json(PATH, 'data.json'),
+                await aio.read_txt(PATH, 'data.txt'), await aio.read_pd_fth(PATH, 'data.fth'))
+
+    pckl, json_data, txt, fth = _run(_main())
+    assert pckl == {'a': [1, 2]}
+    assert json_data == {'b': 1.5}
+    assert txt == 'héllo'
+    pd.testing.assert_frame_equal(fth, dataframe)
+
+
+def test_missing_file(s3_server, tmp_path):
+    with pytest.raises(ValueError, match='does not exist'):
+        _run(aio.read_json(PATH, 'missing.json'))
+    with pytest.raises(ValueError, match='does not exist'):
+        _run(aio.read_pckl(str(tmp_path), 'missing.pckl'))
+    _run(aio.from_s3(PATH, 'missing.bin', str(tmp_path)))
+    assert os.listdir(tmp_path) == []
+
+
+def test_concurrent_operations_share_one_client(s3_server):
+    async def _main():
+        client = (await aio._get_pool())['client']
+        await asyncio.gather(*[aio.to_pckl(PATH, 'f{:03d}.pckl'.format(i), i) for i in range(100)])
+        results = await asyncio.gather(*[aio.read_pckl(PATH, 'f{:03d}.pckl'.format(i)) for i in range(100)])
+        return client, (await aio._get_pool())['client'], results, await aio.get_filenames(PATH)
+
+    client, client_after, results, filenames = _run(_main())
+    assert client is client_after
+    assert results == list(range(100))
+    assert len(filenames) == 100
+
+
+def test_large_file_transfer_is_streamed(s3_server, tmp_path, monkeypatch):
+    monkeypatch.setitem(aio._transfer_settings, 'multipart_threshold', 5*1024*1024)
+    monkeypatch.setitem(aio._transfer_settings, 'multipart_chunksize', 5*1024*1024)
+    monkeypatch.setattr(aio, '_read_local', None)
+    data = os.urandom(12*1024*1024)
+    (tmp_path / 'up').mkdir()
+    (tmp_path / 'up' / 'big.bin').write_bytes(data)
+
+    async def _main():
+        await aio.to_s3(PATH, 'big.bin', str(tmp_path / 'up' / 'big.bin'))
+        await aio.from_s3(PATH, 'big.bin', str(tmp_path / 'down'))
+
+    _run(_main())
+    assert s3_server.head_object(Bucket=BUCKET, Key='aio/big.bin')['ETag'].strip('"').endswith('-3')
+    assert (tmp_path / 'down' / 'big.bin').read_bytes() == data
+    assert os.listdir(tmp_path / 'down') == ['big.bin']
+
+
+def test_delete(s3_server):
+    async def _main():
+        await asyncio.gather(*[aio.to_txt(PATH, name, name) for name in ['a.txt', 'b.txt', 'c.json']])
+        summary = await aio.delete_s3_objects(PATH, file_types=['.txt'])
+        return summary, await aio.get_filenames(PATH)
+
+    summary, filenames = _run(_main())
+    assert sorted(summary['deleted']) == ['aio/a.txt', 'aio/b.txt']
+    assert summary['failed'] == {}
+    assert filenames == ['c.json']
+
+
+def test_delete_reports_failed_batches(s3_server, monkeypatch):
+    monkeypatch.setattr(aio, '_DELETE_BATCH_SIZE', 2)
+
+    async def _main():
+        await asyncio.gather(*[aio.to_txt(PATH, 'f{}.txt'.format(i), 'x') for i in range(6)])
+        client = (await aio._get_pool())['client']
+        delete_objects = client.delete_objects
+
+        async def _failing(**kwargs):
+            if any(obj['Key'] == 'aio/f2.txt' for obj in kwargs['Delete']['Objects']):
+                raise OSError('connection reset')
+            return await delete_objects(**kwargs)
+
+        client.delete_objects = _failing
+        summary = await aio.delete_s3_objects(PATH)
+        return summary, await aio.get_filenames(PATH)
+
+    summary, filenames = _run(_main())
+    assert sorted(summary['deleted']) == ['aio/f0.txt', 'aio/f1.txt', 'aio/f4.txt', 'aio/f5.txt']
+    assert list(summary['failed']) == ['batch 1']
+    assert isinstance(summary['failed']['batch 1'], OSError)
+    assert sorted(filenames) == ['f2.txt', 'f3.txt']
+
+
+def test_concurrent_cold_starts_create_one_client(s3_server, monkeypatch):
+    created = []
+    get_session = aio.aiobotocore.session.get_session
+
+    def _get_session():
+        session = get_session()
+        create_client = session.create_client
+
+        def _create_client(*args, **kwargs):
+            created.append(args)
+            return create_client(*args, **kwargs)
+
+        session.create_client = _create_client
+        return session
+
+    monkeypatch.setattr(aio.aiobotocore.session, 'get_session', _get_session)
+
+    async def _main():
+        pools = await asyncio.gather(*[aio._get_pool() for i in range(20)])
+        filenames = await asyncio.gather(*[aio.get_filenames(PATH) for i in range(20)])
+        return pools, filenames
+
+    pools, filenames = _run(_main())
+    assert len(created) == 1
+    assert all(pool is pools[0] for pool in pools)
+    assert filenames == [[]]*20
+
+
+def test_replaced_client_is_closed_after_running_calls(s3_server, monkeypatch):
+    async def _main():
+        await aio.to_txt(PATH, 'a.txt', 'a')
+        old = await aio._get_pool()
+        closed = []
+        aexit = old['context'].__aexit__
+
+        async def _aexit(*args):
+            closed.append(True)
+            return await aexit(*args)
+
+        old['context'].__aexit__ = _aexit
+        started, release = asyncio.Event(), asyncio.Event()
+        get_object = old['client'].get_object
+
+        async def _slow_get_object(**kwargs):
+            started.set()
+            await release.wait()
+            return await get_object(**kwargs)
+
+        old['client'].get_object = _slow_get_object
+        read = asyncio.ensure_future(aio.read_txt(PATH, 'a.txt'))
+        await started.wait()
+        # Changed settings replace the client while the read is running
+        monkeypatch.setitem(aio._aio_settings, 'max_concurrency', aio._aio_settings['max_concurrency']+1)
+        new = await aio._get_pool()
+        closed_while_running = list(closed)
+        release.set()
+        return new is not old, closed_while_running, await read, closed
+
+    replaced, closed_while_running, text, closed = _run(_main())
+    assert replaced
+    assert closed_while_running == []
+    assert text == 'a'
+    assert closed == [True]
+
+
+def test_delete_is_applied_to_listing_index(s3_server, tmp_path, monkeypatch):
+    monkeypatch.setattr(listing, '_indexes', {})
+    for name in ['a.txt', 'b.txt', 'c.json']:
+        s3_server.put_object(Bucket=BUCKET, Key='aio/'+name, Body=b'x')
+    index = listing.get_listing_index(PATH, index_directory=str(tmp_path))
+    index.refresh()
+    summary = _run(aio.delete_s3_objects(PATH, file_types='.txt'))
+    assert sorted(summary['deleted']) == ['aio/a.txt', 'aio/b.txt']
+    assert index.table['key'].to_pylist() == ['c.json']
@@ -0,0 +1,98 @@
+# Copyright (c) 2022 RWTH Aachen - Werkzeugmaschinenlabor (WZL)
+# Contact: Simon Cramer, s.cramer@wzl-mq.rwth-aachen.de
+
+import os
+import pytest
+from s3_smart_open import cache, read_txt, read_pckl, to_pckl, cache_stats
+from conftest import BUCKET
+
+PATH = 's3://{}/cache/'.format(BUCKET)
+
+
+@pytest.fixture
+def read_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, '_cache_stats', dict.fromkeys(cache._cache_stats, 0))
+    cache.configure_cache(str(tmp_path / 'cache'))
+    yield tmp_path / 'cache'
+    cache.disable_cache()
+
+
+@pytest.fixture
+def gets(s3, monkeypatch):
+    """Records the arguments of all GET requests"""
+    requests = []
+    get_object = s3.get_object
+    def _get_object(**kwargs):
+        requests.append(kwargs)
+        return get_object(**kwargs)
+    monkeypatch.setattr(s3, 'get_object', _get_object)
+    return requests
+
+
+def _put(s3, name, body):
+    s3.put_object(Bucket=BUCKET, Key='cache/'+name, Body=body)
+
+
+def test_miss_then_hit(s3, read_cache, gets):
+    _put(s3, 'a.txt', b'first')
+    assert read_txt(PATH, 'a.txt') == 'first'
+    assert read_txt(PATH, 'a.txt') == 'first'
+    stats = cache_stats()
+    assert (stats['misses'], stats['hits'], stats['bytes_downloaded'], stats['bytes_served']) == (1, 1, 5, 5)
+    assert 'IfNoneMatch' not in gets[0]
+    # The cached copy is revalidated with its ETag
+    etag = s3.head_object(Bucket=BUCKET, Key='cache/a.txt')['ETag']
+    assert gets[1]['IfNoneMatch'] == etag
+
+
+def test_changed_object_is_downloaded_again(s3, read_cache, gets):
+    _put(s3, 'a.txt', b'first')
+    assert read_txt(PATH, 'a.txt') == 'first'
+    _put(s3, 'a.txt', b'second')
+    assert read_txt(PATH, 'a.txt') == 'second'
+    assert 'IfNoneMatch' in gets[1]
+    stats = cache_stats()
+    assert (stats['misses'], stats['hits']) == (2, 0)
+
+
+def test_missing_object_raises(s3, read_cache):
+    with pytest.raises(ValueError, match='does not exist'):
+        read_txt(PATH, 'missing.txt')
+
+
+def test_least_recently_used_objects_are_evicted(s3, read_cache):
+    cache.configure_cache(str(read_cache), max_bytes=250)
+    for name in ('a', 'b', 'c'):
+        _put(s3, name, bytes(100))
+    path_a = cache.cached_path(s3, BUCKET, 'cache/a')
+    path_b = cache.cached_path(s3, BUCKET, 'cache/b')
+    os.utime(path_a, (1, 1))
+    os.utime(path_b, (2, 2))
+    # a is used again, so b is the least recently used object
+    cache.cached_path(s3, BUCKET, 'cache/a')
+    cache.cached_path(s3, BUCKET, 'cache/c')
+    assert not os.path.exists(path_b) and os.path.exists(path_a)
+    assert len(os.listdir(read_cache / 'blobs')) == 2
+    assert cache_stats()['evictions'] == 1
+
+
+def test_objects_of_other_processes_count_for_eviction(s3, read_cache):
+    cache.configure_cache(str(read_cache), max_bytes=250)
+    # Written by another process after this process enabled the cache
+    other = read_cache / 'blobs' / 'other'
+    other.write_bytes(bytes(200))
+    os.utime(other, (1, 1))
+    _put(s3, 'a', bytes(100))
+    path = cache.cached_path(s3, BUCKET, 'cache/a')
+    assert not other.exists() and os.path.exists(path)
+
+
+def test_evicted_copy_is_fetched_again(s3, read_cache, gets):
+    to_pckl(PATH, 'a.pckl', {'a': 1})
+    def _evicted_open(path, *args):
+        if len(gets) == 1:
+            os.remove(path)
+        return open(path, *args)
+    assert cache.open_cached(s3, BUCKET, 'cache/a.pckl', _evicted_open, 'rb').read()
+    assert len(gets) == 2 and 'IfNoneMatch' not in gets[1]
+    assert read_pckl(PATH, 'a.pckl') == {'a': 1}
@@ -0,0 +1,42 @@
+# Copyright (c) 2022 RWTH Aachen - Werkzeugmaschinenlabor (WZL)
+# Contact: Simon Cramer, s.cramer@wzl-mq.rwth-aachen.de
+
+import os
+import pytest
+from s3_smart_open import filehandler
+
+
+def test_repeated_calls_share_one_client(s3):
+    client = filehandler._get_s3_client()
+    assert filehandler._get_s3_client() is client
+    assert filehandler.generate_s3_session()[0] is client
+    resource = filehandler.generate_s3_session()[1]
+    assert filehandler.generate_s3_session()[1] is resource
+
+
+def test_new_client_after_pid_change(s3, monkeypatch):
+    client = filehandler._get_s3_client()
+    pid = os.getpid()
+    monkeypatch.setattr(filehandler.os, 'getpid', lambda: pid + 1)
+    forked = filehandler._get_s3_client()
+    assert forked is not client
+    assert filehandler._get_s3_client() is forked
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason='needs os.fork')
+def test_new_client_after_fork(s3):
+    client = filehandler._get_s3_client()
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            child = filehandler._get_s3_client()
+            os.write(write, b'1' if child is not client and filehandler._get_s3_client() is child else b'0')
+        finally:
+            os._exit(0)
+    os.close(write)
+    result = os.read(read, 1)
+    os.waitpid(pid, 0)
+    os.close(read)
+    assert result == b'1'
+    assert filehandler._get_s3_client() is client
@@ -0,0 +1,98 @@
+# Copyright (c) 2022 RWTH Aachen - Werkzeugmaschinenlabor (WZL)
+# Contact: Simon Cramer, s.cramer@wzl-mq.rwth-aachen.de
+
+import numpy as np
+import pandas as pd
+import pytest
+from s3_smart_open import dataset, to_dataset, read_dataset, read_json
+from conftest import BUCKET
+
+PATH = 's3://{}/datasets'.format(BUCKET)
+
+
+@pytest.fixture
+def frame():
+    return pd.DataFrame({'machine': np.repeat(['M1', 'M2', 'M3'], 40),
+                         'value': np.arange(120, dtype='int64'),
+                         'label': ['l{:03d}'.format(i) for i in range(120)]})
+
+
+@pytest.fixture
+def reads(monkeypatch):
+    """Records the paths of the files and the row groups that are read"""
+    paths = []
+    read_file = dataset._read_file
+    def _read_file(dataset_path, entry, columns, filters):
+        paths.append(entry['path'])
+        return read_file(dataset_path, entry, columns, filters)
+    monkeypatch.setattr(dataset, '_read_file', _read_file)
+    return paths
+
+
+def _sorted(frame, columns):
+    return frame[columns].sort_values('value').reset_index(drop=True)
+
+
+@pytest.mark.parametrize('file_format', ['parquet', 'feather'])
+def test_round_trip_with_partitions(s3, frame, file_format):
+    manifest = to_dataset(PATH, 'data', frame, partition_cols=['machine'], file_format=file_format, row_group_size=10)
+    assert [entry['partition'] for entry in manifest['files']] == [{'machine': 'M1'}, {'machine': 'M2'}, {'machine': 'M3'}]
+    assert manifest['files'][1]['statistics']['value'] == [40, 79]
+    result = read_dataset(PATH, 'data')
+    pd.testing.assert_frame_equal(_sorted(result, list(frame.columns)), frame)
+
+
+def test_round_trip_local(tmp_path, frame):
+    to_dataset(str(tmp_path), 'data', frame, partition_cols='machine')
+    result = read_dataset(str(tmp_path), 'data', columns=['value', 'machine'])
+    assert list(result.columns) == ['value', 'machine']
+    pd.testing.assert_frame_equal(_sorted(result, ['machine', 'value']), frame[['machine', 'value']])
+
+
+def test_partition_filter_reads_matching_files_only(s3, frame, reads):
+    to_dataset(PATH, 'data', frame, partition_cols=['machine'])
+    result = read_dataset(PATH, 'data', filters=[('machine', 'in', ['M1', 'M3'])])
+    assert sorted(reads) == ['machine=M1/part-00000.parquet', 'machine=M3/part-00002.parquet']
+    pd.testing.assert_frame_equal(_sorted(result, list(frame.columns)), frame[frame['machine'] != 'M2'].reset_index(drop=True))
+
+
+def test_statistics_filter_skips_files_and_row_groups(s3, frame, reads, monkeypatch):
+    to_dataset(PATH, 'data', frame, partition_cols=['machine'], row_group_size=10)
+    row_groups = []
+    read_row_groups = dataset.pyarrow.parquet.ParquetFile.read_row_groups
+    def _read_row_groups(self, indices, *args, **kwargs):
+        row_groups.append(list(indices))
+        return read_row_groups(self, indices, *args, **kwargs)
+    monkeypatch.setattr(dataset.pyarrow.parquet.ParquetFile, 'read_row_groups', _read_row_groups)
+    result = read_dataset(PATH, 'data', columns=['value'], filters=[('value', '>=', 45), ('value', '<', 55)])
+    assert reads == ['machine=M2/part-00001.parquet']
+    assert row_groups == [[0, 1]]
+    assert result['value'].tolist() == list(range(45, 55))
+
+
+def test_row_group_statistics_with_nested_columns(s3):
+    frame = pd.DataFrame({'nested': [{'x': i, 'y': -i} for i in range(100)],
+                          'items': [[i, i+1] for i in range(100)],
+                          'value': np.arange(100, dtype='int64')})
+    to_dataset(PATH, 'nested', frame, row_group_size=10)
+    result = read_dataset(PATH, 'nested', columns=['value'], filters=[('value', '>', 94)])
+    assert result['value'].tolist() == [95, 96, 97, 98, 99]
+
+
+def test_rewrite_updates_manifest(s3, frame):
+    to_dataset(PATH, 'data', frame, partition_cols=['machine'])
+    update = frame[frame['machine'] == 'M2'].assign(value=lambda data: data['value']*10)
+    manifest = to_dataset(PATH, 'data', update, partition_cols=['machine'])
+    assert read_json(PATH+'/data', dataset.MANIFEST_FILENAME) == manifest
+    assert [entry['path'] for entry in manifest['files']] == ['machine=M2/part-00000.parquet']
+    assert manifest['files'][0]['rows'] == 40 and manifest['files'][0]['statistics']['value'] == [400, 790]
+    # Files of the first write that are not in the manifest are not read
+    result = read_dataset(PATH, 'data')
+    pd.testing.assert_frame_equal(_sorted(result, list(frame.columns)), update.reset_index(drop=True))
+
+
+def test_dataset_without_manifest_is_listed(s3, frame):
+    to_dataset(PATH, 'data', frame, partition_cols=['machine'])
+    s3.delete_object(Bucket=BUCKET, Key='datasets/data/'+dataset.MANIFEST_FILENAME)
+    result = read_dataset(PATH, 'data', filters=[('machine', '==', 'M2')])
+    assert result['value'].tolist() == list(range(40, 80))
@@ -0,0 +1,67 @@
+# Copyright (c) 2022 RWTH Aachen - Werkzeugmaschinenlabor (WZL)
+# Contact: Simon Cramer, s.cramer@wzl-mq.rwth-aachen.de
+
+import time
+import pytest
+from s3_smart_open import dedup, collect_garbage, to_pckl, read_pckl
+from conftest import BUCKET
+
+STORE = 's3://blobs/store'
+
+
+@pytest.fixture
+def shared_store(s3, monkeypatch):
+    s3.create_bucket(Bucket='blobs')
+    s3.create_bucket(Bucket='other')
+    monkeypatch.setitem(dedup._dedup_settings, 'store_path', STORE)
+    to_pckl('s3://{}/a'.format(BUCKET), 'data.pckl', {'bucket': 1}, dedup=True)
+    to_pckl('s3://other/a', 'data.pckl', {'other': 2}, dedup=True)
+    return s3
+
+
+def _blobs(s3):
+    return sorted(obj['Key'] for obj in s3.list_objects_v2(Bucket='blobs').get('Contents', []))
+
+
+def test_collect_garbage_requires_roots(shared_store):
+    with pytest.raises(TypeError):
+        collect_garbage(STORE, min_age=0)
+    with pytest.raises(ValueError, match='roots'):
+        collect_garbage(STORE, roots=[], min_age=0)
+    assert len(_blobs(shared_store)) == 2
+
+
+def test_pointer_outside_store_bucket_keeps_blob(shared_store):
+    summary = collect_garbage(STORE, roots=['s3://{}'.format(BUCKET), 's3://other'], min_age=0)
+    assert summary['deleted'] == []
+    assert (summary['blobs'], summary['pointers'], summary['referenced']) == (2, 2, 2)
+    assert read_pckl('s3://other/a', 'data.pckl') == {'other': 2}
+
+    shared_store.delete_object(Bucket='other', Key='a/data.pckl')
+    summary = collect_garbage(STORE, roots=['s3://{}'.format(BUCKET), 's3://other'], min_age=0)
+    assert len(summary['deleted']) == 1
+    assert len(_blobs(shared_store)) == 1
+    assert read_pckl('s3://{}/a'.format(BUCKET), 'data.pckl') == {'bucket': 1}
+
+
+def test_reused_blob_is_refreshed(shared_store):
+    pointer = dedup.parse_pointer(shared_store.get_object(Bucket=BUCKET, Key='a/data.pckl')['Body'].read())
+    blob_bucket, blob_key = dedup._bucket_key(pointer['blob'])
+    blob = shared_store.head_object(Bucket=blob_bucket, Key=blob_key)
+    assert blob['Metadata'] == {'s3so-sha256': pointer['sha256']}
+    time.sleep(1.1)
+    to_pckl('s3://{}/b'.format(BUCKET), 'data.pckl', {'bucket': 1}, dedup=True)
+    refreshed = shared_store.head_object(Bucket=blob_bucket, Key=blob_key)
+    assert len(_blobs(shared_store)) == 2
+    assert refreshed['LastModified'] > blob['LastModified']
+    assert refreshed['Metadata'] == {'s3so-sha256': pointer['sha256']}
+
+
+def test_blob_with_wrong_content_is_uploaded_again(shared_store):
+    pointer = dedup.parse_pointer(shared_store.get_object(Bucket=BUCKET, Key='a/data.pckl')['Body'].read())
+    blob_bucket, blob_key = dedup._bucket_key(pointer['blob'])
+    # Same size, but no stored sha256
+    shared_store.put_object(Bucket=blob_bucket, Key=blob_key, Body=bytes(pointer['size']))
+    to_pckl('s3://{}/a'.format(BUCKET), 'data.pckl', {'bucket': 1}, dedup=True)
+    assert read_pckl('s3://{}/a'.format(BUCKET), 'data.pckl') == {'bucket': 1}
+    assert shared_store.head_object(Bucket=blob_bucket, Key=blob_key)['Metadata'] == {'s3so-sha256': pointer['sha256']}
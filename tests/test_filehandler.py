@@ -0,0 +1,204 @@
+# Copyright (c) 2022 RWTH Aachen - Werkzeugmaschinenlabor (WZL)
+# Contact: Simon Cramer, s.cramer@wzl-mq.rwth-aachen.de
+
+import os
+import datetime
+import pytest
+from s3_smart_open import filehandler, parallel, check_filenames, read_pckl, read_json, read_many, to_many
+from conftest import BUCKET
+
+PATH = 's3://{}/data/'.format(BUCKET)
+PRESENT = ['a/1.txt', 'a/2.txt', 'b/1.txt', 'c/x/1.txt', 'c/y/1.txt']
+MISSING = ['a/3.txt', 'b/0.txt', 'c/x/2.txt', 'd/1.txt']
+
+
+@pytest.fixture
+def objects(s3):
+    for name in PRESENT:
+        s3.put_object(Bucket=BUCKET, Key='data/'+name, Body=b'x')
+    # Keys outside of the prefix must not be reported as present
+    s3.put_object(Bucket=BUCKET, Key='other/d/1.txt', Body=b'x')
+    return s3
+
+
+@pytest.fixture
+def heads(objects, monkeypatch):
+    keys = []
+    head_object = objects.head_object
+    def _head_object(**kwargs):
+        keys.append(kwargs['Key'])
+        return head_object(**kwargs)
+    monkeypatch.setattr(objects, 'head_object', _head_object)
+    return keys
+
+
+@pytest.mark.parametrize('method', ['auto', 'list', 'head'])
+def test_check_filenames_reports_missing_keys(objects, method):
+    missing = check_filenames(PATH, PRESENT+MISSING, 'data/', BUCKET, method=method)
+    assert sorted(missing) == sorted(MISSING)
+
+
+def test_check_filenames_accepts_single_filename(objects):
+    assert check_filenames(PATH, 'a/1.txt', 'data/', BUCKET) == []
+    assert check_filenames(PATH, 'a/3.txt', 'data/', BUCKET) == ['a/3.txt']
+
+
+def test_list_shards_across_prefix_boundaries(objects, heads):
+    keys = sorted('data/'+name for name in PRESENT+MISSING)
+    assert set(filehandler._shard_prefixes(keys)) == {'data/a', 'data/b', 'data/c', 'data/d'}
+    missing = check_filenames(PATH, PRESENT+MISSING, 'data/', BUCKET, method='list')
+    assert sorted(missing) == sorted(MISSING)
+    assert heads == []
+
+
+def test_too_many_shards_fall_back_to_common_prefix(monkeypatch):
+    monkeypatch.setattr(filehandler, '_EXISTS_MAX_SHARDS', 2)
+    keys = sorted('data/'+name for name in PRESENT)
+    assert filehandler._shard_prefixes(keys) == {'data/': keys}
+
+
+def test_auto_agrees_with_head(objects, monkeypatch):
+    names = PRESENT + MISSING + ['a/{}.txt'.format(i) for i in range(40)]
+    expected = check_filenames(PATH, names, 'data/', BUCKET, method='head')
+    monkeypatch.setattr(filehandler, '_EXISTS_HEAD_THRESHOLD', 4)
+    assert check_filenames(PATH, names, 'data/', BUCKET, method='auto') == expected
+
+
+def test_auto_uses_head_for_short_lists(objects, heads):
+    check_filenames(PATH, ['a/1.txt', 'a/3.txt'], 'data/', BUCKET, method='auto')
+    assert sorted(heads) == ['data/a/1.txt', 'data/a/3.txt']
+
+
+def test_unknown_method_raises(objects):
+    with pytest.raises(ValueError):
+        check_filenames(PATH, ['a/1.txt'], 'data/', BUCKET, method='scan')
+
+
+@pytest.mark.parametrize('parallel_reads', [True, False])
+@pytest.mark.parametrize('reader', [read_pckl, read_json])
+def test_missing_key_raises_without_head_request(heads, monkeypatch, parallel_reads, reader):
+    monkeypatch.setitem(parallel._parallel_settings, 'enabled', parallel_reads)
+    with pytest.raises(ValueError, match='does not exist'):
+        reader(PATH, 'missing.file')
+    assert heads == []
+
+
+def test_missing_key_raises_with_check_exists(objects):
+    with pytest.raises(ValueError, match='does not exist'):
+        read_pckl(PATH, 'missing.file', check_exists=True)
+
+
+def test_local_bulk_io_never_creates_a_client(tmp_path, monkeypatch):
+    def _new_s3_session(key):
+        raise AssertionError('s3 client created for local paths')
+    monkeypatch.setattr(filehandler, '_new_s3_session', _new_s3_session)
+    monkeypatch.setitem(filehandler._s3_pool, 'client', None)
+    data = {'{}.pckl'.format(i): list(range(i)) for i in range(8)}
+    assert to_many(str(tmp_path), data) == {}
+    results, errors = read_many(str(tmp_path), list(data))
+    assert results == data and errors == {}
+    assert filehandler._s3_pool['client'] is None
+
+
+@pytest.fixture
+def local_directory(tmp_path):
+    directory = tmp_path / 'local' / 'dir'
+    (directory / 'sub').mkdir(parents=True)
+    (directory / 'a.txt').write_bytes(b'a'*10)
+    (directory / 'sub' / 'b.txt').write_bytes(b'b'*20)
+    return directory
+
+
+def test_upload_skips_unchanged_and_uploads_changed_files(s3, local_directory):
+    summary = filehandler.local_directory_to_s3(str(local_directory.parent), PATH, 'dir')
+    assert sorted(summary['transferred']) == ['a.txt', 'sub/b.txt']
+    summary = filehandler.local_directory_to_s3(str(local_directory.parent), PATH, 'dir')
+    assert summary['transferred'] == {} and sorted(summary['skipped']) == ['a.txt', 'sub/b.txt']
+    # Same size but different content is detected by the ETag
+    (local_directory / 'a.txt').write_bytes(b'c'*10)
+    (local_directory / 'sub' / 'b.txt').write_bytes(b'b'*21)
+    summary = filehandler.local_directory_to_s3(str(local_directory.parent), PATH, 'dir')
+    assert sorted(summary['transferred']) == ['a.txt', 'sub/b.txt']
+    assert s3.get_object(Bucket=BUCKET, Key='data/dir/a.txt')['Body'].read() == b'c'*10
+
+
+def test_download_skips_unchanged_and_downloads_changed_files(s3, local_directory, tmp_path):
+    filehandler.local_directory_to_s3(str(local_directory.parent), PATH, 'dir')
+    target = tmp_path / 'target'
+    summary = filehandler.s3_directory_to_local(PATH, str(target), 'dir')
+    assert sorted(summary['transferred']) == ['a.txt', 'sub/b.txt']
+    summary = filehandler.s3_directory_to_local(PATH, str(target), 'dir')
+    assert summary['transferred'] == {} and sorted(summary['skipped']) == ['a.txt', 'sub/b.txt']
+    s3.put_object(Bucket=BUCKET, Key='data/dir/a.txt', Body=b'd'*10)
+    summary = filehandler.s3_directory_to_local(PATH, str(target), 'dir')
+    assert list(summary['transferred']) == ['a.txt']
+    assert (target / 'dir' / 'a.txt').read_bytes() == b'd'*10
+
+
+def test_size_mismatch_is_changed_without_hashing(local_directory, monkeypatch):
+    monkeypatch.setattr(filehandler, '_local_etag', None)
+    obj = {'Size': 11, 'ETag': '"{}"'.format('0'*32), 'LastModified': datetime.datetime.now(datetime.timezone.utc)}
+    assert not filehandler._is_unchanged(str(local_directory / 'a.txt'), obj, upload=True)
+
+
+def test_non_md5_etag_compares_modification_time(local_directory):
+    path = str(local_directory / 'a.txt')
+    modified = os.stat(path).st_mtime
+    obj = {'Size': 10, 'ETag': '"not-an-md5"'}
+    obj['LastModified'] = datetime.datetime.fromtimestamp(modified+60, datetime.timezone.utc)
+    assert filehandler._local_etag(path, 10, 'not-an-md5') is None
+    assert filehandler._is_unchanged(path, obj, upload=True)
+    assert not filehandler._is_unchanged(path, obj, upload=False)
+    obj['LastModified'] = datetime.datetime.fromtimestamp(modified-60, datetime.timezone.utc)
+    assert not filehandler._is_unchanged(path, obj, upload=True)
+    assert filehandler._is_unchanged(path, obj, upload=False)
+
+
+def _keys(s3, prefix='data/'):
+    paginator = s3.get_paginator('list_objects_v2')
+    return sorted(obj['Key'] for page in paginator.paginate(Bucket=BUCKET, Prefix=prefix) for obj in page.get('Contents', []))
+
+
+def test_delete_more_than_one_batch(s3, monkeypatch):
+    names = ['{:04d}.txt'.format(i) for i in range(filehandler._DELETE_BATCH_SIZE+5)]
+    for name in names:
+        s3.put_object(Bucket=BUCKET, Key='data/'+name, Body=b'')
+    batches = []
+    delete_objects = s3.delete_objects
+    def _delete_objects(**kwargs):
+        batches.append(len(kwargs['Delete']['Objects']))
+        return delete_objects(**kwargs)
+    monkeypatch.setattr(s3, 'delete_objects', _delete_objects)
+    summary = filehandler.delete_s3_objects(PATH)
+    assert sorted(batches) == [5, filehandler._DELETE_BATCH_SIZE]
+    assert sorted(summary['deleted']) == ['data/'+name for name in names]
+    assert summary['failed'] == {}
+    assert _keys(s3) == []
+
+
+def test_delete_reports_per_key_errors(s3, monkeypatch):
+    for name in ('a.txt', 'b.txt', 'c.txt'):
+        s3.put_object(Bucket=BUCKET, Key='data/'+name, Body=b'')
+    delete_objects = s3.delete_objects
+    def _delete_objects(Bucket, Delete):
+        denied = [obj for obj in Delete['Objects'] if obj['Key'] == 'data/b.txt']
+        response = delete_objects(Bucket=Bucket, Delete=dict(Delete, Objects=[obj for obj in Delete['Objects'] if obj not in denied]))
+        response['Errors'] = [{'Key': obj['Key'], 'Code': 'AccessDenied', 'Message': 'Access Denied'} for obj in denied]
+        return response
+    monkeypatch.setattr(s3, 'delete_objects', _delete_objects)
+    summary = filehandler.delete_s3_objects(PATH)
+    assert sorted(summary['deleted']) == ['data/a.txt', 'data/c.txt']
+    assert summary['failed'] == {'data/b.txt': 'Access Denied'}
+    assert _keys(s3) == ['data/b.txt']
+
+
+def test_delete_filters_by_file_types_and_filenames(s3):
+    for name in ('a.txt', 'b.csv', 'sub/c.txt', 'sub/d.json'):
+        s3.put_object(Bucket=BUCKET, Key='data/'+name, Body=b'')
+    summary = filehandler.delete_s3_objects(PATH, file_types=['.txt', '.json'])
+    assert sorted(summary['deleted']) == ['data/a.txt', 'data/sub/c.txt', 'data/sub/d.json']
+    assert _keys(s3) == ['data/b.csv']
+    s3.put_object(Bucket=BUCKET, Key='data/e.csv', Body=b'')
+    summary = filehandler.delete_s3_objects(PATH, filenames='e.csv', file_types='.csv')
+    assert summary['deleted'] == ['data/e.csv']
+    assert _keys(s3) == ['data/b.csv']
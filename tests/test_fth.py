@@ -0,0 +1,100 @@
+# Copyright (c) 2022 RWTH Aachen - Werkzeugmaschinenlabor (WZL)
+# Contact: Simon Cramer, s.cramer@wzl-mq.rwth-aachen.de
+
+import numpy as np
+import pandas as pd
+import pyarrow
+import pytest
+from s3_smart_open import filehandler, cache, to_pd_fth, read_pd_fth, read_arrow_fth, to_pd_fth_chunks, open_fth_writer, get_filenames
+from conftest import BUCKET
+
+PATH = 's3://{}/fth'.format(BUCKET)
+
+
+@pytest.fixture
+def frame():
+    return pd.DataFrame({'a': np.arange(1000, dtype='int64'), 'b': np.random.rand(1000), 'c': ['x{}'.format(i) for i in range(1000)]})
+
+
+@pytest.fixture
+def memory_maps(monkeypatch):
+    """Records the paths that are memory mapped"""
+    paths = []
+    memory_map = pyarrow.memory_map
+    def _memory_map(path, *args, **kwargs):
+        paths.append(path)
+        return memory_map(path, *args, **kwargs)
+    monkeypatch.setattr(filehandler.pyarrow, 'memory_map', _memory_map)
+    return paths
+
+
+@pytest.fixture
+def read_cache(tmp_path):
+    cache.configure_cache(str(tmp_path / 'cache'))
+    yield tmp_path / 'cache'
+    cache.disable_cache()
+
+
+def test_memory_map_local_file(tmp_path, frame, memory_maps):
+    to_pd_fth(str(tmp_path), 'a.fth', frame)
+    pd.testing.assert_frame_equal(read_pd_fth(str(tmp_path), 'a.fth', memory_map=True), frame)
+    assert memory_maps == [str(tmp_path / 'a.fth')]
+    pd.testing.assert_frame_equal(read_pd_fth(str(tmp_path), 'a.fth', columns=['b'], memory_map=True), frame[['b']])
+
+
+def test_memory_map_local_missing_file(tmp_path):
+    with pytest.raises(ValueError, match='does not exist'):
+        read_pd_fth(str(tmp_path), 'missing.fth', memory_map=True)
+
+
+def test_memory_map_falls_back_to_download_on_s3(s3, frame, memory_maps):
+    to_pd_fth(PATH, 'a.fth', frame)
+    pd.testing.assert_frame_equal(read_pd_fth(PATH, 'a.fth', memory_map=True), frame)
+    pd.testing.assert_frame_equal(read_pd_fth(PATH, 'a.fth', columns=['a', 'c'], memory_map=True), frame[['a', 'c']])
+    assert memory_maps == []
+
+
+def test_memory_map_cached_s3_object(s3, frame, memory_maps, read_cache):
+    to_pd_fth(PATH, 'a.fth', frame)
+    pd.testing.assert_frame_equal(read_pd_fth(PATH, 'a.fth', memory_map=True), frame)
+    assert len(memory_maps) == 1 and memory_maps[0].startswith(str(read_cache))
+
+
+def _chunks(frame, size):
+    return [frame.iloc[start:start+size].reset_index(drop=True) for start in range(0, len(frame), size)]
+
+
+@pytest.mark.parametrize('compression', ['lz4', None])
+def test_chunks_round_trip(s3, frame, compression):
+    chunks = _chunks(frame, 300)
+    # RecordBatches and Tables are accepted next to DataFrames
+    chunks[1] = pyarrow.RecordBatch.from_pandas(chunks[1], preserve_index=False)
+    chunks[2] = pyarrow.Table.from_pandas(chunks[2], preserve_index=False)
+    to_pd_fth_chunks(PATH, 'chunks.fth', iter(chunks), compression=compression)
+    pd.testing.assert_frame_equal(read_pd_fth(PATH, 'chunks.fth'), frame)
+    pd.testing.assert_frame_equal(read_pd_fth(PATH, 'chunks.fth', batches=[1]), frame.iloc[300:600].reset_index(drop=True))
+
+
+def test_writer_round_trip_local(tmp_path, frame):
+    with open_fth_writer(str(tmp_path), 'chunks.fth') as write:
+        for chunk in _chunks(frame, 128):
+            write(chunk)
+    pd.testing.assert_frame_equal(read_pd_fth(str(tmp_path), 'chunks.fth'), frame)
+
+
+def test_empty_stream(s3, frame):
+    to_pd_fth_chunks(PATH, 'empty.fth', [])
+    assert read_arrow_fth(PATH, 'empty.fth').num_rows == 0
+    schema = pyarrow.Schema.from_pandas(frame, preserve_index=False)
+    to_pd_fth_chunks(PATH, 'empty_schema.fth', [], schema=schema)
+    table = read_arrow_fth(PATH, 'empty_schema.fth')
+    assert table.num_rows == 0 and table.schema.names == ['a', 'b', 'c']
+
+
+def test_schema_mismatch_between_chunks_raises(s3, frame):
+    chunks = _chunks(frame, 500)
+    chunks[1] = chunks[1].rename(columns={'b': 'd'})
+    with pytest.raises((ValueError, KeyError, pyarrow.ArrowInvalid)):
+        to_pd_fth_chunks(PATH, 'mismatch.fth', chunks)
+    # The multipart upload is aborted, so no partial object is left behind
+    assert get_filenames(PATH, filenames_list='mismatch.fth') == []
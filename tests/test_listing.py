@@ -0,0 +1,84 @@
+# Copyright (c) 2022 RWTH Aachen - Werkzeugmaschinenlabor (WZL)
+# Contact: Simon Cramer, s.cramer@wzl-mq.rwth-aachen.de
+
+import time
+import tempfile
+import pytest
+from s3_smart_open import listing, get_filenames, delete_s3_objects
+from conftest import BUCKET
+
+PATH = 's3://{}/data/'.format(BUCKET)
+
+
+@pytest.fixture
+def index_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path))
+    monkeypatch.setattr(listing, '_indexes', {})
+    # Small indexes are refreshed incrementally instead of with a full scan
+    monkeypatch.setattr(listing, '_PAGE_SIZE', 1)
+    return tmp_path
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [time.time()]
+    monkeypatch.setattr(listing.time, 'time', lambda: now[0])
+    return now
+
+
+def _put(s3, *names):
+    for name in names:
+        s3.put_object(Bucket=BUCKET, Key='data/'+name, Body=b'x')
+
+
+def test_deleted_key_disappears_after_max_age(s3, index_directory, clock):
+    _put(s3, 'a.txt', 'b.txt', 'c.txt')
+    index = listing.ListingIndex(PATH, max_age=60)
+    index.refresh()
+    s3.delete_object(Bucket=BUCKET, Key='data/b.txt')
+    _put(s3, 'd.txt', 'aa.txt')
+    clock[0] += 30
+    index.refresh()
+    # Incremental refreshes only find keys behind the last key
+    assert index.table['key'].to_pylist() == ['a.txt', 'b.txt', 'c.txt', 'd.txt']
+    clock[0] += 31
+    index.refresh()
+    assert index.table['key'].to_pylist() == ['a.txt', 'aa.txt', 'c.txt', 'd.txt']
+
+
+def test_get_filenames_with_index_uses_default_max_age(s3, index_directory, clock):
+    _put(s3, 'a.txt', 'b.txt')
+    assert get_filenames(PATH, use_index=True) == ['a.txt', 'b.txt']
+    assert listing.get_listing_index(PATH).max_age == listing.DEFAULT_MAX_AGE
+    s3.delete_object(Bucket=BUCKET, Key='data/a.txt')
+    assert get_filenames(PATH, use_index=True) == ['a.txt', 'b.txt']
+    clock[0] += listing.DEFAULT_MAX_AGE + 1
+    assert get_filenames(PATH, use_index=True) == ['b.txt']
+
+
+def test_get_filenames_passes_index_max_age(s3, index_directory, clock):
+    _put(s3, 'a.txt', 'b.txt')
+    assert get_filenames(PATH, use_index=True, index_max_age=10) == ['a.txt', 'b.txt']
+    s3.delete_object(Bucket=BUCKET, Key='data/a.txt')
+    clock[0] += 11
+    assert get_filenames(PATH, use_index=True, index_max_age=10) == ['b.txt']
+
+
+def test_persisted_index_is_rescanned_after_max_age(s3, index_directory, clock):
+    _put(s3, 'a.txt', 'b.txt')
+    listing.ListingIndex(PATH).refresh()
+    s3.delete_object(Bucket=BUCKET, Key='data/a.txt')
+    clock[0] += listing.DEFAULT_MAX_AGE + 1
+    index = listing.ListingIndex(PATH)
+    assert len(index) == 2
+    index.refresh()
+    assert index.table['key'].to_pylist() == ['b.txt']
+
+
+def test_deletes_are_applied_to_the_index(s3, index_directory, clock):
+    _put(s3, 'a.txt', 'b.txt', 'c.json')
+    index = listing.get_listing_index(PATH)
+    index.refresh()
+    delete_s3_objects(PATH, file_types='.txt')
+    assert index.table['key'].to_pylist() == ['c.json']
+    assert listing.ListingIndex(PATH).table['key'].to_pylist() == ['c.json']
@@ -0,0 +1,64 @@
+# Copyright (c) 2022 RWTH Aachen - Werkzeugmaschinenlabor (WZL)
+# Contact: Simon Cramer, s.cramer@wzl-mq.rwth-aachen.de
+
+import numpy as np
+import pandas as pd
+import pytest
+from s3_smart_open import metrics, parallel, to_pckl, read_pckl, to_pd_fth_chunks, get_filenames
+from conftest import BUCKET
+
+PATH = 's3://{}/metrics'.format(BUCKET)
+
+
+@pytest.fixture
+def enabled_metrics():
+    aggregator = metrics.enable_metrics()
+    yield aggregator
+    metrics.disable_metrics()
+
+
+def _unpicklable():
+    return lambda: None
+
+
+def test_failed_pickle_write_is_not_published(s3, enabled_metrics):
+    data = {'array': np.zeros(2*1024*1024), 'function': _unpicklable()}
+    with pytest.raises(Exception):
+        to_pckl(PATH, 'data.pckl', data)
+    assert get_filenames(PATH) == []
+    assert s3.list_multipart_uploads(Bucket=BUCKET).get('Uploads', []) == []
+
+
+def test_aborted_chunked_write_is_not_published(s3, enabled_metrics):
+    def _chunks():
+        for index in range(3):
+            yield pd.DataFrame({'a': np.arange(1000) + index})
+        raise RuntimeError('source failed')
+
+    with pytest.raises(RuntimeError, match='source failed'):
+        to_pd_fth_chunks(PATH, 'data.fth', _chunks())
+    assert get_filenames(PATH) == []
+
+
+def test_successful_write_is_measured(s3, enabled_metrics):
+    to_pckl(PATH, 'data.pckl', {'a': 1})
+    assert get_filenames(PATH) == ['data.pckl']
+    assert enabled_metrics.summary()
+
+
+@pytest.fixture
+def operations():
+    recorded = []
+    metrics.add_recorder(recorded.append)
+    yield recorded
+    metrics.remove_recorder(recorded.append)
+
+
+@pytest.mark.parametrize('parallel_reads', [True, False])
+def test_read_bytes_are_counted_once(s3, operations, monkeypatch, parallel_reads):
+    monkeypatch.setitem(parallel._parallel_settings, 'enabled', parallel_reads)
+    monkeypatch.setitem(parallel._parallel_settings, 'min_part_size', 64*1024)
+    to_pckl(PATH, 'data.pckl', np.arange(100000))
+    np.testing.assert_array_equal(read_pckl(PATH, 'data.pckl'), np.arange(100000))
+    reads = [operation.bytes for operation in operations if operation.operation == 'read_pckl']
+    assert reads == [s3.head_object(Bucket=BUCKET, Key='metrics/data.pckl')['ContentLength']]
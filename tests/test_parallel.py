@@ -0,0 +1,70 @@
+# Copyright (c) 2022 RWTH Aachen - Werkzeugmaschinenlabor (WZL)
+# Contact: Simon Cramer, s.cramer@wzl-mq.rwth-aachen.de
+
+import threading
+import numpy as np
+import pytest
+from s3_smart_open import parallel, to_pckl, read_pckl, read_many
+from conftest import BUCKET
+
+PATH = 's3://{}/parallel'.format(BUCKET)
+
+
+@pytest.fixture
+def small_parts(monkeypatch):
+    monkeypatch.setitem(parallel._parallel_settings, 'min_part_size', 256*1024)
+    monkeypatch.setitem(parallel._parallel_settings, 'max_part_size', 256*1024)
+    monkeypatch.setitem(parallel._parallel_settings, 'max_concurrency', 4)
+
+
+@pytest.fixture
+def range_threads(monkeypatch):
+    """Records the names of the threads that fetch ranges after the first one"""
+    names = []
+    read_body = parallel._read_body
+
+    def _read_body(body, view):
+        names.append(threading.current_thread().name)
+        return read_body(body, view)
+
+    monkeypatch.setattr(parallel, '_read_body', _read_body)
+    return names
+
+
+def test_ranges_run_on_shared_executor(s3, small_parts, range_threads):
+    data = np.random.rand(512*1024)
+    to_pckl(PATH, 'a.pckl', data)
+    np.testing.assert_array_equal(read_pckl(PATH, 'a.pckl'), data)
+    executor = parallel._get_range_executor()
+    np.testing.assert_array_equal(read_pckl(PATH, 'a.pckl'), data)
+    assert parallel._get_range_executor() is executor
+    ranges = [name for name in range_threads if name.startswith('s3-ranges')]
+    # The first range of every read is fetched by the calling thread
+    assert len(ranges) == len(range_threads) - 2
+    assert len(set(ranges)) <= 4
+
+
+def test_read_many_fetches_ranges_in_its_workers(s3, small_parts, range_threads):
+    data = {'f{}.pckl'.format(index): np.random.rand(128*1024) for index in range(6)}
+    for filename, array in data.items():
+        to_pckl(PATH, filename, array)
+    results, errors = read_many(PATH, list(data), max_workers=3)
+    assert errors == {}
+    for filename, array in data.items():
+        np.testing.assert_array_equal(results[filename], array)
+    assert len(range_threads) > len(data)
+    assert not any(name.startswith('s3-ranges') for name in range_threads)
+
+
+def test_failed_range_is_raised(s3, small_parts, monkeypatch):
+    to_pckl(PATH, 'a.pckl', np.random.rand(512*1024))
+    get_object = s3.get_object
+
+    def _failing(**kwargs):
+        if kwargs.get('Range', '').startswith('bytes=1048576-'):
+            raise OSError('connection reset')
+        return get_object(**kwargs)
+
+    monkeypatch.setattr(s3, 'get_object', _failing)
+    with pytest.raises(OSError, match='connection reset'):
+        read_pckl(PATH, 'a.pckl')
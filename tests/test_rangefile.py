@@ -0,0 +1,72 @@
+# Copyright (c) 2022 RWTH Aachen - Werkzeugmaschinenlabor (WZL)
+# Contact: Simon Cramer, s.cramer@wzl-mq.rwth-aachen.de
+
+import io
+import numpy as np
+import pyarrow
+import pyarrow.feather
+import pyarrow.ipc
+import pytest
+from s3_smart_open.rangefile import S3RangeFile, DEFAULT_READ_AHEAD
+from conftest import BUCKET
+
+COLUMNS = 20
+ROWS = 200000
+BATCH_ROWS = 65536
+
+
+@pytest.fixture
+def table():
+    return pyarrow.table({'c{}'.format(i): np.random.rand(ROWS) for i in range(COLUMNS)})
+
+
+@pytest.fixture
+def feather(s3, table):
+    outfile = io.BytesIO()
+    pyarrow.feather.write_feather(table, outfile, compression='uncompressed', chunksize=BATCH_ROWS)
+    s3.put_object(Bucket=BUCKET, Key='table.fth', Body=outfile.getvalue())
+    return len(outfile.getvalue())
+
+
+def _read_columns(s3, indices):
+    rangefile = S3RangeFile(s3, BUCKET, 'table.fth')
+    options = pyarrow.ipc.IpcReadOptions(included_fields=indices)
+    table = pyarrow.ipc.open_file(pyarrow.PythonFile(rangefile, mode='r'), options=options).read_all()
+    return rangefile, table
+
+
+@pytest.mark.parametrize('indices', [[0, 10], list(range(0, COLUMNS, 2)), list(range(COLUMNS))])
+def test_column_reads_fetch_selected_buffers_once(s3, table, feather, indices):
+    rangefile, result = _read_columns(s3, indices)
+    assert result.equals(table.select(indices))
+    needed = len(indices) * ROWS * 8
+    batches = -(-ROWS // BATCH_ROWS)
+    # Footer plus at most one read ahead of the record batch metadata per batch
+    assert rangefile.bytes_fetched <= needed + (batches + 1) * DEFAULT_READ_AHEAD
+    assert rangefile.bytes_fetched < feather
+    # One request for the footer, one per batch for its metadata and at most one per selected buffer
+    assert rangefile.requests <= 1 + batches * (len(indices) + 1)
+
+
+def test_sequential_reads_are_coalesced(s3, table, feather):
+    rangefile, result = _read_columns(s3, list(range(COLUMNS)))
+    assert result.equals(table)
+    assert rangefile.bytes_fetched <= feather + DEFAULT_READ_AHEAD
+    assert rangefile.requests <= 1 + feather // DEFAULT_READ_AHEAD
+
+
+def test_buffered_prefix_is_not_fetched_again(s3):
+    data = bytes(range(256)) * 4096
+    s3.put_object(Bucket=BUCKET, Key='data.bin', Body=data)
+    rangefile = S3RangeFile(s3, BUCKET, 'data.bin', read_ahead=1024)
+    rangefile.seek(1000)
+    assert rangefile.read(100) == data[1000:1100]
+    assert (rangefile.requests, rangefile.bytes_fetched) == (2, 2048)
+    # Starts in the window of the last read, only the missing tail is fetched
+    rangefile.seek(1500)
+    assert rangefile.read(200000) == data[1500:201500]
+    assert (rangefile.requests, rangefile.bytes_fetched) == (3, 2048 + 201500 - 2024)
+    # The footer window is still buffered
+    rangefile.seek(-500, io.SEEK_END)
+    assert rangefile.read() == data[-500:]
+    assert rangefile.requests == 3
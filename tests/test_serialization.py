@@ -0,0 +1,35 @@
+# Copyright (c) 2022 RWTH Aachen - Werkzeugmaschinenlabor (WZL)
+# Contact: Simon Cramer, s.cramer@wzl-mq.rwth-aachen.de
+
+import math
+import numpy as np
+import pytest
+from s3_smart_open import serialization, to_json, read_json
+from conftest import BUCKET
+
+
+@pytest.mark.parametrize('orjson', [True, False])
+def test_json_keeps_non_finite_floats(monkeypatch, orjson):
+    if not orjson:
+        monkeypatch.setattr(serialization, 'orjson', None)
+    data = {'nan': float('nan'), 'inf': float('inf'), 'ninf': -float('inf'), 'none': None,
+            'list': [1.0, float('nan')], 'array': np.array([1.0, np.inf]), 'scalar': np.float32('nan')}
+    loaded = serialization.loads_json(serialization.dumps_json(data))
+    assert math.isnan(loaded['nan'])
+    assert loaded['inf'] == float('inf')
+    assert loaded['ninf'] == -float('inf')
+    assert loaded['none'] is None
+    assert loaded['list'][0] == 1.0 and math.isnan(loaded['list'][1])
+    assert loaded['array'] == [1.0, float('inf')]
+    assert math.isnan(loaded['scalar'])
+
+
+def test_json_without_non_finite_floats_keeps_null():
+    data = {'a': None, 'b': [1.5, None], 'c': np.arange(3)}
+    assert serialization.loads_json(serialization.dumps_json(data)) == {'a': None, 'b': [1.5, None], 'c': [0, 1, 2]}
+
+
+def test_to_json_roundtrip_with_nan(s3):
+    to_json('s3://{}/json'.format(BUCKET), 'data.json', {'values': [float('nan'), float('inf'), 1.0]})
+    values = read_json('s3://{}/json'.format(BUCKET), 'data.json')['values']
+    assert math.isnan(values[0]) and values[1:] == [float('inf'), 1.0]
@@ -0,0 +1,52 @@
+# Copyright (c) 2022 RWTH Aachen - Werkzeugmaschinenlabor (WZL)
+# Contact: Simon Cramer, s.cramer@wzl-mq.rwth-aachen.de
+
+import os
+import sys
+import json
+import subprocess
+import pytest
+from s3_smart_open import settings
+
+
+@pytest.fixture
+def config_file(tmp_path):
+    path = tmp_path / 'config.yaml'
+    path.write_text('S3_ENDPOINT: file.example.com\nAWS_ACCESS_KEY_ID: file-key\nAWS_SECRET_ACCESS_KEY: file-secret\n')
+    settings.reset_s3_settings()
+    settings.configure_s3(config_path=str(path))
+    yield path
+    settings.reset_s3_settings()
+
+
+@pytest.fixture
+def environment(monkeypatch):
+    monkeypatch.setenv('S3_ENDPOINT', 'env.example.com')
+    monkeypatch.setenv('AWS_ACCESS_KEY_ID', 'env-key')
+    monkeypatch.setenv('AWS_SECRET_ACCESS_KEY', 'env-secret')
+
+
+def test_import_does_not_load_heavy_dependencies():
+    code = ('import sys, json, s3_smart_open; '
+            'print(json.dumps([name for name in ("boto3", "botocore", "pandas", "pyarrow", "smart_open") if name in sys.modules]))')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, '-c', code], cwd=root, check=True, capture_output=True, text=True).stdout
+    assert json.loads(output) == []
+
+
+def test_configure_s3_overrides_config_file_and_environment(config_file, environment):
+    settings.configure_s3('explicit.example.com', 'explicit-key', 'explicit-secret')
+    assert settings.get_s3_settings() == ('explicit.example.com', 'explicit-key', 'explicit-secret', 'configure_s3')
+
+
+def test_config_file_overrides_environment(config_file, environment):
+    assert settings.get_s3_settings() == ('file.example.com', 'file-key', 'file-secret', str(config_file))
+
+
+def test_environment_is_used_without_config_file(config_file, environment, monkeypatch):
+    config_file.unlink()
+    settings.configure_s3(config_path=str(config_file))
+    assert settings.get_s3_settings() == ('env.example.com', 'env-key', 'env-secret', 'environment')
+    # The environment is read on every call
+    monkeypatch.setenv('S3_ENDPOINT', 'changed.example.com')
+    assert settings.get_s3_settings().endpoint == 'changed.example.com'
@@ -0,0 +1,135 @@
+# Copyright (c) 2022 RWTH Aachen - Werkzeugmaschinenlabor (WZL)
+# Contact: Simon Cramer, s.cramer@wzl-mq.rwth-aachen.de
+
+import io
+import os
+import tempfile
+import pytest
+from botocore.response import StreamingBody
+from s3_smart_open import transfer, resumable_upload, resumable_download, abort_resumable_upload
+from conftest import BUCKET
+
+PATH = 's3://{}/transfer/'.format(BUCKET)
+PART_SIZE = 5*1024*1024
+
+
+@pytest.fixture
+def state_directory(tmp_path, monkeypatch):
+    monkeypatch.setattr(tempfile, 'tempdir', str(tmp_path / 'temp'))
+    os.makedirs(tmp_path / 'temp')
+    monkeypatch.setitem(transfer._transfer_settings, 'multipart_threshold', 1024*1024)
+    return tmp_path / 'temp' / 's3_smart_open_transfers'
+
+
+@pytest.fixture
+def data(tmp_path):
+    content = os.urandom(2*PART_SIZE + 1234)
+    path = tmp_path / 'data.bin'
+    path.write_bytes(content)
+    return path
+
+
+def _states(directory):
+    return [name for name in os.listdir(directory) if name.endswith('.json')] if directory.exists() else []
+
+
+def _fail_part(s3, monkeypatch, name, failing):
+    """Makes a client method raise for the requests that failing(kwargs) selects"""
+    method = getattr(s3, name)
+    def _method(**kwargs):
+        if failing(kwargs):
+            raise ConnectionError('connection reset')
+        return method(**kwargs)
+    monkeypatch.setattr(s3, name, _method)
+
+
+def test_interrupted_upload_resumes(s3, state_directory, data, monkeypatch):
+    with monkeypatch.context() as patch:
+        _fail_part(s3, patch, 'upload_part', lambda kwargs: kwargs['PartNumber'] == 3)
+        with pytest.raises(ConnectionError):
+            resumable_upload(PATH, 'data.bin', str(data), part_size=PART_SIZE, max_attempts=1)
+    assert len(_states(state_directory)) == 1
+    summary = resumable_upload(PATH, 'data.bin', str(data), part_size=PART_SIZE)
+    assert (summary['parts'], summary['resumed'], summary['transferred']) == (3, 2*PART_SIZE, 1234)
+    assert s3.get_object(Bucket=BUCKET, Key='transfer/data.bin')['Body'].read() == data.read_bytes()
+    assert _states(state_directory) == []
+
+
+def test_interrupted_download_resumes(s3, state_directory, data, tmp_path, monkeypatch):
+    resumable_upload(PATH, 'data.bin', str(data), part_size=PART_SIZE)
+    target = tmp_path / 'target'
+    with monkeypatch.context() as patch:
+        _fail_part(s3, patch, 'get_object', lambda kwargs: kwargs['Range'].startswith('bytes={}-'.format(2*PART_SIZE)))
+        with pytest.raises(ConnectionError):
+            resumable_download(PATH, 'data.bin', str(target), max_workers=1, max_attempts=1)
+    assert (target / 'data.bin.part').exists() and len(_states(state_directory)) == 1
+    summary = resumable_download(PATH, 'data.bin', str(target))
+    assert (summary['parts'], summary['resumed'], summary['transferred'], summary['checksum']) == (3, 2*PART_SIZE, 1234, 'md5')
+    assert (target / 'data.bin').read_bytes() == data.read_bytes()
+    assert os.listdir(target) == ['data.bin']
+    assert _states(state_directory) == []
+
+
+def test_download_checksum_mismatch_raises(s3, state_directory, data, tmp_path, monkeypatch):
+    resumable_upload(PATH, 'data.bin', str(data), part_size=PART_SIZE)
+    get_object = s3.get_object
+    def _corrupted(**kwargs):
+        response = get_object(**kwargs)
+        body = bytearray(response['Body'].read())
+        body[0] ^= 0xff
+        response['Body'] = StreamingBody(io.BytesIO(bytes(body)), len(body))
+        return response
+    monkeypatch.setattr(s3, 'get_object', _corrupted)
+    target = tmp_path / 'target'
+    with pytest.raises(ValueError, match='Checksum mismatch'):
+        resumable_download(PATH, 'data.bin', str(target), max_attempts=1)
+    assert os.listdir(target) == []
+    assert _states(state_directory) == []
+
+
+def test_upload_checksum_mismatch_raises(s3, state_directory, data, monkeypatch):
+    upload_part = s3.upload_part
+    def _wrong_etag(**kwargs):
+        response = upload_part(**kwargs)
+        response['ETag'] = '"{}"'.format('0'*32)
+        return response
+    monkeypatch.setattr(s3, 'upload_part', _wrong_etag)
+    with pytest.raises(ValueError, match='Checksum mismatch for part'):
+        resumable_upload(PATH, 'data.bin', str(data), part_size=PART_SIZE, max_attempts=1)
+
+
+def test_reattach_by_upload_id_with_only_part_one(s3, state_directory, data):
+    upload_id = s3.create_multipart_upload(Bucket=BUCKET, Key='transfer/data.bin')['UploadId']
+    s3.upload_part(Bucket=BUCKET, Key='transfer/data.bin', UploadId=upload_id, PartNumber=1, Body=data.read_bytes()[:PART_SIZE])
+    # The default part size differs from the part size of the upload, which is taken from part 1
+    assert transfer._part_size(data.stat().st_size) != PART_SIZE
+    summary = resumable_upload(PATH, 'data.bin', str(data), upload_id=upload_id)
+    assert (summary['parts'], summary['resumed']) == (3, PART_SIZE)
+    assert s3.get_object(Bucket=BUCKET, Key='transfer/data.bin')['Body'].read() == data.read_bytes()
+    assert _states(state_directory) == []
+
+
+def test_state_with_other_part_size_uses_uploaded_part_size(s3, state_directory, data, monkeypatch):
+    with monkeypatch.context() as patch:
+        _fail_part(s3, patch, 'upload_part', lambda kwargs: kwargs['PartNumber'] == 2)
+        with pytest.raises(ConnectionError):
+            resumable_upload(PATH, 'data.bin', str(data), part_size=PART_SIZE, max_workers=1, max_attempts=1)
+    state_path = state_directory / _states(state_directory)[0]
+    state = transfer._load_state(str(state_path))
+    transfer._save_state(str(state_path), dict(state, part_size=2*PART_SIZE))
+    summary = resumable_upload(PATH, 'data.bin', str(data))
+    # Only the failed part 2 is sent again
+    assert (summary['parts'], summary['transferred']) == (3, PART_SIZE)
+    assert s3.get_object(Bucket=BUCKET, Key='transfer/data.bin')['Body'].read() == data.read_bytes()
+
+
+def test_abort_removes_state_and_parts(s3, state_directory, data, monkeypatch):
+    with monkeypatch.context() as patch:
+        _fail_part(s3, patch, 'upload_part', lambda kwargs: kwargs['PartNumber'] == 3)
+        with pytest.raises(ConnectionError):
+            resumable_upload(PATH, 'data.bin', str(data), part_size=PART_SIZE, max_attempts=1)
+    upload_id = abort_resumable_upload(PATH, 'data.bin', str(data))
+    assert upload_id is not None
+    assert _states(state_directory) == []
+    assert s3.list_multipart_uploads(Bucket=BUCKET).get('Uploads', []) == []
+    assert abort_resumable_upload(PATH, 'data.bin', str(data)) is None